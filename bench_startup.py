@@ -0,0 +1,73 @@
+"""Замер времени запуска окна.
+
+    python bench_startup.py            # 5 запусков, кэш энкодеров как есть
+    python bench_startup.py -n 10 --cold
+
+Каждый запуск — отдельный процесс `python vvc.py` с VVC_STARTUP_TRACE=1:
+окно открывается, доходит до готовности (энкодеры определены, Drag & Drop
+подключён) и закрывается само, не сохраняя конфигурацию. Печатаются медианы:
+    import       — от старта процесса до конца импорта vvc.py
+    first_window — до первой отрисовки главного окна
+    ready        — до готовности к работе
+--cold запускает каждый раз с пустым кэшем (зондирование ffmpeg заново).
+Нужен графический дисплей.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vvc.py")
+METRICS = ("import", "first_window", "ready")
+
+
+def run_once(cold=False, timeout=60):
+    """Один запуск; возвращает {метрика: секунды от старта процесса}."""
+    env = dict(os.environ, VVC_STARTUP_TRACE="1")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if cold:
+            env["XDG_CACHE_HOME"] = env["LOCALAPPDATA"] = cache_dir
+        started = time.time()
+        result = subprocess.run([sys.executable, APP], env=env, capture_output=True,
+                                text=True, timeout=timeout)
+    marks = None
+    for line in result.stdout.splitlines():
+        if line.startswith('{'):
+            marks = json.loads(line)
+    if result.returncode != 0 or marks is None:
+        raise RuntimeError(result.stderr.strip() or f"код возврата {result.returncode}")
+    return {
+        "import": marks["import_done"] - started,
+        "first_window": marks["first_window"] - started,
+        "ready": marks["ready"] - started,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер времени запуска FFmpeg Video Converter")
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--cold', action='store_true', help="пустой кэш при каждом запуске")
+    parser.add_argument('--json', action='store_true', help="вывод в JSON")
+    args = parser.parse_args(argv)
+
+    # Первый запуск прогревает файловый кэш ОС и __pycache__ — не учитывается
+    run_once(args.cold)
+    runs = [run_once(args.cold) for _ in range(args.runs)]
+    summary = {m: {"median_ms": round(statistics.median(r[m] for r in runs) * 1000, 1),
+                   "max_ms": round(max(r[m] for r in runs) * 1000, 1)}
+               for m in METRICS}
+    if args.json:
+        print(json.dumps({"runs": args.runs, "cold": args.cold, "metrics": summary}))
+    else:
+        print(f"Запусков: {args.runs}{' (холодный кэш)' if args.cold else ''}")
+        for m in METRICS:
+            print(f"  {m:<13} {summary[m]['median_ms']:8.1f} мс  (макс. {summary[m]['max_ms']:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
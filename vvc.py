@@ -1,19 +1,43 @@
+import sys
+import time
+
+# Момент начала импорта — для замера запуска (bench_startup.py)
+_IMPORT_STARTED = time.time()
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Аргументы командной строки — headless-режим без Tkinter/tkinterdnd2
+    from vvc_cli import main as cli_main
+    sys.exit(cli_main())
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import subprocess
 import os
 import threading
 import queue
 import shutil
-import sys
-from pathlib import Path
 import json
-import time
-import re
-from tkinterdnd2 import DND_FILES, TkinterDnD
-
-# Версия приложения
-VERSION = "v0.21"
+from pathlib import Path
+from vvc_core import (VERSION, CPU_MODES, ConfigManager, CodecManager, get_app_dir,
+                      resolve_ffmpeg_paths, timestamp_to_seconds, seconds_to_timestamp, trim_range,
+                      format_time, get_actual_video_codec, build_ffmpeg_command,
+                      build_concat_command, build_encode_commands, default_output_path,
+                      check_target_size, copy_streams, describe_copy, smart_cut_supported,
+                      video_filters, SCALERS, DEFAULT_SCALER, DEINTERLACE_FILTERS, PIXEL_FORMATS,
+                      TARGET_SIZE_TOLERANCE)
+from vvc_cpu import cpu_budget, describe_report
+from vvc_eta import EtaEstimator, format_eta, prior_rate
+from vvc_jobs import Job, JobQueue, run_ffmpeg, processes_cpu_time, progress_fraction
+from vvc_log import LogBuffer, level_visible
+from vvc_probe import (cached_encoders, discover_encoders, cached_media_info, get_media_info,
+                       media_duration, media_frames)
+from vvc_supervisor import supervisor
+
+# Не больше стольких строк лога вставляется в виджет за один тик process_queue
+LOG_LINES_PER_TICK = 1000
+
+# VVC_STARTUP_TRACE=1 — напечатать отметки времени запуска в stdout и выйти
+STARTUP_TRACE = bool(os.environ.get("VVC_STARTUP_TRACE"))
+_IMPORT_DONE = time.time()
 
 class ToolTip:
     """Всплывающая подсказка для виджетов"""
@@ -101,151 +125,6 @@ class ComboboxTooltip:
             pass
         self.hide_tooltip()
 
-class ConfigManager:
-    """Управление настройками приложения"""
-    def __init__(self, config_file="ffmpeg_converter_config.json"):
-        self.config_file = config_file
-        self.default_config = {
-            "use_local_ffmpeg": False,
-            "ffmpeg_path": "ffmpeg",
-            "hw_accel": "ЦП (Программное)",
-            "last_input_dir": "",
-            "last_output_dir": "",
-            "video_codec": "libvvenc",
-            "video_preset": "medium",
-            "video_bitrate": "384k",
-            "video_resolution": "1280x720",
-            "video_quality": "25",
-            "video_fps": "30",
-            "audio_codec": "libopus",
-            "audio_bitrate": "64k",
-            "use_crf": False,
-            "show_all_video_codecs": False,
-            "show_all_audio_codecs": False,
-            "enable_trim": False,
-            "trim_start": "00:00:00",
-            "trim_end": "00:00:00"
-        }
-
-    def load(self):
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                return {**self.default_config, **config}
-        except Exception as e:
-            print(f"Ошибка загрузки конфигурации: {e}")
-        return self.default_config.copy()
-
-    def save(self, config):
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Ошибка сохранения конфигурации: {e}")
-
-class CodecManager:
-    """Управление кодеками и их отображением"""
-    CODEC_DISPLAY_NAMES = {
-        "libvvenc": "H.266 (VVC/libvvenc)",
-        "libx265": "H.265 (HEVC/libx265)",
-        "librav1e": "AV1 (librav1e)",
-        "libvpx-vp9": "VP9 (libvpx-vp9)",
-        "libaom-av1": "AV1 (libaom-av1)",
-        "libopus": "Opus (libopus)",
-        "aac": "AAC",
-        "libvorbis": "Vorbis (libvorbis)",
-        "ac3": "AC3"
-    }
-
-    VIDEO_CODECS = ["libvvenc", "libx265", "librav1e", "libvpx-vp9", "libaom-av1"]
-    AUDIO_CODECS = ["libopus", "aac", "libvorbis", "ac3"]
-
-    # Карта соответствия программных кодеков аппаратным
-    HW_MAP = {
-        "NVIDIA (NVENC)": {
-            "libx264": "h264_nvenc",
-            "libx265": "hevc_nvenc",
-            "librav1e": "av1_nvenc",
-            "libaom-av1": "av1_nvenc"
-        },
-        "AMD (AMF)": {
-            "libx264": "h264_amf",
-            "libx265": "hevc_amf",
-            "librav1e": "av1_amf",
-            "libaom-av1": "av1_amf"
-        },
-        "Intel (QSV)": {
-            "libx264": "h264_qsv",
-            "libx265": "hevc_qsv",
-            "librav1e": "av1_qsv",
-            "libaom-av1": "av1_qsv",
-            "libvpx-vp9": "vp9_qsv"
-        }
-    }
-
-    @staticmethod
-    def get_display_name(codec):
-        return CodecManager.CODEC_DISPLAY_NAMES.get(codec, codec)
-
-    @staticmethod
-    def get_tech_name(display_name):
-        for tech, disp in CodecManager.CODEC_DISPLAY_NAMES.items():
-            if disp == display_name:
-                return tech
-        return display_name
-
-class FFmpegValidator:
-    """Валидация параметров FFmpeg"""
-    @staticmethod
-    def validate_file_path(path, must_exist=True):
-        if not path:
-            raise ValueError("Путь к файлу не указан")
-        if must_exist and not os.path.exists(path):
-            raise FileNotFoundError(f"Файл не найден: {path}")
-        return True
-
-    @staticmethod
-    def validate_bitrate(bitrate):
-        pattern = r'^\d+[kKmM]$'
-        if not re.match(pattern, bitrate):
-            raise ValueError(f"Неверный формат битрейта: {bitrate}. Используйте формат: 384k, 2M")
-        return True
-
-    @staticmethod
-    def validate_resolution(resolution):
-        pattern = r'^\d+x\d+$'
-        if not re.match(pattern, resolution):
-            raise ValueError(f"Неверный формат разрешения: {resolution}. Используйте формат: 1280x720")
-        return True
-
-    @staticmethod
-    def validate_fps(fps):
-        try:
-            fps_value = float(fps)
-            if fps_value <= 0 or fps_value > 300:
-                raise ValueError("FPS должен быть в диапазоне 1-300")
-            return True
-        except ValueError:
-            raise ValueError(f"Неверное значение FPS: {fps}")
-
-    @staticmethod
-    def validate_quality(quality):
-        try:
-            quality_value = int(quality)
-            if quality_value < 0 or quality_value > 51:
-                raise ValueError("Качество (CRF) должно быть в диапазоне 0-51")
-            return True
-        except ValueError:
-            raise ValueError(f"Неверное значение качества: {quality}")
-
-    @staticmethod
-    def validate_timestamp(timestamp):
-        pattern = r'^(\d{1,2}:)?(\d{1,2}:)?\d{1,2}(\.\d+)?$'
-        if not re.match(pattern, timestamp):
-            raise ValueError(f"Неверный формат времени: {timestamp}. Используйте формат: HH:MM:SS")
-        return True
-
 class FFmpegConverter:
     def __init__(self, root):
         self.root = root
@@ -253,12 +132,15 @@ class FFmpegConverter:
         self.root.geometry("900x850")
         self.root.minsize(800, 700)
         self.root.resizable(True, True)
+        self._startup_marks = {'import_start': _IMPORT_STARTED, 'import_done': _IMPORT_DONE}
 
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load()
 
         # Инициализация очереди для потокобезопасности GUI
         self.ui_queue = queue.Queue()
+        # Лог: кольцевой буфер, выводится в виджет пачкой раз в тик
+        self.log_buffer = LogBuffer(max_lines=self.config.get("log_max_lines", 5000))
         self.root.after(100, self.process_queue)
 
         self.setup_ffmpeg_paths()
@@ -272,6 +154,8 @@ class FFmpegConverter:
         self.all_audio_encoders = []
         self.video_encoder_descriptions = {}
         self.audio_encoder_descriptions = {}
+        # Номер последнего зондирования энкодеров — отбрасываем устаревшие ответы
+        self._encoder_probe_id = 0
 
         # Ссылки на активные ComboboxTooltip — уничтожаем перед повторным
         # созданием, иначе копятся дублирующиеся бинды (fix #4).
@@ -280,6 +164,34 @@ class FFmpegConverter:
 
         # Кэш эффективной длительности для расчёта прогресса (fix R5).
         self._effective_duration = 0.0
+        self._total_frames = 0
+        # Текущий проход двухпроходного кодирования — для общего прогресса
+        self._pass_index, self._pass_count = 0, 1
+        # Остановка до запуска процессов (поиск ключевых кадров): рабочий поток
+        # проверяет флаг перед запуском кодирования
+        self._stop_requested = False
+        # Активное кодирование фрагментами (режим "параллельные фрагменты")
+        self.chunked_encoder = None
+        # Активный подбор CRF (режим "Авто-CRF")
+        self.quality_search = None
+        # Активное кодирование сегментами (режим "С продолжением")
+        self.resumable_encoder = None
+        # Активный прогноз по образцам (vvc_forecast.Forecast) и последний
+        # результат: ((входной файл, команда), текст) — для предпросмотра команды
+        self.forecast = None
+        self._forecast_result = None
+        # История заданий (vvc_history.JobHistory) — создаётся после отрисовки окна
+        self.job_history = None
+        # Выгрузка метрик (vvc_metrics.Metrics), если задана в конфигурации
+        self.metrics = None
+        # Конвертация из окна в виде Job (история, метрики) и снимок CoreBudget.stats()
+        self._history_job = None
+        self._history_processes = []
+        self._history_win = None
+        # Оценка оставшегося времени конвертации из окна (vvc_eta.EtaEstimator)
+        self._eta = None
+        # Окно "Настройки FFmpeg" создаётся при первом открытии
+        self._ffmpeg_settings_win = None
 
         self.setup_styles()
 
@@ -300,22 +212,91 @@ class FFmpegConverter:
         self.original_resolution = ""
         self.video_quality = tk.StringVar(value=self.config.get("video_quality", "25"))
         self.video_fps = tk.StringVar(value=self.config.get("video_fps", "30"))
+        self.video_scaler = tk.StringVar(value=self.config.get("video_scaler", DEFAULT_SCALER))
+        self.video_crop = tk.StringVar(value=self.config.get("video_crop", ""))
+        self.deinterlace = tk.StringVar(value=self.config.get("deinterlace", ""))
+        self.pix_fmt = tk.StringVar(value=self.config.get("pix_fmt", ""))
+        self.filter_threads = tk.IntVar(value=self.config.get("filter_threads", 0))
         self.audio_codec = tk.StringVar(value=self.config.get("audio_codec", "libopus"))
         self.audio_bitrate = tk.StringVar(value=self.config.get("audio_bitrate", "64k"))
         self.use_crf = tk.BooleanVar(value=self.config.get("use_crf", False))
+        self.stream_copy = tk.BooleanVar(value=self.config.get("stream_copy", True))
+        self.use_target_size = tk.BooleanVar(value=self.config.get("use_target_size", False))
+        self.target_size = tk.StringVar(value=self.config.get("target_size", "50"))
+        self.auto_quality = tk.BooleanVar(value=self.config.get("auto_quality", False))
+        self.quality_metric = tk.StringVar(value=self.config.get("quality_metric", "ssim"))
+        self.quality_target = tk.StringVar(value=self.config.get("quality_target", "0.98"))
         
         self.show_all_video_codecs = tk.BooleanVar(value=self.config.get("show_all_video_codecs", False))
         self.show_all_audio_codecs = tk.BooleanVar(value=self.config.get("show_all_audio_codecs", False))
 
+        self.log_level = tk.StringVar(value=self.config.get("log_level", "info"))
+
         self.enable_trim = tk.BooleanVar(value=self.config.get("enable_trim", False))
         self.trim_start = tk.StringVar(value=self.config.get("trim_start", "00:00:00"))
         self.trim_end = tk.StringVar(value=self.config.get("trim_end", "00:00:00"))
+        self.smart_cut = tk.BooleanVar(value=self.config.get("smart_cut", False))
         self.video_duration = 0
+        # Сведения ffprobe о текущем входном файле (vvc_probe.get_media_info)
+        self.media_info = None
+        # Полоса миниатюр под обрезкой: построение (vvc_thumbs.ThumbnailStrip),
+        # индекс → (момент, tk.PhotoImage), ширина ячейки в пикселях
+        self.thumb_strip = None
+        self._thumbs = {}
+        self._thumb_slot = 0
+
+        self.parallel_chunks = tk.BooleanVar(value=self.config.get("parallel_chunks", False))
+        self.chunk_count = tk.IntVar(value=self.config.get("chunk_count", 4))
+        self.resumable = tk.BooleanVar(value=self.config.get("resumable", False))
+
+        # Очередь заданий: N рабочих потоков, у каждого свой процесс ffmpeg
+        self.max_workers = tk.IntVar(value=self.config.get("max_workers", 1))
+        # Папки наблюдения (vvc_watch.WatchService) — запускаются после отрисовки окна
+        self.watch_enabled = tk.BooleanVar(value=self.config.get("watch_enabled", False))
+        self.watch_service = None
+        self.job_queue = JobQueue(workers=self.max_workers.get(),
+                                  on_event=self.ui_queue.put,
+                                  probe_duration=self._get_video_duration,
+                                  probe_frames=self._get_frame_count)
 
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        # Drag & Drop и зондирование ffmpeg — после первой отрисовки окна
+        self.root.bind("<Map>", self._on_first_map, add="+")
+
+    def _on_first_map(self, event):
+        if event.widget is not self.root or 'first_window' in self._startup_marks:
+            return
+        self.root.update_idletasks()
+        self._mark_startup('first_window')
+        self.root.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        """Отложенная часть запуска: tkinterdnd2 и определение энкодеров."""
         self.setup_drag_drop()
         self.check_ffmpeg_and_codecs()
-        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        supervisor.configure(self.config)
+        from vvc_history import history_from_config
+        self.job_history = self.job_queue.history = history_from_config(self.config)
+        if self.config.get("farm_workers"):
+            from vvc_farm import farm_from_config
+            self.job_queue.farm = farm_from_config(self.config)
+        if self.config.get("metrics_textfile") or self.config.get("metrics_jsonl"):
+            from vvc_metrics import metrics_from_config
+            self.metrics = self.job_queue.metrics = metrics_from_config(self.config,
+                                                                        on_event=self.ui_queue.put)
+            self.metrics.start()
+        if self.watch_enabled.get():
+            self.toggle_watch()
+
+    def _mark_startup(self, name):
+        """Отметка этапа запуска; при VVC_STARTUP_TRACE по готовности — отчёт и выход."""
+        if name in self._startup_marks:
+            return
+        self._startup_marks[name] = time.time()
+        if name == 'ready' and STARTUP_TRACE:
+            print(json.dumps(self._startup_marks), flush=True)
+            self.root.after(0, self.root.destroy)
 
     def process_queue(self):
         """Чтение сообщений из очереди фонового потока для обновления UI (fix A6).
@@ -323,14 +304,39 @@ class FFmpegConverter:
         Оборачиваем тело в try/except Exception — если виджет уничтожен во время
         закрытия окна или возникла любая другая ошибка, мы всё равно перепланируем
         следующий вызов, иначе UI перестанет обновляться навсегда.
+
+        Сообщения прогресса за тик схлопываются: для общего прогресса и для
+        каждого задания очереди применяется только последнее значение.
         """
         try:
+            messages = []
+            last_progress = None
+            last_job_text = {}
+            last_queue_eta = None
             while True:
-                msg = self.ui_queue.get_nowait()
                 try:
-                    if msg['type'] == 'log':
-                        self._log_direct(msg['message'], msg['level'])
-                    elif msg['type'] == 'progress':
+                    msg = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if msg['type'] == 'log':
+                    self.log_buffer.append(msg['message'], msg['level'])
+                elif msg['type'] == 'progress':
+                    last_progress = msg
+                elif msg['type'] == 'job':
+                    last_job_text[msg['job'].id] = msg
+                elif msg['type'] == 'queue_eta':
+                    last_queue_eta = msg
+                else:
+                    messages.append(msg)
+            if last_progress is not None:
+                messages.append(last_progress)
+            messages.extend(last_job_text.values())
+            if last_queue_eta is not None:
+                messages.append(last_queue_eta)
+
+            for msg in messages:
+                try:
+                    if msg['type'] == 'progress':
                         self.progress_var.set(msg['value'])
                         self.progress_label.config(text=msg['text'])
                         if 'time' in msg:
@@ -338,12 +344,30 @@ class FFmpegConverter:
                     elif msg['type'] == 'status':
                         self.convert_button.config(state=msg['btn_convert'])
                         self.stop_button.config(state=msg['btn_stop'])
+                    elif msg['type'] == 'job':
+                        self._update_job_row(msg['job'], msg['text'])
+                    elif msg['type'] == 'queue_eta':
+                        self.queue_eta_label.config(
+                            text=f"Очередь: осталось {format_eta(msg['eta'])}" if msg['eta'] else "")
+                    elif msg['type'] == 'queue_done':
+                        self._on_queue_done(msg)
+                    elif msg['type'] == 'encoders':
+                        self._on_encoders_probed(msg)
+                    elif msg['type'] == 'media_info':
+                        self._on_media_probed(msg)
+                    elif msg['type'] == 'quality':
+                        self.video_quality.set(msg['value'])
+                    elif msg['type'] == 'file_info':
+                        self.update_file_info()
+                    elif msg['type'] == 'thumb':
+                        self._on_thumb(msg)
+                    elif msg['type'] == 'forecast':
+                        self._on_forecast(msg)
                 except Exception as e:
                     # Логируем в stderr — UI-виджет мог быть уже уничтожен
                     print(f"process_queue: ошибка обработки сообщения {msg.get('type')}: {e}",
                           file=sys.stderr)
-        except queue.Empty:
-            pass
+            self._flush_log()
         except Exception as e:
             # Неожиданная ошибка — логируем, но НЕ прерываем цикл опроса
             print(f"process_queue: непредвиденная ошибка: {e}", file=sys.stderr)
@@ -352,21 +376,8 @@ class FFmpegConverter:
 
     def setup_ffmpeg_paths(self):
         """Определение рабочих путей FFmpeg (Локальный vs Системный)"""
-        # Путь к локальной папке программы
-        if getattr(sys, 'frozen', False):
-            self.app_dir = os.path.dirname(sys.executable)
-        else:
-            self.app_dir = os.path.dirname(os.path.abspath(__file__))
-            
-        local_ffmpeg = os.path.join(self.app_dir, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
-        local_ffprobe = os.path.join(self.app_dir, 'ffprobe.exe' if os.name == 'nt' else 'ffprobe')
-
-        if self.config.get("use_local_ffmpeg", False) and os.path.exists(local_ffmpeg):
-            self.ffmpeg_path = local_ffmpeg
-            self.ffprobe_path = local_ffprobe
-        else:
-            self.ffmpeg_path = self.config.get("ffmpeg_path", "ffmpeg")
-            self.ffprobe_path = "ffprobe"
+        self.app_dir = get_app_dir()
+        self.ffmpeg_path, self.ffprobe_path = resolve_ffmpeg_paths(self.config, self.app_dir)
 
     def setup_styles(self):
         style = ttk.Style()
@@ -391,6 +402,16 @@ class FFmpegConverter:
         style.configure('Horizontal.TProgressbar', troughcolor=self.colors['light'], background=self.colors['primary'], thickness=10)
 
     def setup_drag_drop(self):
+        """Подключение tkdnd к уже созданному окну (импорт tkinterdnd2 отложен).
+
+        Без tkinterdnd2 приложение работает, файлы выбираются кнопкой "Обзор".
+        """
+        try:
+            from tkinterdnd2 import DND_FILES, TkinterDnD
+            getattr(TkinterDnD, 'require', TkinterDnD._require)(self.root)
+        except (ImportError, RuntimeError, tk.TclError) as e:
+            self.log(f"Drag & Drop недоступен: {e}", "warning")
+            return
         self.input_entry.drop_target_register(DND_FILES)
         self.input_entry.dnd_bind('<<Drop>>', self.on_input_drop)
         self.output_entry.drop_target_register(DND_FILES)
@@ -398,6 +419,10 @@ class FFmpegConverter:
 
     def on_input_drop(self, event):
         files = self.parse_drop_files(event.data)
+        if len(files) > 1:
+            # Несколько файлов — каждый становится заданием очереди
+            self.enqueue_files(files)
+            return
         if files:
             file_path = files[0]
             self.input_file.set(file_path)
@@ -451,6 +476,7 @@ class FFmpegConverter:
         button_container = ttk.Frame(header_frame, style='TFrame')
         button_container.pack(side=tk.RIGHT)
         ttk.Button(button_container, text="Настройки FFmpeg", command=self.show_ffmpeg_settings, style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(button_container, text="История", command=self.show_history, style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
         ttk.Button(button_container, text="Инфо о FFmpeg", command=self.show_ffmpeg_info, style='Secondary.TButton').pack(side=tk.LEFT)
 
         content_frame = ttk.Frame(main_container, style='Card.TFrame')
@@ -464,6 +490,7 @@ class FFmpegConverter:
 
         self.create_video_section(params_frame)
         self.create_audio_section(params_frame)
+        self.create_queue_section(content_frame)
         self.create_progress_section(content_frame)
         self.create_info_section(content_frame)
 
@@ -511,10 +538,81 @@ class FFmpegConverter:
         self.duration_label = ttk.Label(end_frame, text="", foreground=self.colors['secondary'])
         self.duration_label.pack(side=tk.LEFT, padx=(8, 0))
 
+        smart_checkbox = ttk.Checkbutton(frame, text="Умная обрезка", variable=self.smart_cut)
+        smart_checkbox.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=(4, 0))
+        ToolTip(smart_checkbox, "Если исходник уже в выбранном кодеке, перекодируются только\n"
+                                "неполные GOP у точек разреза, а середина между ключевыми\n"
+                                "кадрами копируется без перекодирования. Разрез остаётся\n"
+                                "точным до кадра, а обрезка длинных записей — почти мгновенной.")
+
+        # Полоса миниатюр: заполняется в фоне после зондирования файла
+        self.thumb_canvas = tk.Canvas(frame, height=0, highlightthickness=0, bg=self.colors['background'])
+        self.thumb_canvas.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(8, 0))
+        self.thumb_canvas.bind("<Button-1>", lambda e: self._on_thumb_click(e, self.trim_start))
+        self.thumb_canvas.bind("<Button-3>", lambda e: self._on_thumb_click(e, self.trim_end))
+        ToolTip(self.thumb_canvas, "Ключевые кадры по всей длительности.\n"
+                                   "Левый щелчок — начало обрезки, правый — конец.")
+
         if not self.enable_trim.get():
             self.trim_start_entry.config(state='disabled')
             self.trim_end_entry.config(state='disabled')
 
+    def _reset_thumbnails(self):
+        """Очистка полосы и отмена построения (смена входного файла)."""
+        if self.thumb_strip is not None:
+            self.thumb_strip.stop()
+            self.thumb_strip = None
+        self._thumbs = {}
+        self.thumb_canvas.delete("all")
+        self.thumb_canvas.config(height=0)
+
+    def _load_thumbnails(self, filepath, info):
+        """Полоса миниатюр файла: из кэша сразу, иначе — построение в фоне."""
+        from vvc_thumbs import THUMB_HEIGHT, ThumbnailStrip, cached_strip
+        self._reset_thumbnails()
+        video = info.get('video')
+        if not (info['duration'] and video and video['width'] and video['height']):
+            return
+        self._thumb_slot = max(16, round(THUMB_HEIGHT * video['width'] / video['height'])) + 2
+        self.thumb_canvas.config(height=THUMB_HEIGHT + 14)
+        cached = cached_strip(filepath)
+        if cached is not None:
+            for index, (seconds, path) in enumerate(cached):
+                self._on_thumb({'path': filepath, 'index': index, 'time': seconds, 'file': path})
+            return
+
+        def on_thumb(index, seconds, path):
+            self.ui_queue.put({'type': 'thumb', 'path': filepath, 'index': index,
+                               'time': seconds, 'file': path})
+
+        self.thumb_strip = ThumbnailStrip(self.ffmpeg_path, filepath, info['duration'], on_thumb)
+        self.thumb_strip.start()
+
+    def _on_thumb(self, msg):
+        if msg['path'] != self.input_file.get():
+            return  # Входной файл успели сменить
+        try:
+            image = tk.PhotoImage(file=msg['file'])
+        except tk.TclError:
+            return  # Tk без поддержки PNG или повреждённый файл кэша
+        index, x = msg['index'], msg['index'] * self._thumb_slot
+        self._thumbs[index] = (msg['time'], image)
+        self.thumb_canvas.create_image(x, 0, image=image, anchor=tk.NW)
+        self.thumb_canvas.create_text(x, image.height() + 1, text=format_time(msg['time']), anchor=tk.NW,
+                                      font=('Segoe UI', 7), fill=self.colors['dark'])
+
+    def _on_thumb_click(self, event, variable):
+        """Момент миниатюры под курсором → начало или конец обрезки."""
+        if not self._thumb_slot:
+            return
+        thumb = self._thumbs.get(int(event.x // self._thumb_slot))
+        if thumb is None:
+            return
+        if not self.enable_trim.get():
+            self.enable_trim.set(True)
+            self.toggle_trim_controls()
+        variable.set(seconds_to_timestamp(thumb[0]))
+
     def toggle_trim_controls(self):
         state = 'normal' if self.enable_trim.get() else 'disabled'
         self.trim_start_entry.config(state=state)
@@ -569,6 +667,33 @@ class FFmpegConverter:
         self.bitrate_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
         row += 1
 
+        # Размер файла (двухпроходное кодирование)
+        ttk.Label(frame, text="Размер:").grid(row=row, column=0, sticky=tk.W, pady=4)
+        size_frame = ttk.Frame(frame)
+        size_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
+        size_checkbox = ttk.Checkbutton(size_frame, text="Цель, МБ", variable=self.use_target_size)
+        size_checkbox.pack(side=tk.LEFT)
+        ttk.Entry(size_frame, textvariable=self.target_size, width=8).pack(side=tk.LEFT, padx=(8, 0))
+        ToolTip(size_checkbox, "Битрейт видео рассчитывается по длительности (с учётом обрезки)\n"
+                               "и битрейту звука, затем выполняется двухпроходное кодирование.\n"
+                               "Имеет приоритет над CRF; параллельные фрагменты не используются.")
+        row += 1
+
+        # Автоподбор CRF
+        ttk.Label(frame, text="Авто-CRF:").grid(row=row, column=0, sticky=tk.W, pady=4)
+        auto_frame = ttk.Frame(frame)
+        auto_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
+        auto_checkbox = ttk.Checkbutton(auto_frame, text="Цель", variable=self.auto_quality)
+        auto_checkbox.pack(side=tk.LEFT)
+        ttk.Combobox(auto_frame, textvariable=self.quality_metric, values=["ssim", "psnr"],
+                     state="readonly", width=6).pack(side=tk.LEFT, padx=(8, 4))
+        ttk.Entry(auto_frame, textvariable=self.quality_target, width=8).pack(side=tk.LEFT)
+        ToolTip(auto_checkbox, "Перед кодированием несколько коротких фрагментов кодируются\n"
+                               "параллельно с разными CRF и сравниваются с исходником.\n"
+                               "Выбирается наибольший CRF, при котором SSIM/PSNR не ниже цели\n"
+                               "(например, SSIM 0.98 или PSNR 40). Работает в режиме CRF.")
+        row += 1
+
         # Разрешение
         ttk.Label(frame, text="Разрешение:").grid(row=row, column=0, sticky=tk.W, pady=4)
         resolution_frame = ttk.Frame(frame)
@@ -584,6 +709,54 @@ class FFmpegConverter:
         # FPS
         ttk.Label(frame, text="FPS:").grid(row=row, column=0, sticky=tk.W, pady=4)
         ttk.Entry(frame, textvariable=self.video_fps, width=10).grid(row=row, column=1, sticky=tk.W, padx=(8, 0), pady=4)
+        row += 1
+
+        # Фильтры: масштабирование, деинтерлейс, пиксельный формат
+        ttk.Label(frame, text="Фильтры:").grid(row=row, column=0, sticky=tk.W, pady=4)
+        filters_frame = ttk.Frame(frame)
+        filters_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
+        scaler_combobox = ttk.Combobox(filters_frame, textvariable=self.video_scaler, values=list(SCALERS),
+                                       state="readonly", width=13)
+        scaler_combobox.pack(side=tk.LEFT)
+        ttk.Combobox(filters_frame, textvariable=self.deinterlace, values=list(DEINTERLACE_FILTERS),
+                     state="readonly", width=6).pack(side=tk.LEFT, padx=(4, 0))
+        ttk.Combobox(filters_frame, textvariable=self.pix_fmt, values=list(PIXEL_FORMATS),
+                     state="readonly", width=12).pack(side=tk.LEFT, padx=(4, 0))
+        ToolTip(scaler_combobox, "Алгоритм масштабирования, деинтерлейс и пиксельный формат.\n"
+                                 "fast_bilinear — быстро для черновиков, lanczos — мастер-копии.\n"
+                                 "yuv420p10le — 10 бит для VVC. Пустое значение — без изменений.\n"
+                                 "Кадрирование, масштаб и формат собираются в один граф -vf.")
+        row += 1
+
+        # Кадрирование и потоки фильтров
+        ttk.Label(frame, text="Кадрирование:").grid(row=row, column=0, sticky=tk.W, pady=4)
+        crop_frame = ttk.Frame(frame)
+        crop_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
+        crop_entry = ttk.Entry(crop_frame, textvariable=self.video_crop, width=16)
+        crop_entry.pack(side=tk.LEFT)
+        ttk.Label(crop_frame, text="Потоки:").pack(side=tk.LEFT, padx=(8, 4))
+        ttk.Spinbox(crop_frame, from_=0, to=max(1, os.cpu_count() or 1), width=4,
+                    textvariable=self.filter_threads).pack(side=tk.LEFT)
+        ToolTip(crop_entry, "ширина:высота[:x:y] исходного кадра, например 1920:800:0:140.\n"
+                            "Потоки — число потоков графа фильтров (-filter_threads), 0 — авто.")
+        row += 1
+
+        # Параллельные фрагменты
+        ttk.Label(frame, text="Фрагменты:").grid(row=row, column=0, sticky=tk.W, pady=4)
+        chunks_frame = ttk.Frame(frame)
+        chunks_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
+        chunks_checkbox = ttk.Checkbutton(chunks_frame, text="Параллельно", variable=self.parallel_chunks)
+        chunks_checkbox.pack(side=tk.LEFT)
+        ttk.Spinbox(chunks_frame, from_=2, to=max(2, os.cpu_count() or 2), width=4, textvariable=self.chunk_count).pack(side=tk.LEFT, padx=(8, 0))
+        ToolTip(chunks_checkbox, "Файл делится по ключевым кадрам на N частей, которые кодируются\n"
+                                 "одновременно отдельными процессами ffmpeg и склеиваются без\n"
+                                 "перекодирования. libvvenc плохо масштабируется по потокам —\n"
+                                 "так загружаются все ядра.")
+        resume_checkbox = ttk.Checkbutton(chunks_frame, text="С продолжением", variable=self.resumable)
+        resume_checkbox.pack(side=tk.LEFT, padx=(8, 0))
+        ToolTip(resume_checkbox, "Кодирование сегментами по 2 минуты в папку <результат>.parts.\n"
+                                 "После остановки или сбоя повторный запуск с теми же настройками\n"
+                                 "продолжит с первого незавершённого сегмента.")
 
         self.toggle_encoding_mode()
 
@@ -604,15 +777,27 @@ class FFmpegConverter:
         ttk.Label(frame, text="Битрейт:").grid(row=1, column=0, sticky=tk.W, pady=4)
         ttk.Entry(frame, textvariable=self.audio_bitrate).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(8, 0), pady=4)
 
-        ttk.Separator(frame, orient='horizontal').grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(12, 8))
+        copy_checkbox = ttk.Checkbutton(frame, text="Копировать совпадающие потоки", variable=self.stream_copy,
+                                        command=self.update_file_info)
+        copy_checkbox.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=4)
+        ToolTip(copy_checkbox, "Звук в том же кодеке и не выше целевого битрейта копируется как есть (-c:a copy).\n"
+                               "Видео копируется, если кодек совпадает, разрешение/FPS не меняются,\n"
+                               "нет обрезки и исходный битрейт не выше заданного (ремукс на скорости диска).")
+
+        ttk.Separator(frame, orient='horizontal').grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(12, 8))
 
         buttons_container = ttk.Frame(frame, style='TFrame')
-        buttons_container.grid(row=3, column=0, columnspan=2, pady=(4, 0))
+        buttons_container.grid(row=4, column=0, columnspan=2, pady=(4, 0))
         self.convert_button = ttk.Button(buttons_container, text="Начать конвертацию", command=self.start_conversion, style='Modern.TButton', width=18)
         self.convert_button.grid(row=0, column=0, padx=(0, 4))
         self.stop_button = ttk.Button(buttons_container, text="Остановить", command=self.stop_conversion, state='disabled', style='Secondary.TButton', width=13)
         self.stop_button.grid(row=0, column=1, padx=(4, 4))
-        ttk.Button(buttons_container, text="Предпросмотр команды", command=self.preview_command, style='Secondary.TButton', width=18).grid(row=0, column=2, padx=(4, 0))
+        ttk.Button(buttons_container, text="Предпросмотр команды", command=self.preview_command, style='Secondary.TButton', width=18).grid(row=0, column=2, padx=(4, 4))
+        forecast_button = ttk.Button(buttons_container, text="Прогноз", command=self.start_forecast, style='Secondary.TButton', width=10)
+        forecast_button.grid(row=0, column=3, padx=(4, 0))
+        ToolTip(forecast_button, "Несколько коротких фрагментов кодируются параллельно с текущими\n"
+                                 "настройками; по ним оцениваются размер результата, средний\n"
+                                 "битрейт и время полной конвертации.")
 
     def _filter_codecs(self, codec_type):
         """Единый метод фильтрации для видео и аудио кодеков (DRY)"""
@@ -690,6 +875,243 @@ class FFmpegConverter:
             if mode == "Исходное": self.video_resolution.set(self.original_resolution or "1280x720")
             elif "HD" in mode: self.video_resolution.set(mode.split('(')[1].strip(')'))
 
+    def create_queue_section(self, parent):
+        frame = ttk.LabelFrame(parent, text="Очередь заданий", padding="12")
+        frame.pack(fill=tk.X, pady=(0, 10))
+        frame.columnconfigure(0, weight=1)
+
+        columns = ("file", "status", "progress")
+        self.queue_tree = ttk.Treeview(frame, columns=columns, show="headings", height=4, selectmode="extended")
+        self.queue_tree.heading("file", text="Файл")
+        self.queue_tree.heading("status", text="Статус")
+        self.queue_tree.heading("progress", text="Прогресс")
+        self.queue_tree.column("file", width=420, anchor=tk.W)
+        self.queue_tree.column("status", width=110, anchor=tk.W)
+        self.queue_tree.column("progress", width=110, anchor=tk.W)
+        self.queue_tree.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.queue_tree.yview)
+        self.queue_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+
+        buttons = ttk.Frame(frame, style='TFrame')
+        buttons.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(8, 0))
+        ttk.Button(buttons, text="Добавить", command=self.enqueue_current, style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(buttons, text="Удалить", command=self.remove_selected_jobs, style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(buttons, text="▲", width=3, command=lambda: self.move_selected_jobs(-1), style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(buttons, text="▼", width=3, command=lambda: self.move_selected_jobs(1), style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(buttons, text="Повторить", command=self.requeue_selected_jobs, style='Secondary.TButton').pack(side=tk.LEFT, padx=(0, 4))
+
+        self.queue_stop_button = ttk.Button(buttons, text="Стоп", command=self.stop_queue, state='disabled', style='Secondary.TButton')
+        self.queue_stop_button.pack(side=tk.RIGHT)
+        self.queue_start_button = ttk.Button(buttons, text="Запустить очередь", command=self.start_queue, style='Modern.TButton')
+        self.queue_start_button.pack(side=tk.RIGHT, padx=(0, 4))
+        workers_spinbox = ttk.Spinbox(buttons, from_=1, to=max(1, os.cpu_count() or 1), width=4,
+                                      textvariable=self.max_workers, command=self.on_workers_change)
+        workers_spinbox.pack(side=tk.RIGHT, padx=(0, 8))
+        workers_spinbox.bind("<FocusOut>", lambda e: self.on_workers_change())
+        ttk.Label(buttons, text="Потоков:").pack(side=tk.RIGHT, padx=(0, 4))
+        ToolTip(workers_spinbox, "Сколько файлов кодируется одновременно.\nКаждое задание запускает отдельный процесс ffmpeg.")
+
+        watch_checkbox = ttk.Checkbutton(buttons, text="Наблюдение", variable=self.watch_enabled,
+                                         command=self.toggle_watch)
+        watch_checkbox.pack(side=tk.LEFT, padx=(8, 4))
+        ToolTip(watch_checkbox, "Новые файлы в папках наблюдения ставятся в очередь, когда\n"
+                                "они дописаны (размер не меняется несколько секунд).\n"
+                                "Результаты — в <папка>/converted, исходники после кодирования —\n"
+                                "в done или failed. Без окна: python vvc_watch.py")
+        ttk.Button(buttons, text="Папка…", command=self.add_watch_folder, style='Secondary.TButton').pack(side=tk.LEFT)
+
+        # Оставшееся время всей очереди (JobQueue.batch_eta)
+        self.queue_eta_label = ttk.Label(frame, text="")
+        self.queue_eta_label.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(6, 0))
+
+    def enqueue_files(self, files):
+        """Добавление файлов в очередь с текущими настройками (снимок команды)."""
+        added = 0
+        settings = self.collect_settings()
+        self._warn_hw_codec(settings)
+        trim_duration = self._trim_duration()
+        unprobed = []
+        for file_path in files:
+            if os.path.isdir(file_path):
+                continue
+            # Без ffprobe в Tk-потоке: сведения только из кэша, если есть.
+            # Режиму «Размер файла» длительность нужна сразу — такие файлы
+            # проверяются и ставятся в очередь в фоновом потоке.
+            source = cached_media_info(file_path)
+            if source is None and settings["use_target_size"]:
+                unprobed.append(file_path)
+                continue
+            if self._enqueue_file(settings, file_path, source, trim_duration):
+                added += 1
+        if added:
+            self.log(f"Добавлено в очередь: {added}", "success")
+        if unprobed:
+            threading.Thread(target=self._enqueue_probed, args=(settings, unprobed, trim_duration),
+                             name="queue-probe", daemon=True).start()
+
+    def _enqueue_probed(self, settings, files, trim_duration):
+        """Фоновый поток enqueue_files: ffprobe и задания для файлов без сведений в кэше."""
+        added = 0
+        for file_path in files:
+            try:
+                source = get_media_info(self.ffprobe_path, file_path)
+            except Exception as e:
+                self.log(f"{file_path}: {e}", "error")
+                continue
+            if self._enqueue_file(settings, file_path, source, trim_duration):
+                added += 1
+        if added:
+            self.log(f"Добавлено в очередь после проверки файлов: {added}", "success")
+
+    def _enqueue_file(self, settings, file_path, source, trim_duration):
+        """Задание для файла рядом с исходником; False — ошибка (в лог)."""
+        try:
+            job = self._build_job(settings, file_path, default_output_path(file_path), source,
+                                  trim_duration)
+        except Exception as e:
+            self.log(f"{file_path}: {e}", "error")
+            return False
+        self.job_queue.add(job)
+        return True
+
+    def enqueue_current(self):
+        """Добавление текущего входного/выходного файла в очередь."""
+        try:
+            job = self._make_job(self.collect_settings(), self.input_file.get(),
+                                 self.output_file.get(), self.media_info)
+        except Exception as e:
+            self.log(f"Ошибка: {e}", "error")
+            return
+        self.job_queue.add(job)
+        self.log(f"Добавлено в очередь: {job.name}", "success")
+
+    def _make_job(self, settings, input_file, output_file, source):
+        """Задание очереди: одна команда или два прохода (режим «Размер файла»)."""
+        self._warn_hw_codec(settings)
+        return self._build_job(settings, input_file, output_file, source, self._trim_duration())
+
+    def _build_job(self, settings, input_file, output_file, source, trim_duration):
+        """_make_job без обращения к виджетам (можно вызывать из фонового потока)."""
+        cmds, work_dir = build_encode_commands(settings, self.ffmpeg_path, input_file, output_file,
+                                               source=source)
+        job = Job(input_file, output_file, cmds[-1], duration=trim_duration,
+                  passes=cmds, work_dir=work_dir)
+        if settings["resumable"]:
+            # Модуль нужен только в режиме "С продолжением" — не грузим его при запуске
+            from vvc_resume import resumable_for
+            job.resumable = resumable_for(settings, self.ffmpeg_path, input_file, output_file,
+                                          source, on_event=self.ui_queue.put)
+        if settings["use_target_size"]:
+            job.target_size = settings["target_size"]
+        return job
+
+    def _trim_duration(self):
+        """Длительность фрагмента, если включена обрезка; иначе None (ffprobe в рабочем потоке)."""
+        if self.enable_trim.get():
+            start_s = timestamp_to_seconds(self.trim_start.get())
+            end_s = timestamp_to_seconds(self.trim_end.get())
+            if end_s > start_s:
+                return end_s - start_s
+        return None
+
+    def _selected_job_ids(self):
+        return [int(item) for item in self.queue_tree.selection()]
+
+    def remove_selected_jobs(self):
+        for job_id in self._selected_job_ids():
+            if self.job_queue.remove(job_id):
+                self.queue_tree.delete(str(job_id))
+            else:
+                self.log("Выполняющееся задание нельзя удалить", "warning")
+
+    def move_selected_jobs(self, delta):
+        job_ids = self._selected_job_ids()
+        # При сдвиге вниз двигаем с конца, чтобы выделенные не менялись местами
+        for job_id in (reversed(job_ids) if delta > 0 else job_ids):
+            index = self.job_queue.move(job_id, delta)
+            if index is not None:
+                self.queue_tree.move(str(job_id), '', index)
+
+    def requeue_selected_jobs(self):
+        for job_id in self._selected_job_ids():
+            self.job_queue.requeue(job_id)
+
+    def on_workers_change(self):
+        try:
+            self.job_queue.set_workers(self.max_workers.get())
+        except (tk.TclError, ValueError):
+            self.max_workers.set(self.job_queue.max_workers)
+
+    def start_queue(self):
+        if not any(j.status == Job.QUEUED for j in self.job_queue.jobs()):
+            self.log("В очереди нет заданий", "warning")
+            return
+        self.on_workers_change()
+        self.queue_start_button.config(state='disabled')
+        self.queue_stop_button.config(state='normal')
+        self.log(f"Запуск очереди: потоков {self.job_queue.max_workers}")
+        self.job_queue.start()
+
+    def toggle_watch(self):
+        """Запуск/остановка наблюдения за папками из конфигурации (watch_folders)."""
+        if self.watch_service:
+            self.watch_service.stop(wait=False)
+            self.watch_service = None
+            if not self.watch_enabled.get():
+                self.log("Наблюдение за папками остановлено", "info")
+        if not self.watch_enabled.get():
+            return
+        from vvc_watch import WatchService
+        try:
+            self.watch_service = WatchService(self.config, self.ffmpeg_path, self.ffprobe_path,
+                                              self.job_queue, on_event=self.ui_queue.put)
+            self.watch_service.start()
+        except Exception as e:
+            self.watch_service = None
+            self.watch_enabled.set(False)
+            self.log(f"Наблюдение за папками: {e}", "error")
+
+    def add_watch_folder(self):
+        """Новая папка наблюдения с текущими настройками окна в качестве профиля."""
+        from vvc_watch import profile_from_settings
+        folder = filedialog.askdirectory(title="Папка наблюдения")
+        if not folder:
+            return
+        folders = [f for f in self.config.get("watch_folders", [])
+                   if os.path.abspath(f["path"]) != os.path.abspath(folder)]
+        folders.append({"path": folder, "profile": profile_from_settings(self.collect_settings())})
+        self.config["watch_folders"] = folders
+        self.config_manager.save(self.config)
+        self.log(f"Папка наблюдения: {folder} (профиль — текущие настройки)", "success")
+        if self.watch_enabled.get():
+            self.toggle_watch()
+
+    def stop_queue(self):
+        # terminate/wait может занять время — не блокируем Tk-поток
+        threading.Thread(target=self.job_queue.stop, daemon=True).start()
+        self.log("Остановка очереди...", "warning")
+
+    def _update_job_row(self, job, text):
+        item = str(job.id)
+        values = (job.name, job.status_name, text if job.status == Job.RUNNING else f"{job.progress:.0f}%")
+        if self.queue_tree.exists(item):
+            self.queue_tree.item(item, values=values)
+        else:
+            self.queue_tree.insert('', tk.END, iid=item, values=values)
+
+    def _on_queue_done(self, msg):
+        self.queue_eta_label.config(text="")
+        self.queue_start_button.config(state='normal')
+        self.queue_stop_button.config(state='disabled')
+        jobs = self.job_queue.jobs()
+        done = sum(1 for j in jobs if j.status == Job.DONE)
+        failed = sum(1 for j in jobs if j.status == Job.FAILED)
+        self.log(f"Очередь завершена: успешно {done}, с ошибкой {failed}",
+                 "success" if not failed else "warning")
+        if msg.get('cpu'):
+            self.log(f"Использование процессора: {describe_report(msg['cpu'])}")
+
     def create_progress_section(self, parent):
         frame = ttk.LabelFrame(parent, text="Прогресс и логи", padding="12")
         frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
@@ -735,6 +1157,10 @@ class FFmpegConverter:
         self.saving_label = ttk.Label(frame, text="0%")
         self.saving_label.grid(row=2, column=1, sticky=tk.W, padx=(8, 0), pady=2)
 
+        ttk.Label(frame, text="Без перекодирования:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.copy_info_label = ttk.Label(frame, text="—")
+        self.copy_info_label.grid(row=3, column=1, sticky=tk.W, padx=(8, 0), pady=2)
+
     def create_context_menu(self):
         """Контекстное меню лога (fix R14).
 
@@ -745,7 +1171,15 @@ class FFmpegConverter:
         self.context_menu = tk.Menu(self.log_text, tearoff=0, font=('Segoe UI', 9))
         self.context_menu.add_command(label="Копировать", command=self._copy_log_selection)
         self.context_menu.add_command(label="Выделить всё", command=self._select_all_log)
-        self.context_menu.add_command(label="Очистить", command=lambda: self.log_text.delete('1.0', tk.END))
+        self.context_menu.add_command(label="Очистить", command=self._clear_log)
+        self.context_menu.add_separator()
+        level_menu = tk.Menu(self.context_menu, tearoff=0, font=('Segoe UI', 9))
+        for label, level in (("Все сообщения", "info"), ("Предупреждения и ошибки", "warning"),
+                             ("Только ошибки", "error")):
+            level_menu.add_radiobutton(label=label, value=level, variable=self.log_level,
+                                       command=self._rerender_log)
+        self.context_menu.add_cascade(label="Показывать", menu=level_menu)
+        self.context_menu.add_command(label="Статистика лога", command=self.show_log_stats)
         self.log_text.bind("<Button-3>", lambda e: self.context_menu.tk_popup(e.x_root, e.y_root))
         # Горячие клавиши
         self.log_text.bind("<Control-a>", lambda e: self._select_all_log())
@@ -791,50 +1225,128 @@ class FFmpegConverter:
     def update_file_info(self):
         if self.input_file.get() and os.path.exists(self.input_file.get()):
             size = os.path.getsize(self.input_file.get())
-            self.input_info_label.config(text=f"{size / (1024*1024):.1f} МБ")
+            text = f"{size / (1024*1024):.1f} МБ"
+            video = (self.media_info or {}).get('video')
+            if video:
+                text += f" • {video['codec']} {video['width']}x{video['height']}"
+                if video['fps']:
+                    text += f" @ {video['fps']:g}"
+            if self.media_info and self.media_info['audio']:
+                text += f" • {self.media_info['audio'][0]['codec']}"
+            self.input_info_label.config(text=text)
+            self.copy_info_label.config(text=describe_copy(self._copied_streams()))
         if self.output_file.get() and os.path.exists(self.output_file.get()):
             size = os.path.getsize(self.output_file.get())
             self.output_info_label.config(text=f"{size / (1024*1024):.1f} МБ")
+            if self.input_file.get() and os.path.exists(self.input_file.get()):
+                input_size = os.path.getsize(self.input_file.get())
+                if input_size and size:
+                    self.saving_label.config(text=f"{(1 - size / input_size) * 100:.1f}% "
+                                                  f"(сжатие {input_size / size:.1f}:1)")
+
+    def _copied_streams(self, settings=None):
+        """Потоки текущего файла, которые будут скопированы без перекодирования."""
+        settings = settings or self.collect_settings()
+        output = self.output_file.get() or default_output_path(self.input_file.get())
+        try:
+            return copy_streams(settings, self.media_info, output, trim_range(settings) is not None)
+        except ValueError:
+            return set()
 
     def auto_detect_video_params(self, filepath):
+        """Зондирование входного файла одним вызовом ffprobe в фоновом потоке.
+
+        Результат (кодек, разрешение, fps, длительность, число кадров)
+        кэшируется на диске по (путь, размер, mtime) и приходит в ui_queue.
+        """
         self.log(f"Добавлен файл: {filepath}", "info")
+        self.media_info = None
+        self._reset_thumbnails()
+        ffprobe_path = self.ffprobe_path
+
+        def worker():
+            self.ui_queue.put({'type': 'media_info', 'path': filepath,
+                               'info': get_media_info(ffprobe_path, filepath)})
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_media_probed(self, msg):
+        if msg['path'] != self.input_file.get():
+            return  # Входной файл успели сменить
+        info = msg['info']
+        if info is None:
+            self.log("Не удалось прочитать параметры видео через ffprobe", "warning")
+            return
+        self.media_info = info
+        self.video_duration = info['duration']
+        if self.video_duration:
+            self.duration_label.config(text=f"Длительность: {seconds_to_timestamp(self.video_duration)}")
+        video = info['video']
+        if video and video['width'] and video['height']:
+            self.original_resolution = f"{video['width']}x{video['height']}"
+            if self.resolution_mode.get() == "Исходное":
+                self.video_resolution.set(self.original_resolution)
+        self.update_file_info()
+        self._load_thumbnails(msg['path'], info)
 
     def check_ffmpeg_and_codecs(self):
-        try:
-            result = subprocess.run([self.ffmpeg_path, '-version'], capture_output=True, text=True, errors='replace')
-            if result.returncode == 0:
-                self.ffmpeg_version_info = result.stdout.split('\n')[0]
-                self.log(f"FFmpeg найден: {self.ffmpeg_version_info}", "success")
-                
-                res = subprocess.run([self.ffmpeg_path, '-encoders'], capture_output=True, text=True, errors='replace')
-                self.supported_encoders = []
-                self.all_video_encoders = []
-                self.all_audio_encoders = []
-                
-                in_encoders = False
-                for line in res.stdout.split('\n'):
-                    if '------' in line: in_encoders = True; continue
-                    if in_encoders and line.strip():
-                        parts = line.strip().split(maxsplit=2)
-                        if len(parts) >= 2:
-                            etype, ename = parts[0], parts[1]
-                            desc = parts[2] if len(parts) >= 3 else ename
-                            if 'V' in etype:
-                                self.all_video_encoders.append(ename)
-                                self.video_encoder_descriptions[ename] = desc
-                                if ename in CodecManager.VIDEO_CODECS: self.supported_encoders.append(ename)
-                            elif 'A' in etype:
-                                self.all_audio_encoders.append(ename)
-                                self.audio_encoder_descriptions[ename] = desc
-                                if ename in CodecManager.AUDIO_CODECS: self.supported_encoders.append(ename)
-                
-                self._filter_codecs('video')
-                self._filter_codecs('audio')
-        except Exception as e:
-            self.log(f"FFmpeg не найден: {e}", "error")
+        """Определение версии FFmpeg и списка энкодеров.
+
+        При попадании в кэш (тот же бинарник: путь, размер, mtime) результат
+        применяется сразу, без запуска подпроцессов. Иначе зондирование идёт
+        в фоновом потоке, а комбобоксы заполняются, когда придёт результат.
+        """
+        self._encoder_probe_id += 1
+        probe_id, ffmpeg_path = self._encoder_probe_id, self.ffmpeg_path
+        info = cached_encoders(ffmpeg_path)
+        if info is not None:
+            self._apply_encoder_info(info)
+            return
+
+        def worker():
+            try:
+                self.ui_queue.put({'type': 'encoders', 'probe_id': probe_id,
+                                   'info': discover_encoders(ffmpeg_path)})
+            except Exception as e:
+                self.ui_queue.put({'type': 'encoders', 'probe_id': probe_id,
+                                   'info': None, 'error': str(e)})
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_encoders_probed(self, msg):
+        if msg['probe_id'] != self._encoder_probe_id:
+            return  # Устаревший результат — путь к ffmpeg успели сменить
+        if msg['info'] is None:
+            self.log(f"FFmpeg не найден: {msg['error']}", "error")
+            self._mark_startup('ready')
+            return
+        self._apply_encoder_info(msg['info'])
+
+    def _apply_encoder_info(self, info):
+        self.ffmpeg_version_info = info['version']
+        self.log(f"FFmpeg найден: {self.ffmpeg_version_info}", "success")
+        self.supported_encoders = list(info['supported'])
+        self.all_video_encoders = list(info['video'])
+        self.all_audio_encoders = list(info['audio'])
+        # Словари обновляются на месте — на них ссылаются ComboboxTooltip
+        self.video_encoder_descriptions.clear()
+        self.video_encoder_descriptions.update(info['video_desc'])
+        self.audio_encoder_descriptions.clear()
+        self.audio_encoder_descriptions.update(info['audio_desc'])
+        self._filter_codecs('video')
+        self._filter_codecs('audio')
+        self._mark_startup('ready')
 
     def show_ffmpeg_settings(self):
-        win = tk.Toplevel(self.root)
+        """Окно настроек FFmpeg: строится при первом вызове, затем только показывается."""
+        win = self._ffmpeg_settings_win
+        if win is not None and win.winfo_exists():
+            # Несохранённые правки прошлого открытия не показываем
+            self._ffmpeg_path_var.set(self.config.get("ffmpeg_path", "ffmpeg"))
+            win.deiconify()
+            win.lift()
+            return
+        self._ffmpeg_settings_win = win = tk.Toplevel(self.root)
         win.title("Настройки FFmpeg")
         win.geometry("550x300")
         
@@ -851,7 +1363,7 @@ class FFmpegConverter:
         ttk.Label(frame, text="Путь к системному FFmpeg (если выбран системный):").grid(row=2, column=0, sticky=tk.W)
         path_frame = ttk.Frame(frame)
         path_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(0, 15))
-        path_var = tk.StringVar(value=self.config.get("ffmpeg_path", "ffmpeg"))
+        self._ffmpeg_path_var = path_var = tk.StringVar(value=self.config.get("ffmpeg_path", "ffmpeg"))
         ttk.Entry(path_frame, textvariable=path_var, width=50).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(path_frame, text="Обзор", command=lambda: path_var.set(filedialog.askopenfilename() or path_var.get())).pack(side=tk.LEFT)
 
@@ -880,186 +1392,259 @@ class FFmpegConverter:
             self.config_manager.save(self.config)
             self.setup_ffmpeg_paths()
             self.check_ffmpeg_and_codecs()
-            win.destroy()
+            win.withdraw()
+
+        def cancel():
+            win.withdraw()
 
         btn_f = ttk.Frame(frame)
         btn_f.grid(row=5, column=0, sticky=tk.E)
         ttk.Button(btn_f, text="Сохранить", command=save, style='Modern.TButton').pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(btn_f, text="Отмена", command=win.destroy).pack(side=tk.LEFT)
+        ttk.Button(btn_f, text="Отмена", command=cancel).pack(side=tk.LEFT)
+        win.protocol("WM_DELETE_WINDOW", cancel)
 
     def show_ffmpeg_info(self):
         messagebox.showinfo("FFmpeg Info", f"Версия: {self.ffmpeg_version_info}\nПуть: {self.ffmpeg_path}")
 
+    def show_history(self):
+        """Окно истории заданий: последние задания, сводка по кодекам, выгрузка в CSV."""
+        if self.job_history is None:
+            messagebox.showinfo("История", "История заданий отключена (history_enabled в конфигурации)")
+            return
+        win = self._history_win
+        if win is not None and win.winfo_exists():
+            self._fill_history()
+            win.deiconify()
+            win.lift()
+            return
+        self._history_win = win = tk.Toplevel(self.root)
+        win.title("История заданий")
+        win.geometry("900x460")
+        frame = ttk.Frame(win, padding="12")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = (("date", "Дата", 110), ("name", "Файл", 200), ("codec", "Кодек", 80),
+                   ("preset", "Пресет", 60), ("quality", "Качество", 60), ("size", "Размер, МБ", 100),
+                   ("ratio", "Сжатие", 60), ("time", "Время", 70), ("fps", "fps", 50),
+                   ("speed", "Скорость", 60), ("status", "Статус", 80))
+        tree_frame = ttk.Frame(frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.history_tree = ttk.Treeview(tree_frame, columns=[c[0] for c in columns], show='headings')
+        for key, title, width in columns:
+            self.history_tree.heading(key, text=title)
+            self.history_tree.column(key, width=width, stretch=key == "name")
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=scrollbar.set)
+        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.history_summary_label = ttk.Label(frame, text="", justify=tk.LEFT)
+        self.history_summary_label.pack(fill=tk.X, pady=(8, 0))
+
+        def export_csv():
+            path = filedialog.asksaveasfilename(parent=win, defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv")])
+            if not path:
+                return
+            try:
+                count = self.job_history.export_csv(path)
+                self.log(f"История: выгружено заданий {count} → {path}", "success")
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось выгрузить историю: {e}", parent=win)
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(8, 0))
+        ttk.Button(buttons, text="Экспорт CSV…", command=export_csv, style='Modern.TButton').pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Button(buttons, text="Обновить", command=self._fill_history, style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Закрыть", command=win.withdraw, style='Secondary.TButton').pack(side=tk.RIGHT)
+        win.protocol("WM_DELETE_WINDOW", win.withdraw)
+        self._fill_history()
+
+    def _fill_history(self, limit=500):
+        try:
+            rows = self.job_history.rows(limit)
+            summary = self.job_history.summary()
+        except Exception as e:
+            self.history_summary_label.config(text=f"Ошибка чтения истории: {e}")
+            return
+        self.history_tree.delete(*self.history_tree.get_children())
+
+        def num(value, fmt):
+            return format(value, fmt) if value is not None else "—"
+
+        for row in rows:
+            mb = 1024 * 1024
+            size = (f"{num(row['input_size'] and row['input_size'] / mb, '.1f')} → "
+                    f"{num(row['output_size'] and row['output_size'] / mb, '.1f')}")
+            self.history_tree.insert('', tk.END, values=(
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(row['started'] or 0)),
+                os.path.basename(row['input']), row['codec'] or "—", row['preset'] or "—",
+                row['quality'] or row['bitrate'] or "—", size, num(row['compression'], '.1f'),
+                format_time(row['wall_s']) if row['wall_s'] is not None else "—",
+                num(row['fps'], '.1f'), num(row['speed'], '.2f'),
+                Job.STATUS_NAMES.get(row['status'], row['status'])))
+        lines = [f"{row['codec']} {row['preset'] or ''}: заданий {row['jobs']}, "
+                 f"скорость {row['speed']:.2f}x, {num(row['fps'], '.1f')} fps, "
+                 f"сжатие {num(row['compression'], '.1f')}:1" for row in summary[:5]]
+        self.history_summary_label.config(
+            text='\n'.join(lines) or "Нет завершённых заданий — оценки времени появятся после первых конвертаций")
+
     def log(self, message, level="info"):
-        """Потокобезопасная обертка для логов"""
-        self.ui_queue.put({'type': 'log', 'message': message, 'level': level})
+        """Потокобезопасная обертка для логов: строка попадает в кольцевой буфер,
+        в виджет её выводит _flush_log на ближайшем тике process_queue."""
+        self.log_buffer.append(message, level)
 
-    def _log_direct(self, message, level):
-        """Прямая запись в UI (вызывается из очереди). fix R1/#10: цвет применяется."""
+    def _format_log_chunks(self, entries):
+        """Пары (текст, теги) для одного вызова Text.insert. fix R1/#10: цвет применяется."""
         prefix_map = {'error': 'ERROR: ', 'warning': 'WARNING: ', 'success': '✓ '}
-        prefix = prefix_map.get(level, '')
-        tag = level if level in prefix_map else None
-        self.log_text.insert(tk.END, prefix + message + '\n', tag)
+        min_level = self.log_level.get()
+        chunks = []
+        for level, message in entries:
+            if not level_visible(level, min_level):
+                continue
+            tag = (level,) if level in prefix_map else ()
+            chunks.extend((prefix_map.get(level, '') + message + '\n', tag))
+        return chunks
+
+    def _flush_log(self):
+        """Вывод накопившихся строк лога одним insert (Tk-поток).
+
+        Виджет обрезается до log_buffer.max_lines строк сверху; автопрокрутка
+        только если пользователь не пролистал лог вверх. Время вывода
+        учитывается в log_buffer (см. «Статистика лога»).
+        """
+        started = time.perf_counter()
+        chunks = self._format_log_chunks(self.log_buffer.drain(LOG_LINES_PER_TICK))
+        if chunks:
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            self.log_text.insert(tk.END, *chunks)
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - self.log_buffer.max_lines
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            if at_bottom:
+                self.log_text.see(tk.END)
+        self.log_buffer.record_tick(time.perf_counter() - started)
+
+    def _rerender_log(self):
+        """Перерисовка лога из буфера при смене фильтра уровня."""
+        self.log_text.delete('1.0', tk.END)
+        chunks = self._format_log_chunks(self.log_buffer.snapshot())
+        if chunks:
+            self.log_text.insert(tk.END, *chunks)
         self.log_text.see(tk.END)
 
+    def _clear_log(self):
+        self.log_buffer.clear()
+        self.log_text.delete('1.0', tk.END)
+
+    def show_log_stats(self):
+        buf = self.log_buffer
+        messagebox.showinfo("Статистика лога",
+                            f"Строк в буфере: {len(buf)} из {buf.max_lines}\n"
+                            f"Память буфера: ~{buf.approx_bytes / 1024:.0f} КБ\n"
+                            f"Пропущено при переполнении: {buf.dropped}\n"
+                            f"Вывод за тик: {buf.last_tick * 1000:.1f} мс "
+                            f"(макс. {buf.max_tick * 1000:.1f} мс)")
+
     def preview_command(self):
         try:
-            cmd = ' '.join(self.build_ffmpeg_command())
+            settings = self.collect_settings()
+            if settings["use_target_size"]:
+                cmds, _ = build_encode_commands(settings, self.ffmpeg_path, self.input_file.get(),
+                                                self.output_file.get(), source=self.media_info,
+                                                duration=self._compute_effective_duration())
+                cmd = '\n\n'.join(' '.join(c) for c in cmds)
+            else:
+                cmd = ' '.join(self.build_ffmpeg_command(settings=settings))
+            forecast = self._forecast_result
+            if forecast and forecast[0] == (self.input_file.get(), cmd):
+                cmd = f"Прогноз: {forecast[1]}\n\n{cmd}"
+            filters = video_filters(settings, self.media_info)
+            if filters:
+                cmd = f"Граф фильтров: {','.join(filters)}\n\n{cmd}"
+            copied = self._copied_streams(settings)
+            if copied:
+                cmd = f"Без перекодирования: {describe_copy(copied)}\n\n{cmd}"
+            if smart_cut_supported(settings, self.media_info, self.output_file.get()):
+                cmd = ("Умная обрезка: края перекодируются, середина копируется "
+                       f"(ключевые кадры определяются при запуске)\n\n{cmd}")
             messagebox.showinfo("Команда", cmd)
         except Exception as e:
             messagebox.showerror("Ошибка", str(e))
 
-    def normalize_bitrate(self, bitrate):
-        bitrate = bitrate.strip()
-        if bitrate and bitrate[-1].lower() not in ['k', 'm'] and bitrate.isdigit():
-            return bitrate + 'k'
-        return bitrate
+    def collect_settings(self):
+        """Снимок настроек окна в виде словаря (ключи как в конфигурации).
 
-    def get_actual_video_codec(self):
-        """Возвращает кодек с учетом аппаратного ускорения"""
-        base_codec = self.video_codec.get()
-        hw_mode = self.hw_accel.get()
-        
-        if hw_mode == "CPU (Программное)":
-            return base_codec
-            
-        hw_codec = CodecManager.HW_MAP.get(hw_mode, {}).get(base_codec, base_codec)
-        if hw_codec == base_codec and base_codec == "libvvenc":
-            self.log("Внимание: VVC пока не имеет аппаратного энкодера, используется CPU.", "warning")
-        return hw_codec
-
-    def build_ffmpeg_command(self):
-        """Построение команды FFmpeg (fixes #6, #7, #9).
-
-        #6 — CRF/качество для каждого кодека:
-            - libx264/libx265/libvvenc  → -crf N
-            - libaom-av1                 → -crf N -b:v 0  (иначе режим не активируется)
-            - librav1e                   → -qp N          (-crf игнорируется)
-            - libvpx-vp9                 → -crf N -b:v 0
-            - nvenc                      → -rc vbr -cq N
-            - amf                        → -rc cqp -qp_i N -qp_p N
-            - qsv                        → -global_quality N
-        #7 — пресет: x264/x265/vvenc используют -preset; остальным нужны
-            числовые флаги (-cpu-used для aom, -speed для rav1e/vpx).
-        #9 — trim: -ss до -i (быстрый seek) + -t после -i (длительность).
-            Старая схема -ss + -to до -i имела путаную семантику абсолютного
-            таймштампа и давала неточные результаты.
+        Вызывается в Tk-потоке; рабочие потоки получают уже готовый словарь
+        и не обращаются к tk-переменным.
         """
-        FFmpegValidator.validate_file_path(self.input_file.get())
-        v_bitrate = self.normalize_bitrate(self.video_bitrate.get())
-        a_bitrate = self.normalize_bitrate(self.audio_bitrate.get())
-
-        cmd = [self.ffmpeg_path]
-
-        # --- Trim (fix #9): -ss до -i, -t после -i ---
-        trim_duration_seconds = None
-        if self.enable_trim.get():
-            FFmpegValidator.validate_timestamp(self.trim_start.get())
-            FFmpegValidator.validate_timestamp(self.trim_end.get())
-            start_s = self.timestamp_to_seconds(self.trim_start.get())
-            end_s   = self.timestamp_to_seconds(self.trim_end.get())
-            if end_s <= start_s:
-                raise ValueError("Время конца должно быть позже времени начала")
-            trim_duration_seconds = end_s - start_s
-            cmd.extend(['-ss', self.trim_start.get()])
-
-        cmd.extend(['-i', self.input_file.get()])
-
-        # Длительность фрагмента (после -i)
-        if trim_duration_seconds is not None:
-            cmd.extend(['-t', self.seconds_to_timestamp(trim_duration_seconds)])
-
-        actual_codec = self.get_actual_video_codec()
+        return {
+            # Видео
+            "video_codec": self.video_codec.get(),
+            "video_preset": self.video_preset.get(),
+            "video_bitrate": self.video_bitrate.get(),
+            "video_resolution": self.video_resolution.get(),
+            "resolution_mode": self.resolution_mode.get(),
+            "custom_resolution": self.custom_resolution.get(),
+            "video_quality": self.video_quality.get(),
+            "video_fps": self.video_fps.get(),
+            "video_scaler": self.video_scaler.get(),
+            "video_crop": self.video_crop.get().strip(),
+            "deinterlace": self.deinterlace.get(),
+            "pix_fmt": self.pix_fmt.get(),
+            "filter_threads": self.filter_threads.get(),
+            "parallel_chunks": self.parallel_chunks.get(),
+            "chunk_count": self.chunk_count.get(),
+            "resumable": self.resumable.get(),
+            "segment_seconds": self.config.get("segment_seconds", 120),
+            # Параллелизм libvvenc по классам разрешения (vvc_tune) — из конфигурации
+            "vvenc_tuning": self.config.get("vvenc_tuning", {}),
+            # Аудио
+            "audio_codec": self.audio_codec.get(),
+            "audio_bitrate": self.audio_bitrate.get(),
+            # Режимы
+            "use_crf": self.use_crf.get(),
+            "stream_copy": self.stream_copy.get(),
+            "use_target_size": self.use_target_size.get(),
+            "target_size": self.target_size.get(),
+            "auto_quality": self.auto_quality.get(),
+            "quality_metric": self.quality_metric.get(),
+            "quality_target": self.quality_target.get(),
+            "show_all_video_codecs": self.show_all_video_codecs.get(),
+            "show_all_audio_codecs": self.show_all_audio_codecs.get(),
+            # Обрезка
+            "enable_trim": self.enable_trim.get(),
+            "trim_start": self.trim_start.get(),
+            "trim_end": self.trim_end.get(),
+            "smart_cut": self.smart_cut.get(),
+            # FFmpeg
+            "hw_accel": self.hw_accel.get(),
+        }
 
-        # Видео кодек
-        cmd.extend(['-c:v', actual_codec, '-threads', '0'])
+    def build_ffmpeg_command(self, input_file=None, output_file=None, settings=None, **kwargs):
+        """Команда FFmpeg по текущим настройкам окна (см. vvc_core.build_ffmpeg_command).
 
-        # Контроль качества / битрейт (fix #6)
-        if self.use_crf.get():
-            quality = self.video_quality.get()
-            if "nvenc" in actual_codec:
-                cmd.extend(['-rc', 'vbr', '-cq', quality])
-            elif "amf" in actual_codec:
-                cmd.extend(['-rc', 'cqp', '-qp_i', quality, '-qp_p', quality])
-            elif "qsv" in actual_codec:
-                cmd.extend(['-global_quality', quality, '-look_ahead', '0'])
-            elif actual_codec == 'librav1e':
-                # librav1e не понимает -crf, нужен -qp
-                cmd.extend(['-qp', quality])
-            elif actual_codec == 'libaom-av1':
-                # aom-av1: -crf активируется только вместе с -b:v 0
-                cmd.extend(['-crf', quality, '-b:v', '0'])
-            elif actual_codec == 'libvpx-vp9':
-                # VP9: -crf + -b:v 0 включает режим постоянного качества
-                cmd.extend(['-crf', quality, '-b:v', '0'])
-            else:
-                # libx264, libx265, libvvenc
-                cmd.extend(['-crf', quality])
-        else:
-            cmd.extend(['-b:v', v_bitrate])
-
-        # Пресет / скорость (fix #7)
-        # x264/x265/vvenc используют текстовый -preset; остальным нужны числовые флаги.
-        preset = self.video_preset.get()
-        # Карта: текстовый пресет → числовое значение скорости для каждого кодека
-        SPEED_MAP = {
-            'libaom-av1':  {'faster': 6, 'fast': 4, 'medium': 2, 'slow': 1, 'slower': 0},
-            'librav1e':    {'faster': 8, 'fast': 6, 'medium': 4, 'slow': 2, 'slower': 1},
-            'libvpx-vp9':  {'faster': 5, 'fast': 4, 'medium': 2, 'slow': 1, 'slower': 0},
-        }
-        if "nvenc" in actual_codec or "amf" in actual_codec or "qsv" in actual_codec:
-            # Для HW-энкодеров -preset валиден, но значения другие (p1..p7 для nvenc,
-            # speed/quality/balanced для amf, veryfast..slower для qsv).
-            # Не передаём, чтобы не падать — пусть кодек использует свой дефолт.
-            pass
-        elif actual_codec == 'libaom-av1':
-            cmd.extend(['-cpu-used', str(SPEED_MAP[actual_codec].get(preset, 2))])
-        elif actual_codec == 'librav1e':
-            cmd.extend(['-speed', str(SPEED_MAP[actual_codec].get(preset, 4))])
-        elif actual_codec == 'libvpx-vp9':
-            cmd.extend(['-speed', str(SPEED_MAP[actual_codec].get(preset, 2))])
-        else:
-            # libx264, libx265, libvvenc — текстовый -preset
-            cmd.extend(['-preset', preset])
-
-        cmd.extend(['-s', self.video_resolution.get(), '-r', self.video_fps.get(),
-                    '-c:a', self.audio_codec.get(), '-b:a', a_bitrate])
-        if self.audio_codec.get() == 'libopus': cmd.extend(['-ac', '2'])
-        cmd.extend(['-y', self.output_file.get()])
-        return cmd
-
-    def timestamp_to_seconds(self, timestamp):
-        """Конвертация HH:MM:SS / MM:SS / SS в секунды (fix #9 helper)."""
-        parts = timestamp.split(':')
-        if len(parts) == 3:
-            h, m, s = map(float, parts)
-            return h * 3600 + m * 60 + s
-        elif len(parts) == 2:
-            m, s = map(float, parts)
-            return m * 60 + s
-        return float(parts[0])
-
-    def seconds_to_timestamp(self, seconds):
-        """Конвертация секунд в HH:MM:SS (fix #9 helper)."""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+        input_file/output_file — для заданий очереди; по умолчанию берутся
+        значения из полей окна.
+        """
+        settings = settings or self.collect_settings()
+        self._warn_hw_codec(settings)
+        if input_file is None:
+            kwargs.setdefault('source', self.media_info)
+        return build_ffmpeg_command(settings, self.ffmpeg_path,
+                                    input_file or self.input_file.get(),
+                                    output_file or self.output_file.get(), **kwargs)
+
+    def _warn_hw_codec(self, settings):
+        if settings["hw_accel"] not in CPU_MODES and get_actual_video_codec(settings) == "libvvenc":
+            self.log("Внимание: VVC пока не имеет аппаратного энкодера, используется CPU.", "warning")
 
     def _get_video_duration(self, filepath):
         """Получение длительности файла через ffprobe (fix R5 helper)."""
-        try:
-            result = subprocess.run(
-                [self.ffprobe_path, '-v', 'quiet',
-                 '-show_entries', 'format=duration',
-                 '-of', 'default=noprint_wrappers=1:nokey=1', filepath],
-                capture_output=True, text=True, errors='replace', timeout=10
-            )
-            if result.returncode == 0 and result.stdout and result.stdout.strip():
-                return float(result.stdout.strip())
-        except Exception:
-            pass
-        return 0.0
+        return media_duration(get_media_info(self.ffprobe_path, filepath))
+
+    def _get_frame_count(self, filepath):
+        return media_frames(get_media_info(self.ffprobe_path, filepath))
 
     def _compute_effective_duration(self):
         """Длительность целевого фрагмента в секундах (fix R5).
@@ -1070,8 +1655,8 @@ class FFmpegConverter:
         """
         try:
             if self.enable_trim.get():
-                start_s = self.timestamp_to_seconds(self.trim_start.get())
-                end_s   = self.timestamp_to_seconds(self.trim_end.get())
+                start_s = timestamp_to_seconds(self.trim_start.get())
+                end_s   = timestamp_to_seconds(self.trim_end.get())
                 if end_s > start_s:
                     return end_s - start_s
             # Без обрезки — полная длительность (кэш в self.video_duration,
@@ -1088,143 +1673,509 @@ class FFmpegConverter:
     def start_conversion(self):
         """Запуск конвертации. fix R5: длительность вычисляется один раз здесь."""
         try:
-            cmd = self.build_ffmpeg_command()
+            settings = self.collect_settings()
+            cmd = self.build_ffmpeg_command(settings=settings)
             # Кэш длительности для расчёта прогресса (fix R5)
             self._effective_duration = self._compute_effective_duration()
+            # Длительность неизвестна — прогресс по числу кадров
+            self._total_frames = 0
+            if not self._effective_duration:
+                self._total_frames = self._get_frame_count(self.input_file.get())
             self.convert_button.config(state='disabled')
             self.stop_button.config(state='normal')
             self.progress_var.set(0)
             self.progress_label.config(text="Начало конвертации...")
             self.time_label.config(text="")
-
-            self.conversion_thread = threading.Thread(target=self.run_conversion, args=(cmd,))
+            copied = self._copied_streams(settings)
+            if copied:
+                self.log(f"Без перекодирования: {describe_copy(copied)}", "info")
+
+            if settings["use_target_size"]:
+                if settings["parallel_chunks"]:
+                    self.log("Режим «Размер файла»: параллельные фрагменты не используются", "warning")
+                cmds, work_dir = build_encode_commands(settings, self.ffmpeg_path, self.input_file.get(),
+                                                       self.output_file.get(), source=self.media_info,
+                                                       duration=self._effective_duration)
+                target, args = self.run_conversion, (cmds[-1], cmds, work_dir, settings["target_size"])
+                mode = '2pass'
+            elif settings["use_crf"] and settings["auto_quality"]:
+                from vvc_quality import validate_target
+                validate_target(settings["quality_metric"], settings["quality_target"])
+                target, args = self.run_auto_quality_conversion, (settings, self.input_file.get(),
+                                                                  self.output_file.get(), self.media_info)
+                mode = 'auto_crf'
+            elif smart_cut_supported(settings, self.media_info, self.output_file.get()):
+                target, args = self.run_smart_cut_conversion, (cmd, settings, self.input_file.get(),
+                                                               self.output_file.get(), self.media_info)
+                mode = 'smart_cut'
+            elif settings["resumable"] and 'video' not in copied:
+                target, args = self.run_resumable_conversion, (cmd, settings, self.input_file.get(),
+                                                               self.output_file.get(), self.media_info)
+                mode = 'resumable'
+            elif self.parallel_chunks.get() and 'video' not in copied:
+                target, args = self.run_chunked_conversion, (cmd, settings, self.input_file.get(),
+                                                             self.output_file.get(), self.media_info)
+                mode = 'chunks'
+            else:
+                target, args = self.run_conversion, (cmd,)
+                mode = 'copy' if 'video' in copied else 'single'
+            self._start_history_job(cmd, mode)
+            self._stop_requested = False
+            self.conversion_thread = threading.Thread(target=self._conversion_worker,
+                                                      args=(target, args))
             self.conversion_thread.daemon = True
             self.conversion_thread.start()
         except Exception as e:
             self.log(f"Ошибка: {e}", "error")
             self.convert_button.config(state='normal')
 
-    def run_conversion(self, cmd):
+    def start_forecast(self):
+        """Прогноз размера и времени по образцам (vvc_forecast) в фоновом потоке."""
+        from vvc_forecast import Forecast
+        thread = getattr(self, 'conversion_thread', None)
+        if self.forecast or (thread and thread.is_alive()):
+            self.log("Прогноз недоступен во время конвертации", "warning")
+            return
+        try:
+            settings = self.collect_settings()
+            cmd = self.build_ffmpeg_command(settings=settings)
+            duration = self._compute_effective_duration()
+            if not duration:
+                raise ValueError("длительность неизвестна")
+            trim = trim_range(settings)
+            self.forecast = Forecast(settings, self.ffmpeg_path, self.input_file.get(),
+                                     self.output_file.get(), trim[0] if trim else 0.0, duration,
+                                     source=self.media_info, on_event=self.ui_queue.put)
+        except Exception as e:
+            self.log(f"Прогноз невозможен: {e}", "error")
+            return
+        key = (self.input_file.get(), ' '.join(cmd))
+        forecast = self.forecast
+        self.convert_button.config(state='disabled')
+        self.stop_button.config(state='normal')
+        self.progress_label.config(text="Прогноз: кодирование образцов...")
+
+        def worker():
+            result = None
+            try:
+                result = forecast.run()
+            except Exception as e:
+                self.log(f"Ошибка прогноза: {e}", "error")
+                self.ui_queue.put({'type': 'progress', 'value': 0, 'text': "Прогноз не выполнен"})
+            finally:
+                self.forecast = None
+            self.ui_queue.put({'type': 'forecast', 'key': key, 'result': result})
+            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_forecast(self, msg):
+        if msg['result'] is None:
+            return  # Ошибка (в логе) или остановка
+        from vvc_forecast import describe_forecast
+        text = describe_forecast(msg['result'])
+        self._forecast_result = (msg['key'], text)
+        self.progress_label.config(text=f"Прогноз: {text}")
+        # Прогноз — рядом с командой, если настройки с тех пор не менялись
+        self.preview_command()
+
+    def _start_history_job(self, cmd, mode):
+        """Конвертация из окна в виде Job для истории; в лог — оценка времени по истории."""
+        job = Job(self.input_file.get(), self.output_file.get(), cmd,
+                  duration=self._effective_duration or None)
+        job.mode, job.start_time, job.status = mode, time.time(), Job.RUNNING
+        video = (self.media_info or {}).get('video')
+        if video and video['fps'] and job.duration:
+            job.total_frames = round(video['fps'] * job.duration)
+        # Процессы этой конвертации (process.cpu_time — после их завершения)
+        self._history_job, self._history_processes = job, []
+        if self.metrics is not None:
+            self.metrics.observe_job(job)
+        prior = None
+        if mode != 'copy':
+            prior = prior_rate(self.job_history, cmd, job.duration, job.input_file)
+            if prior:
+                self.log(f"Оценка по истории: ~{format_time(1 / prior)}")
+        self._eta = EtaEstimator(prior)
+
+    def _conversion_worker(self, target, args):
+        """Рабочий поток конвертации из окна. target (run_*_conversion)
+        возвращает код возврата или None, если до запуска не дошло; запись в
+        историю — после него, когда процессы уже завершились (в том числе
+        после остановки: stop_conversion только отмечает задание)."""
+        job, processes = self._history_job, self._history_processes
+        rc = None
+        try:
+            rc = target(*args)
+        finally:
+            if self._history_job is job:
+                self._history_job = None
+            self._record_history(job, processes, rc)
+
+    def _record_history(self, job, processes, rc):
+        """Запись завершившейся конвертации из окна в историю (рабочий поток)."""
+        if job is None:
+            return
+        job.end_time, job.return_code = time.time(), rc
+        if job.status != Job.STOPPED:
+            job.status = Job.DONE if rc == 0 else Job.FAILED
+        job.cpu_time = processes_cpu_time(processes)
+        if self.metrics is not None:
+            self.metrics.observe_job(job)
+        if self.job_history is not None:
+            try:
+                self.job_history.add_job(job)
+            except Exception as e:
+                self.log(f"История заданий: {e}", "warning")
+
+    def _track_process(self, process):
+        """on_start процессов конвертации из окна: их время ЦП — в историю."""
+        self._history_processes.append(process)
+
+    def run_conversion(self, cmd, passes=None, work_dir=None, target_size=None, decode_check=False):
         """Выполнение конвертации в рабочем потоке (fix R5).
 
         Все UI-обновления идут через self.ui_queue → process_queue (главный поток).
         Прогресс считается по реальному time= из вывода ffmpeg + _effective_duration.
+        passes — команды двухпроходного кодирования (режим «Размер файла»),
+        work_dir — папка их журналов, target_size — цель в МБ для проверки,
+        decode_check — проверить, что результат декодируется целиком (умная обрезка).
         """
+        passes = passes or [cmd]
+        rc = None
         try:
             self.start_time = time.time()
-            self.log(f"Запуск: {' '.join(cmd)}")
+            if work_dir:
+                os.makedirs(work_dir, exist_ok=True)
+
+            def on_start(process):
+                self.current_process = process
+                self._track_process(process)
+                if self._stop_requested:
+                    process.stop()  # «Стоп» нажат, пока процесс запускался
+
+            rc = 0
+            for index, pass_cmd in enumerate(passes):
+                self._pass_index, self._pass_count = index, len(passes)
+                label = f"Проход {index + 1}/{len(passes)}: " if len(passes) > 1 else ""
+                self.log(f"{label}Запуск: {' '.join(pass_cmd)}")
+                # Прогресс — из структурированного канала -progress (out_time/frame)
+                rc = run_ffmpeg(pass_cmd, on_output=self.log,
+                                on_progress=self._update_progress_from_record, on_start=on_start,
+                                budget=cpu_budget)
+                if rc != 0 or self.current_process is None:
+                    break  # Ошибка или остановка пользователем
+            if rc == 0 and decode_check and self.current_process is not None:
+                rc = self._check_decode(passes[-1][0], passes[-1][-1], on_start)
+            self._report_conversion_result(rc)
+            if rc == 0 and target_size:
+                self._report_target_size(passes[-1][-1], target_size)
+        except Exception as e:
+            self.log(f"Ошибка выполнения: {e}", "error")
+        finally:
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            self._pass_index, self._pass_count = 0, 1
+            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+            self.current_process = None
+        return rc
+
+    def _check_decode(self, ffmpeg_path, output_file, on_start):
+        """Полное декодирование результата умной обрезки (vvc_chunks.check_decode)."""
+        from vvc_chunks import check_decode
+        self.ui_queue.put({'type': 'progress', 'value': 100, 'text': "Проверка склейки..."})
+        rc, errors = check_decode(ffmpeg_path, output_file, on_start)
+        for line in errors:
+            self.log(f"Ошибка декодирования результата: {line}", "error")
+        return rc
+
+    def _report_target_size(self, output_file, target_size):
+        result = check_target_size(output_file, target_size)
+        if result is not None:
+            size_mb, deviation = result
+            level = "success" if abs(deviation) <= TARGET_SIZE_TOLERANCE else "warning"
+            self.log(f"Размер результата: {size_mb:.1f} МБ (цель {target_size} МБ, "
+                     f"{deviation * 100:+.1f}%)", level)
+
+    def run_auto_quality_conversion(self, settings, input_file, output_file, source=None):
+        """Подбор CRF по образцам, затем обычная (или по фрагментам) конвертация.
+
+        Выполняется в рабочем потоке; найденное значение подставляется в поле
+        "Качество (CRF)" через ui_queue.
+        """
+        from vvc_quality import CrfSearch, plan_samples
+        duration = self._effective_duration
+        if duration and duration > 0:
+            trim = trim_range(settings)
+            try:
+                self.start_time = time.time()
+                self.quality_search = CrfSearch(
+                    settings, self.ffmpeg_path, input_file,
+                    plan_samples(trim[0] if trim else 0.0, duration),
+                    metric=settings["quality_metric"], target=settings["quality_target"],
+                    source=source, on_event=self.ui_queue.put,
+                    on_step=lambda crf, score: self.ui_queue.put({
+                        'type': 'progress', 'value': 0,
+                        'text': f"Подбор CRF: {crf} → {settings['quality_metric'].upper()} {score:g}"}),
+                )
+                result = self.quality_search.run()
+            except Exception as e:
+                self.log(f"Ошибка подбора CRF: {e}", "error")
+                self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+                return
+            finally:
+                self.quality_search = None
+            if result is None:
+                return  # Остановлено пользователем — UI уже сброшен
+            settings = dict(settings, video_quality=str(result[0]))
+            self.ui_queue.put({'type': 'quality', 'value': settings["video_quality"]})
+        else:
+            self.log("Длительность неизвестна — подбор CRF пропущен", "warning")
+        cmd = build_ffmpeg_command(settings, self.ffmpeg_path, input_file, output_file, source=source)
+        if self._history_job is not None:
+            # В историю — команда с подобранным CRF
+            self._history_job.cmd = cmd
+        if settings["resumable"]:
+            return self.run_resumable_conversion(cmd, settings, input_file, output_file, source)
+        if settings["parallel_chunks"]:
+            return self.run_chunked_conversion(cmd, settings, input_file, output_file, source)
+        return self.run_conversion(cmd)
+
+    def run_smart_cut_conversion(self, cmd, settings, input_file, output_file, source=None):
+        """Умная обрезка в рабочем потоке: края диапазона перекодируются,
+        середина копируется, части склеиваются (vvc_chunks.plan_smart_cut).
+
+        Если ключевых кадров внутри диапазона нет — обычная конвертация cmd.
+        """
+        from vvc_chunks import build_smart_cut_commands, plan_smart_cut, probe_cut_keyframes
+        start, duration = trim_range(settings)
+        try:
+            keyframes = probe_cut_keyframes(self.ffprobe_path, input_file, start, start + duration)
+        except Exception as e:
+            self.log(f"Не удалось найти ключевые кадры: {e}", "warning")
+            keyframes = []
+        if self._stop_requested:
+            return  # Остановлено во время поиска — UI уже сброшен
+        segments = plan_smart_cut(start, start + duration, keyframes)
+        if segments is None:
+            self.log("Умная обрезка: копировать нечего — диапазон перекодируется целиком", "info")
+            return self.run_conversion(cmd)
+        copied = sum(d for _, d, copy in segments if copy)
+        self.log(f"Умная обрезка: копируется {format_time(copied)} из {format_time(duration)}, "
+                 f"перекодируется {format_time(duration - copied)}", "info")
+        try:
+            cmds, work_dir = build_smart_cut_commands(settings, self.ffmpeg_path, input_file,
+                                                      output_file, segments, source)
+        except Exception as e:
+            self.log(f"Ошибка: {e}", "error")
+            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+            return
+        return self.run_conversion(cmds[-1], cmds, work_dir, decode_check=True)
 
-            # Windows: не показывать чёрное окно консоли
-            creationflags = 0
-            if os.name == 'nt':
-                creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    def run_resumable_conversion(self, cmd, settings, input_file, output_file, source=None):
+        """Кодирование сегментами с манифестом в рабочем потоке (режим "С продолжением").
 
-            self.current_process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                universal_newlines=True, errors='replace',
-                creationflags=creationflags,
-            )
+        Если режим неприменим (видео копируется) или длительность неизвестна —
+        обычная конвертация командой cmd.
+        """
+        from vvc_resume import resumable_for
+        encoder = resumable_for(settings, self.ffmpeg_path, input_file, output_file, source,
+                                on_event=self.ui_queue.put)
+        if encoder is None or not self._effective_duration:
+            if encoder is not None:
+                self.log("Длительность неизвестна — кодирование без сегментов", "warning")
+            return self.run_conversion(cmd)
+        rc = None
+        try:
+            self.start_time = time.time()
+            self.resumable_encoder = encoder
+            rc = self.resumable_encoder.run(on_start=self._track_process,
+                                            on_progress=self._update_progress_seconds,
+                                            duration=self._effective_duration)
+            if not self.resumable_encoder.stopped:
+                self._report_conversion_result(rc)
+                if rc != 0:
+                    self.log(f"Готовые сегменты сохранены в {self.resumable_encoder.work_dir}", "info")
+        except Exception as e:
+            self.log(f"Ошибка выполнения: {e}", "error")
+        finally:
+            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+            self.resumable_encoder = None
+        return rc
 
-            for out in iter(self.current_process.stdout.readline, ''):
-                if not out:
-                    if self.current_process.poll() is not None:
-                        break
-                    continue
-                out = out.rstrip()
-                if not out:
-                    continue
-                self.log(out)
-                # Парсим time= и считаем реальный прогресс (fix R5)
-                match = re.search(r"time=(\d+:\d+:\d+\.\d+)", out)
-                if match:
-                    self._update_progress_from_time(match.group(1))
-
-            rc = self.current_process.poll()
-            if rc == 0:
-                self.ui_queue.put({'type': 'progress', 'value': 100,
-                                   'text': "Конвертация завершена!"})
-                self.log("Успешно завершено", "success")
-            else:
-                self.log(f"Ошибка конвертации. Код возврата: {rc}", "error")
-                self.ui_queue.put({'type': 'progress', 'value': 0,
-                                   'text': "Ошибка конвертации"})
+    def run_chunked_conversion(self, cmd, settings, input_file, output_file, source=None):
+        """Кодирование фрагментами в рабочем потоке (режим "Параллельно").
+
+        Диапазон обрезки (или весь файл) делится по ключевым кадрам на
+        chunk_count частей. Если длительность неизвестна или файл слишком
+        короткий — обычная конвертация командой cmd.
+        """
+        duration, count = self._effective_duration, max(2, int(settings["chunk_count"]))
+        trim = trim_range(settings)
+        start = trim[0] if trim else 0.0
+        if not duration or duration <= 0:
+            self.log("Длительность неизвестна — параллельные фрагменты отключены", "warning")
+            return self.run_conversion(cmd)
+        targets = [start + duration * i / count for i in range(1, count)]
+        # Модуль нужен только в режиме "Параллельно" — не грузим его при запуске
+        from vvc_chunks import ChunkedEncoder, plan_chunks, probe_keyframes_near
+        try:
+            keyframes = probe_keyframes_near(self.ffprobe_path, input_file, targets)
+        except Exception as e:
+            self.log(f"Не удалось найти ключевые кадры: {e}", "warning")
+            keyframes = []
+        if self._stop_requested:
+            return  # Остановлено во время поиска — UI уже сброшен
+        chunks = plan_chunks(start, duration, count, keyframes)
+        if len(chunks) < 2:
+            return self.run_conversion(cmd)
+
+        rc = None
+        try:
+            self.start_time = time.time()
+            self.chunked_encoder = ChunkedEncoder(
+                chunks, output_file,
+                build_chunk_cmd=lambda s, d, out: build_ffmpeg_command(
+                    settings, self.ffmpeg_path, input_file, out,
+                    start=s, duration=d, include_audio=False, source=source),
+                build_concat_cmd=lambda list_file, out: build_concat_command(
+                    settings, self.ffmpeg_path, input_file, list_file, out, start, duration),
+                on_event=self.ui_queue.put,
+                on_progress=self._update_progress_seconds,
+                on_start=self._track_process,
+            )
+            if self._stop_requested:
+                self.chunked_encoder.stop()  # «Стоп» между поиском и созданием кодировщика
+            cpu_before = cpu_budget.stats()
+            rc = self.chunked_encoder.run()
+            if not self.chunked_encoder.stopped:
+                self._report_conversion_result(rc)
+                self.log(f"Использование процессора: {describe_report(cpu_budget.report(cpu_before))}")
         except Exception as e:
             self.log(f"Ошибка выполнения: {e}", "error")
         finally:
             self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
-            self.current_process = None
+            self.chunked_encoder = None
+        return rc
+
+    def _report_conversion_result(self, rc):
+        if rc == 0:
+            self.ui_queue.put({'type': 'progress', 'value': 100,
+                               'text': "Конвертация завершена!"})
+            self.ui_queue.put({'type': 'file_info'})
+            self.log("Успешно завершено", "success")
+        else:
+            self.log(f"Ошибка конвертации. Код возврата: {rc}", "error")
+            self.ui_queue.put({'type': 'progress', 'value': 0,
+                               'text': "Ошибка конвертации"})
 
-    def _update_progress_from_time(self, time_str):
-        """Расчёт прогресса из time= строки вывода ffmpeg (fix R5).
+    def _update_progress_from_record(self, record):
+        """Расчёт прогресса из блока -progress ffmpeg (fix R5).
 
         Вызывается в рабочем потоке — кладёт сообщение в ui_queue,
-        не трогает Tkinter напрямую.
+        не трогает Tkinter напрямую. Если длительность неизвестна,
+        прогресс считается по кадрам (nb_frames из ffprobe).
         """
+        job = self._history_job
+        fraction = progress_fraction(record, self._effective_duration, self._total_frames)
+        if fraction is not None:
+            fraction = (self._pass_index + fraction) / self._pass_count
+        if job is not None:
+            job.last_progress = record
+            if fraction is not None:
+                job.progress = fraction * 100
+            if self.metrics is not None:
+                self.metrics.observe_job(job)
+        details = []
+        if record.fps:
+            details.append(f"{record.fps:.1f} fps")
+        if record.speed:
+            details.append(f"{record.speed:.2f}x")
+        suffix = f"  ({', '.join(details)})" if details else ""
+        if fraction is None:
+            # Ни длительность, ни число кадров неизвестны — только текущая позиция
+            position = format_time(record.out_time) if record.out_time is not None else "—"
+            self.ui_queue.put({'type': 'progress', 'value': 0,
+                               'text': f"Обработка: {position}{suffix}"})
+            return
+        # Скорость ffmpeg — в долях всей конвертации в секунду
+        rate = None
+        if record.speed and self._effective_duration:
+            rate = record.speed / (self._effective_duration * self._pass_count)
+        elif record.fps and self._total_frames:
+            rate = record.fps / (self._total_frames * self._pass_count)
+        self._post_progress(fraction * 100, f"Прогресс: {fraction * 100:.1f}%{suffix}", rate)
+
+    def _update_progress_seconds(self, current_seconds, text=None):
+        """Прогресс по обработанным секундам (сумма по фрагментам в режиме
+        "Параллельно"). text заменяет стандартную подпись "Прогресс: N%"."""
+        if self._effective_duration and self._effective_duration > 0:
+            self._post_progress(min(100.0, current_seconds / self._effective_duration * 100), text)
+
+    def _post_progress(self, progress, text=None, rate=None):
+        """Прогресс и оставшееся время (vvc_eta: сглаженная скорость с
+        опорой на историю) с диапазоном оценки; rate — скорость по ffmpeg
+        в долях конвертации в секунду."""
         try:
-            parts = time_str.split(':')
-            h, m, s = float(parts[0]), float(parts[1]), float(parts[2])
-            current_seconds = h * 3600 + m * 60 + s
-            duration = self._effective_duration
-            if not duration or duration <= 0:
-                # Длительность неизвестна — показываем только текущее время
-                self.ui_queue.put({'type': 'progress', 'value': 0,
-                                   'text': f"Обработка: {time_str}"})
-                return
-            progress = min(100.0, (current_seconds / duration) * 100)
-            elapsed = time.time() - self.start_time
-            if progress > 0:
-                estimated_total = elapsed / (progress / 100)
-                remaining = max(0, estimated_total - elapsed)
-                time_text = f"Осталось: {self._format_time(remaining)}"
-            else:
-                time_text = ""
+            if self._eta is None:
+                self._eta = EtaEstimator(start_time=self.start_time)
+            self._eta.update(progress / 100, rate)
+            estimate = self._eta.estimate() if progress > 0 else None
+            time_text = f"Осталось: {format_eta(estimate)}" if estimate else ""
             self.ui_queue.put({
                 'type': 'progress', 'value': progress,
-                'text': f"Прогресс: {progress:.1f}%",
+                'text': text or f"Прогресс: {progress:.1f}%",
                 'time': time_text,
             })
         except Exception:
             pass
 
-    @staticmethod
-    def _format_time(seconds):
-        """HH:MM:SS или MM:SS."""
-        if seconds < 0:
-            return "00:00"
-        h = int(seconds // 3600)
-        m = int((seconds % 3600) // 60)
-        s = int(seconds % 60)
-        return f"{h:02d}:{m:02d}:{s:02d}" if h > 0 else f"{m:02d}:{s:02d}"
-
     def stop_conversion(self):
         """Остановка конвертации (fix R15).
 
         Старая реализация звала только terminate() без wait() — если ffmpeg
         игнорировал SIGTERM (бывает на тяжёлом кадре), процесс оставался зомби,
         а кнопки не возвращались в исходное состояние. Теперь: terminate →
-        wait(5) → kill() на таймаут + сброс UI.
+        ожидание 5 с → kill выполняет супервизор процессов, окно не ждёт его
+        (результат приходит в лог), UI сбрасывается сразу.
         """
+        if self._history_job is not None:
+            # В историю задание запишет рабочий поток, когда процессы завершатся
+            self._history_job.status = Job.STOPPED
+        self._stop_requested = True
+        active = self.chunked_encoder or self.quality_search or self.resumable_encoder or self.forecast
+        if active:
+            # ResumableEncoder.stop ждёт свой процесс — вызываем вне Tk-потока
+            threading.Thread(target=active.stop, daemon=True).start()
+            self.log("Остановлено пользователем", "warning")
+            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+            self.ui_queue.put({'type': 'progress', 'value': 0,
+                               'text': "Конвертация остановлена"})
+            return
         if not self.current_process:
+            thread = getattr(self, 'conversion_thread', None)
+            if thread and thread.is_alive():
+                # Процесс ещё не запущен (поиск ключевых кадров): поток увидит флаг
+                self.log("Остановлено пользователем", "warning")
+                self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+                self.ui_queue.put({'type': 'progress', 'value': 0,
+                                   'text': "Конвертация остановлена"})
             return
+        self.current_process.stop().add_done_callback(self._report_stop)
+        self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
+        self.ui_queue.put({'type': 'progress', 'value': 0,
+                           'text': "Конвертация остановлена"})
+        self.current_process = None
+
+    def _report_stop(self, future):
+        """Итог остановки процесса (вызывается в потоке супервизора)."""
         try:
-            self.current_process.terminate()
-            try:
-                self.current_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.current_process.kill()
-                self.current_process.wait(timeout=3)
+            if future.result():
                 self.log("Конвертация принудительно завершена (kill)", "error")
             else:
                 self.log("Остановлено пользователем", "warning")
         except Exception as e:
             self.log(f"Ошибка при остановке: {e}", "error")
-        finally:
-            # Сбрасываем UI — иначе кнопка "Начать" остаётся disabled, пока
-            # рабочий поток не выйдет из readline() (fix R15).
-            self.ui_queue.put({'type': 'status', 'btn_convert': 'normal', 'btn_stop': 'disabled'})
-            self.ui_queue.put({'type': 'progress', 'value': 0,
-                               'text': "Конвертация остановлена"})
-            self.current_process = None
 
     def on_closing(self):
         """Сохранение ВСЕХ настроек перед закрытием (fix R11).
@@ -1233,42 +2184,42 @@ class FFmpegConverter:
         audio_bitrate, use_crf, show_all_*, enable_trim, trim_*, use_local_ffmpeg
         терялись при каждом перезапуске.
         """
+        self.config.update(self.collect_settings())
         self.config.update({
-            # Видео
-            "video_codec": self.video_codec.get(),
-            "video_preset": self.video_preset.get(),
-            "video_bitrate": self.video_bitrate.get(),
-            "video_resolution": self.video_resolution.get(),
-            "resolution_mode": self.resolution_mode.get(),
-            "custom_resolution": self.custom_resolution.get(),
-            "video_quality": self.video_quality.get(),
-            "video_fps": self.video_fps.get(),
-            # Аудио
-            "audio_codec": self.audio_codec.get(),
-            "audio_bitrate": self.audio_bitrate.get(),
-            # Режимы
-            "use_crf": self.use_crf.get(),
-            "show_all_video_codecs": self.show_all_video_codecs.get(),
-            "show_all_audio_codecs": self.show_all_audio_codecs.get(),
-            # Обрезка
-            "enable_trim": self.enable_trim.get(),
-            "trim_start": self.trim_start.get(),
-            "trim_end": self.trim_end.get(),
             # FFmpeg
-            "hw_accel": self.hw_accel.get(),
             "use_local_ffmpeg": self.use_local_ffmpeg.get(),
             "ffmpeg_path": self.config.get("ffmpeg_path", "ffmpeg"),
             # Последние папки
             "last_input_dir": self.config.get("last_input_dir", ""),
             "last_output_dir": self.config.get("last_output_dir", ""),
+            # Очередь
+            "max_workers": self.job_queue.max_workers,
+            "watch_enabled": self.watch_enabled.get(),
+            # Лог
+            "log_level": self.log_level.get(),
+            "log_max_lines": self.log_buffer.max_lines,
         })
         self.config_manager.save(self.config)
+        if self.watch_service:
+            self.watch_service.stop(wait=False)
+        if self.metrics:
+            self.metrics.stop()
+        if self.thumb_strip:
+            self.thumb_strip.stop()
+        for active in (self.chunked_encoder, self.quality_search, self.forecast,
+                       self.resumable_encoder):
+            if active:
+                # ResumableEncoder.stop ждёт процесс (до 5 с) — не в Tk-потоке; поток не
+                # фоновый: после закрытия окна интерпретатор дождётся остановки ffmpeg
+                threading.Thread(target=active.stop).start()
         if self.current_process:
             self.stop_conversion()
+        if self.job_queue.is_running():
+            self.job_queue.stop()
         self.root.destroy()
 
 def main():
-    root = TkinterDnD.Tk()
+    root = tk.Tk()
     app = FFmpegConverter(root)
     root.mainloop()
 
@@ -0,0 +1,203 @@
+"""Бенчмарк кодеков и пресетов на синтетических источниках.
+
+    python vvc_bench.py --codecs libvvenc,libx265 --presets fast,medium --crf 28,34 \\
+        --sources testsrc2,mandelbrot,noise --resolutions 1280x720 --csv bench.csv
+
+Каждая ячейка кодек×пресет×CRF×источник×разрешение кодирует один и тот же
+lavfi-источник фиксированной длительности через build_ffmpeg_command — с теми
+же флагами качества и скорости, что и обычная конвертация. Ячейки выполняются
+строго по одной, чтобы fps и процессорное время не искажались соседями.
+Результат (с версией ffmpeg и описанием машины) сохраняется в CSV/JSON
+для сравнения между машинами и сборками ffmpeg.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from vvc_core import (VERSION, ConfigManager, CodecManager, SPEED_MAP, FFmpegValidator,
+                      resolve_ffmpeg_paths, build_ffmpeg_command)
+from vvc_cpu import children_cpu
+from vvc_jobs import run_ffmpeg
+from vvc_probe import discover_encoders
+
+# Синтетические источники: содержимое от простого к несжимаемому
+SOURCES = {
+    'testsrc2': "testsrc2=size={size}:rate={fps}",
+    'mandelbrot': "mandelbrot=size={size}:rate={fps}",
+    'noise': "color=c=gray:size={size}:rate={fps},noise=alls=60:allf=t+u",
+}
+PRESETS = ["faster", "fast", "medium", "slow", "slower"]
+
+FIELDS = ['source', 'resolution', 'codec', 'preset', 'crf', 'status', 'frames',
+          'encode_fps', 'speed', 'bitrate_kbps', 'size_bytes', 'wall_s', 'cpu_s']
+
+
+def _split(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _fmt(value, width, digits):
+    return f"{value:>{width}.{digits}f}" if value is not None else f"{'—':>{width}}"
+
+
+def lavfi_source(name, size, fps, duration):
+    return SOURCES[name].format(size=size, fps=fps) + f",trim=duration={duration}"
+
+
+def run_cell(ffmpeg_path, base_settings, cell, duration, fps, work_dir):
+    """Кодирование одной ячейки. Возвращает строку результата (dict по FIELDS)."""
+    source, resolution, codec, preset, crf = cell
+    width, height = (int(v) for v in resolution.split('x'))
+    settings = dict(base_settings, video_codec=codec, video_preset=preset, use_crf=True,
+                    video_quality=str(crf), video_resolution=resolution, video_fps=str(fps),
+                    hw_accel="ЦП (Программное)", enable_trim=False)
+    # Источник уже нужного размера и частоты — -s/-r не нужны
+    info = {'video': {'width': width, 'height': height, 'fps': float(fps)}}
+    output = os.path.join(work_dir, f"{codec}_{preset}_{crf}.mp4")
+    cmd = build_ffmpeg_command(settings, ffmpeg_path, lavfi_source(source, resolution, fps, duration),
+                               output, include_audio=False, source=info, input_format='lavfi')
+    last = []
+    cpu_before, started = children_cpu(), time.perf_counter()
+    rc = run_ffmpeg(cmd, on_progress=last.append)
+    wall = time.perf_counter() - started
+    cpu = children_cpu() - cpu_before
+
+    row = dict(zip(FIELDS[:5], cell), status='ok' if rc == 0 else f'error {rc}',
+               wall_s=round(wall, 3), cpu_s=round(cpu, 3) if cpu else None)
+    record = last[-1] if last else None
+    frames = record.frame if record and record.frame else int(duration * fps)
+    size = os.path.getsize(output) if rc == 0 and os.path.exists(output) else None
+    row.update(
+        frames=frames,
+        encode_fps=round(frames / wall, 2) if wall else None,
+        speed=round(duration / wall, 3) if wall else None,
+        size_bytes=size,
+        bitrate_kbps=round(size * 8 / duration / 1000, 1) if size else None,
+    )
+    if os.path.exists(output):
+        os.remove(output)
+    return row
+
+
+def run_matrix(ffmpeg_path, base_settings, codecs, presets, crfs, sources, resolutions,
+               duration=5, fps=30, on_row=None):
+    """Прогон всей матрицы. Кодеки, отсутствующие в сборке ffmpeg, помечаются skipped."""
+    available = set(discover_encoders(ffmpeg_path)['video'])
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='vvc_bench_') as work_dir:
+        for cell in itertools.product(sources, resolutions, codecs, presets, crfs):
+            if cell[2] not in available:
+                row = dict(zip(FIELDS[:5], cell), status='skipped')
+            else:
+                row = run_cell(ffmpeg_path, base_settings, cell, duration, fps, work_dir)
+            rows.append(row)
+            if on_row:
+                on_row(row)
+    return rows
+
+
+def machine_info(ffmpeg_path):
+    return {
+        'app_version': VERSION,
+        'ffmpeg': discover_encoders(ffmpeg_path)['version'],
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: row.get(k) for k in FIELDS})
+
+
+def write_json(path, rows, machine, params):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'machine': machine, 'params': params, 'results': rows}, f,
+                  indent=2, ensure_ascii=False)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="vvc_bench.py",
+        description="Бенчмарк кодеков/пресетов/CRF на синтетических lavfi-источниках.")
+    parser.add_argument('--codecs', default=','.join(CodecManager.VIDEO_CODECS),
+                        help="кодеки через запятую (по умолчанию все поддерживаемые)")
+    parser.add_argument('--presets', default="fast,medium",
+                        help=f"пресеты через запятую из: {', '.join(PRESETS)}")
+    parser.add_argument('--crf', default="28", help="значения CRF/QP через запятую")
+    parser.add_argument('--sources', default=','.join(SOURCES),
+                        help=f"источники через запятую из: {', '.join(SOURCES)}")
+    parser.add_argument('--resolutions', default="1280x720", help="разрешения через запятую")
+    parser.add_argument('--duration', type=float, default=5.0, help="длительность источника, секунд")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--config', default="ffmpeg_converter_config.json")
+    parser.add_argument('--ffmpeg', help="путь к ffmpeg (перекрывает конфигурацию)")
+    parser.add_argument('--csv', metavar='PATH', help="сохранить результаты в CSV")
+    parser.add_argument('--json', metavar='PATH', help="сохранить результаты в JSON")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    codecs, presets, sources = _split(args.codecs), _split(args.presets), _split(args.sources)
+    resolutions = _split(args.resolutions)
+    try:
+        crfs = [int(v) for v in _split(args.crf)]
+        for v in crfs:
+            FFmpegValidator.validate_quality(v)
+        for r in resolutions:
+            FFmpegValidator.validate_resolution(r)
+    except ValueError as e:
+        parser.error(str(e))
+    unknown = [p for p in presets if p not in PRESETS] + [s for s in sources if s not in SOURCES]
+    if unknown:
+        parser.error(f"неизвестные значения: {', '.join(unknown)}")
+
+    config = ConfigManager(args.config).load()
+    ffmpeg_path = args.ffmpeg or resolve_ffmpeg_paths(config)[0]
+    try:
+        machine = machine_info(ffmpeg_path)
+    except Exception as e:
+        print(f"FFmpeg не найден: {e}", file=sys.stderr)
+        return 2
+    print(f"{machine['ffmpeg']} | {machine['processor']} ×{machine['cpu_count']}")
+    print(f"{'источник':<11}{'разрешение':<11}{'кодек':<12}{'пресет':<8}{'crf':>4}"
+          f"{'fps':>9}{'speed':>8}{'кбит/с':>10}{'CPU, с':>9}")
+
+    def print_row(row):
+        if row['status'] != 'ok':
+            print(f"{row['source']:<11}{row['resolution']:<11}{row['codec']:<12}"
+                  f"{row['preset']:<8}{row['crf']:>4}  {row['status']}")
+            return
+        print(f"{row['source']:<11}{row['resolution']:<11}{row['codec']:<12}{row['preset']:<8}"
+              f"{row['crf']:>4}{_fmt(row['encode_fps'], 9, 2)}{_fmt(row['speed'], 8, 3)}"
+              f"{_fmt(row['bitrate_kbps'], 10, 1)}{_fmt(row['cpu_s'], 9, 2)}", flush=True)
+
+    try:
+        rows = run_matrix(ffmpeg_path, config, codecs, presets, crfs, sources, resolutions,
+                          args.duration, args.fps, on_row=print_row)
+    except KeyboardInterrupt:
+        return 130
+    if args.csv:
+        write_csv(args.csv, rows)
+    if args.json:
+        params = {'duration': args.duration, 'fps': args.fps, 'speed_map': SPEED_MAP}
+        write_json(args.json, rows, machine, params)
+    return 1 if any(r['status'].startswith('error') for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
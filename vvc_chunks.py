@@ -0,0 +1,276 @@
+"""Параллельное кодирование одного файла фрагментами.
+
+Исходник делится по ключевым кадрам на N временных диапазонов, диапазоны
+кодируются одновременно отдельными процессами ffmpeg (без звука), затем
+видео склеивается concat-демуксером без перекодирования, а звук кодируется
+одним проходом из исходника — так на стыках нет щелчков и сдвигов.
+
+Тот же приём даёт «умную» обрезку: если исходник уже в нужном кодеке,
+перекодируются только неполные GOP у точек разреза, а всё между первым и
+последним ключевым кадром диапазона копируется как есть. Наборы
+параметров (VPS/SPS/PPS) перекодированных краёв отличаются от исходных, а
+concat-демуксер берёт extradata только у первой части, поэтому части
+H.264/HEVC/VVC пишутся в MPEG-TS: там наборы параметров идут в самом потоке
+перед каждым ключевым кадром. Результат склейки проверяется полным
+декодированием (check_decode).
+"""
+import collections
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from vvc_core import build_ffmpeg_command, build_segment_copy_command, build_concat_command
+from vvc_cpu import cpu_budget
+from vvc_jobs import ProcessGroup, run_ffmpeg
+
+# Окно поиска ключевого кадра после каждой точки разреза, секунд
+KEYFRAME_SEARCH_WINDOW = 20
+# Фрагменты короче этого не имеют смысла — накладные расходы на запуск
+MIN_CHUNK_SECONDS = 10
+# Умная обрезка: копируемая середина короче этого — проще перекодировать всё
+MIN_SMART_COPY_SECONDS = 5
+# Допуск совпадения времени с ключевым кадром, секунд
+KEYFRAME_EPSILON = 0.001
+# Кодеки с наборами параметров в extradata: части умной обрезки — в MPEG-TS (Annex B)
+ANNEXB_CODECS = {"h264", "hevc", "vvc"}
+# Строк ошибок декодирования в логе при неудачной проверке
+DECODE_ERROR_LINES = 5
+
+
+def probe_keyframes_near(ffprobe_path, input_file, targets, window=KEYFRAME_SEARCH_WINDOW):
+    """Времена ключевых кадров рядом с точками targets.
+
+    Читаются только пакеты (без декодирования) и только в окнах
+    target..target+window через -read_intervals, поэтому вызов быстрый
+    даже на многочасовых файлах.
+    """
+    if not targets:
+        return []
+    intervals = ','.join(f"{t:.3f}%+{window}" for t in targets)
+    result = subprocess.run(
+        [ffprobe_path, '-v', 'error', '-select_streams', 'v:0',
+         '-read_intervals', intervals,
+         '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', input_file],
+        capture_output=True, text=True, errors='replace', timeout=60
+    )
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) >= 2 and 'K' in parts[1]:
+            try:
+                keyframes.add(float(parts[0]))
+            except ValueError:
+                continue
+    return sorted(keyframes)
+
+
+def plan_chunks(start, duration, count, keyframes=None, min_chunk=MIN_CHUNK_SECONDS):
+    """Разбиение [start, start+duration) на не более count диапазонов.
+
+    Каждая внутренняя граница сдвигается на ближайший ключевой кадр, если
+    он известен. Возвращает список (начало, длительность) в секундах.
+    """
+    end = start + duration
+    count = max(1, min(int(count), int(duration // min_chunk) or 1))
+    bounds = [start]
+    for i in range(1, count):
+        target = start + duration * i / count
+        if keyframes:
+            target = min(keyframes, key=lambda k: abs(k - target))
+        if bounds[-1] + min_chunk <= target <= end - min_chunk:
+            bounds.append(target)
+    bounds.append(end)
+    return [(a, b - a) for a, b in zip(bounds, bounds[1:])]
+
+
+def write_concat_list(list_file, paths):
+    """Список файлов для concat-демуксера."""
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for path in paths:
+            # Экранирование одинарных кавычек по правилам concat-демуксера
+            f.write("file '{}'\n".format(path.replace("'", "'\\''")))
+
+
+def probe_cut_keyframes(ffprobe_path, input_file, start, end, window=KEYFRAME_SEARCH_WINDOW):
+    """Ключевые кадры у начала и перед концом диапазона обрезки."""
+    targets = [start]
+    if end - window > start + window:
+        targets.append(end - window)
+    return probe_keyframes_near(ffprobe_path, input_file, targets, window)
+
+
+def plan_smart_cut(start, end, keyframes, min_copy=MIN_SMART_COPY_SECONDS):
+    """Разбиение [start, end) на части (начало, длительность, копировать).
+
+    Середина — от первого ключевого кадра не раньше start до последнего не
+    позже end — копируется, неполные GOP по краям перекодируются. None, если
+    копировать почти нечего (ключевых кадров нет или они слишком близко).
+    """
+    inside = [k for k in keyframes if start - KEYFRAME_EPSILON <= k <= end + KEYFRAME_EPSILON]
+    if not inside or inside[-1] - inside[0] < min_copy:
+        return None
+    first, last = inside[0], min(inside[-1], end)
+    segments = []
+    if first - start > KEYFRAME_EPSILON:
+        segments.append((start, first - start, False))
+    segments.append((first, last - first, True))
+    if end - last > KEYFRAME_EPSILON:
+        segments.append((last, end - last, False))
+    return segments
+
+
+def build_smart_cut_commands(settings, ffmpeg_path, input_file, output_file, segments,
+                             source=None, write_list=True):
+    """Команды умной обрезки по плану plan_smart_cut: части по порядку и склейка.
+
+    Края кодируются тем же кодеком с битрейтом и pix_fmt исходника, чтобы
+    параметры потока совпадали с копируемой серединой; звук кодируется
+    одним проходом при склейке. Части H.264/HEVC/VVC — в MPEG-TS, чтобы
+    свои наборы параметров каждая часть несла в потоке (ANNEXB_CODECS);
+    результат стоит проверить check_decode. Возвращает (cmds, work_dir); work_dir —
+    папка частей рядом с результатом, удаляет её исполнитель (Job.work_dir).
+    write_list=False — не создавать папку и список (для --dry-run).
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    work_dir = os.path.join(out_dir, f"vvc_smartcut_{uuid.uuid4().hex[:12]}")
+    video = (source or {}).get('video') or {}
+    ext = '.ts' if video.get('codec') in ANNEXB_CODECS else os.path.splitext(output_file)[1] or '.mp4'
+    edge_settings = dict(settings, enable_trim=False, use_target_size=False, stream_copy=False)
+    bit_rate = video.get('bit_rate') or (source or {}).get('bit_rate')
+    if bit_rate:
+        edge_settings.update(use_crf=False, video_bitrate=f"{max(1, bit_rate // 1000)}k")
+
+    cmds, parts = [], []
+    for index, (start, duration, copy) in enumerate(segments):
+        part = os.path.join(work_dir, f"part_{index:03d}{ext}")
+        if copy:
+            cmd = build_segment_copy_command(ffmpeg_path, input_file, part, start, duration)
+        else:
+            cmd = build_ffmpeg_command(edge_settings, ffmpeg_path, input_file, part, start=start,
+                                       duration=duration, include_audio=False, source=source)
+            if video.get('pix_fmt'):
+                # Перед '-an -y <выход>'
+                cmd[-3:-3] = ['-pix_fmt', video['pix_fmt']]
+        cmds.append(cmd)
+        parts.append(part)
+
+    list_file = os.path.join(work_dir, 'parts.txt')
+    if write_list:
+        os.makedirs(work_dir, exist_ok=True)
+        write_concat_list(list_file, parts)
+    start, end = segments[0][0], segments[-1][0] + segments[-1][1]
+    cmds.append(build_concat_command(settings, ffmpeg_path, input_file, list_file, output_file,
+                                     start, end - start))
+    return cmds, work_dir
+
+
+def build_decode_check_command(ffmpeg_path, output_file):
+    """Полное декодирование видео результата; -xerror — выход с ошибкой на первом сбое."""
+    return [ffmpeg_path, '-v', 'error', '-xerror', '-i', output_file,
+            '-map', '0:v:0', '-f', 'null', '-']
+
+
+def check_decode(ffmpeg_path, output_file, on_start=None):
+    """Декодируется ли видео результата целиком (умная обрезка: стыки частей).
+
+    Возвращает (код возврата, строки ошибок); успех — 0 и пустой список.
+    on_start(process) — для остановки проверки извне.
+    """
+    lines = []
+    rc = run_ffmpeg(build_decode_check_command(ffmpeg_path, output_file),
+                    on_output=lines.append, on_start=on_start)
+    if rc == 0 and lines:
+        rc = 1
+    return rc, lines[:DECODE_ERROR_LINES]
+
+
+class ChunkedEncoder:
+    """Кодирование диапазонов параллельно и склейка concat-демуксером.
+
+    build_chunk_cmd(start, duration, output) — команда для одного фрагмента
+    (видео без звука), build_concat_cmd(list_file, output) — финальная
+    склейка. События уходят в on_event в формате ui_queue:
+    {'type': 'log', ...}; прогресс — через on_progress(секунды, текст),
+    on_start(process) — о каждом запущенном процессе (учёт процессорного времени).
+    """
+
+    def __init__(self, chunks, output_file, build_chunk_cmd, build_concat_cmd,
+                 on_event=None, on_progress=None, on_start=None):
+        self.chunks = chunks
+        self.output_file = output_file
+        self.build_chunk_cmd = build_chunk_cmd
+        self.build_concat_cmd = build_concat_cmd
+        self.on_event = on_event or (lambda event: None)
+        self.on_progress = on_progress or (lambda seconds, text: None)
+        self.on_start = on_start or (lambda process: None)
+        self._group = ProcessGroup()
+        self._done_seconds = [0.0] * len(chunks)
+
+    @property
+    def stopped(self):
+        return self._group.stopped
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def run(self):
+        """Выполнение в текущем потоке. Возвращает код возврата (0 — успех)."""
+        out_dir = os.path.dirname(os.path.abspath(self.output_file))
+        # Временная папка рядом с результатом: та же ФС, склейка без копирования
+        work_dir = tempfile.mkdtemp(prefix='vvc_chunks_', dir=out_dir)
+        ext = os.path.splitext(self.output_file)[1] or '.mp4'
+        try:
+            paths = [os.path.join(work_dir, f"chunk_{i:03d}{ext}") for i in range(len(self.chunks))]
+            self._log(f"Параллельное кодирование: фрагментов {len(self.chunks)}")
+            with cpu_budget.expect(len(self.chunks)), \
+                    ThreadPoolExecutor(max_workers=len(self.chunks)) as pool:
+                codes = list(pool.map(self._encode_chunk, range(len(self.chunks)), paths))
+            if self.stopped:
+                return -1
+            failed = [i for i, rc in enumerate(codes) if rc != 0]
+            if failed:
+                self._log(f"Ошибка кодирования фрагментов: {', '.join(str(i) for i in failed)}", "error")
+                return codes[failed[0]]
+
+            list_file = os.path.join(work_dir, 'chunks.txt')
+            write_concat_list(list_file, paths)
+            self.on_progress(sum(self._done_seconds), "Склейка фрагментов...")
+            cmd = self.build_concat_cmd(list_file, self.output_file)
+            self._log(f"Склейка: {' '.join(cmd)}")
+            return self._run(cmd, on_output=self._log)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _encode_chunk(self, index, path):
+        if self.stopped:
+            return -1
+        start, duration = self.chunks[index]
+        cmd = self.build_chunk_cmd(start, duration, path)
+        self._log(f"[фрагмент {index}] {' '.join(cmd)}")
+
+        def on_progress(record):
+            if record.out_time is not None:
+                self._done_seconds[index] = min(duration, record.out_time)
+                self.on_progress(sum(self._done_seconds), None)
+
+        # Вывод N параллельных процессов в лог не пишем — только хвост при ошибке
+        tail = collections.deque(maxlen=5)
+        rc = self._run(cmd, on_output=tail.append, on_progress=on_progress)
+        if rc != 0 and not self.stopped:
+            for line in tail:
+                self._log(f"[фрагмент {index}] {line}", "error")
+        if rc == 0:
+            self._done_seconds[index] = duration
+            self.on_progress(sum(self._done_seconds), None)
+        return rc
+
+    def _run(self, cmd, on_output=None, on_progress=None):
+        return self._group.run(cmd, on_output=on_output, on_progress=on_progress,
+                               on_start=self.on_start, budget=cpu_budget)
+
+    def stop(self):
+        """Остановка всех процессов без ожидания (vvc_jobs.ProcessGroup.stop)."""
+        return self._group.stop()
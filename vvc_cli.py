@@ -0,0 +1,426 @@
+"""Пакетная конвертация из командной строки без GUI.
+
+    python vvc.py --input "D:/capture/*.mkv" --codec libvvenc --crf 28 --jobs 4
+
+Настройки по умолчанию берутся из ffmpeg_converter_config.json (те же, что
+сохраняет окно), аргументы их переопределяют. Прогресс печатается в stdout
+по одной JSON-записи на строку. Модуль не импортирует tkinter/tkinterdnd2,
+поэтому работает на headless-узлах и из cron.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+from vvc_core import (VERSION, ConfigManager, CodecManager, FFmpegValidator,
+                      resolve_ffmpeg_paths, build_encode_commands, default_output_path, trim_range,
+                      smart_cut_supported, SCALERS, DEINTERLACE_FILTERS, PIXEL_FORMATS)
+from vvc_farm import farm_from_config
+from vvc_history import history_from_config
+from vvc_jobs import Job, JobQueue
+from vvc_metrics import metrics_from_config
+from vvc_probe import get_media_info, media_duration, media_frames
+from vvc_supervisor import supervisor
+
+# Минимальный интервал между записями прогресса одного задания, секунд
+PROGRESS_INTERVAL = 0.5
+
+
+def _validated(validator):
+    """Обёртка FFmpegValidator.* для argparse: ValueError → понятная ошибка."""
+    def check(value):
+        try:
+            validator(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+        return value
+    return check
+
+
+def _resolution(value):
+    """Разрешение WxH или source — без масштабирования."""
+    if value.lower() == 'source':
+        return 'source'
+    return _validated(FFmpegValidator.validate_resolution)(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="vvc.py",
+        description="FFmpeg Video Converter — пакетная конвертация без GUI.")
+    parser.add_argument('--version', action='version', version=VERSION)
+    parser.add_argument('-i', '--input', action='append', required=True, metavar='PATH',
+                        help="входной файл или glob-маска (можно указать несколько раз)")
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help="выходной файл (для одного входа) или папка; "
+                             "по умолчанию <имя>_converted.mp4 рядом с исходником")
+    parser.add_argument('--codec', help="видеокодек, например libvvenc, libx265")
+    parser.add_argument('--preset', choices=["faster", "fast", "medium", "slow", "slower"])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--crf', type=_validated(FFmpegValidator.validate_quality),
+                      help="постоянное качество (CRF/QP 0-51)")
+    mode.add_argument('--bitrate', type=_validated(FFmpegValidator.validate_bitrate),
+                      help="битрейт видео, например 384k, 2M")
+    mode.add_argument('--auto-crf', metavar='TARGET',
+                      help="подобрать наибольший CRF, при котором качество не ниже цели "
+                           "(SSIM, например 0.98, или PSNR с --metric psnr)")
+    mode.add_argument('--target-size', type=_validated(FFmpegValidator.validate_target_size),
+                      metavar='MB', help="размер результата в МБ: битрейт по длительности, два прохода")
+    parser.add_argument('--metric', choices=['ssim', 'psnr'], default='ssim',
+                        help="метрика для --auto-crf (по умолчанию ssim)")
+    parser.add_argument('--resolution', type=_resolution,
+                        help="разрешение, например 1920x1080, или source — как у исходника "
+                             "(по умолчанию resolution_mode из конфигурации)")
+    parser.add_argument('--fps', type=_validated(FFmpegValidator.validate_fps))
+    parser.add_argument('--scaler', choices=SCALERS,
+                        help="алгоритм масштабирования (fast_bilinear — черновики, lanczos — мастер-копии)")
+    parser.add_argument('--crop', type=_validated(FFmpegValidator.validate_crop), metavar='W:H[:X:Y]',
+                        help="кадрирование исходного кадра до масштабирования")
+    parser.add_argument('--deinterlace', choices=[f for f in DEINTERLACE_FILTERS if f])
+    parser.add_argument('--pix-fmt', choices=[f for f in PIXEL_FORMATS if f],
+                        help="пиксельный формат результата, например yuv420p10le")
+    parser.add_argument('--filter-threads', type=int, metavar='N',
+                        help="потоков графа фильтров (-filter_threads)")
+    parser.add_argument('--audio-codec')
+    parser.add_argument('--audio-bitrate', type=_validated(FFmpegValidator.validate_bitrate))
+    parser.add_argument('--no-copy', action='store_true',
+                        help="всегда перекодировать, даже если поток можно скопировать")
+    parser.add_argument('--hw', choices=["ЦП (Программное)"] + list(CodecManager.HW_MAP),
+                        help="аппаратное ускорение")
+    parser.add_argument('--trim-start', type=_validated(FFmpegValidator.validate_timestamp),
+                        metavar='HH:MM:SS')
+    parser.add_argument('--trim-end', type=_validated(FFmpegValidator.validate_timestamp),
+                        metavar='HH:MM:SS')
+    parser.add_argument('--smart-cut', action='store_true',
+                        help="при обрезке в том же кодеке перекодировать только края, "
+                             "середину копировать")
+    parser.add_argument('--resumable', action='store_true',
+                        help="кодировать сегментами в <выход>.parts; повторный запуск "
+                             "продолжит с первого незавершённого сегмента")
+    parser.add_argument('--segment-seconds', type=int, metavar='N',
+                        help="длительность сегмента для --resumable (по умолчанию 120)")
+    parser.add_argument('-j', '--jobs', type=int, help="число одновременных процессов ffmpeg")
+    parser.add_argument('--config', default="ffmpeg_converter_config.json",
+                        help="файл конфигурации с настройками по умолчанию")
+    parser.add_argument('--ffmpeg', help="путь к ffmpeg (перекрывает конфигурацию)")
+    parser.add_argument('--ffprobe', help="путь к ffprobe")
+    parser.add_argument('--progress', choices=['json', 'text', 'none'], default='json',
+                        help="формат вывода прогресса (по умолчанию json)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="только напечатать команды ffmpeg")
+    parser.add_argument('--forecast', action='store_true',
+                        help="закодировать несколько коротких образцов и напечатать прогноз "
+                             "размера и времени, не выполняя конвертацию")
+    parser.add_argument('--no-history', action='store_true',
+                        help="не записывать задания в историю (vvc_history.py)")
+    parser.add_argument('--metrics-textfile', metavar='PATH',
+                        help="метрики Prometheus для node_exporter (textfile collector)")
+    parser.add_argument('--metrics-jsonl', metavar='PATH', help="поток событий заданий в JSONL")
+    parser.add_argument('--farm', action='append', metavar='HOST:PORT',
+                        help="агент фермы кодирования (vvc_farm.py); можно несколько, "
+                             "по умолчанию — farm_workers из конфигурации")
+    parser.add_argument('--farm-token', help="токен агентов фермы (перекрывает farm_token)")
+    return parser
+
+
+def expand_inputs(patterns):
+    """Раскрытие glob-масок; несуществующие пути без масок остаются как есть,
+    чтобы ошибка была видна в отчёте."""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and not glob.has_magic(pattern):
+            matches = [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                continue
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def settings_from_args(config, args):
+    """Настройки из конфигурации с переопределением аргументами."""
+    settings = dict(config)
+    overrides = {
+        "video_codec": args.codec,
+        "video_preset": args.preset,
+        "video_fps": args.fps,
+        "video_scaler": args.scaler,
+        "video_crop": args.crop,
+        "deinterlace": args.deinterlace,
+        "pix_fmt": args.pix_fmt,
+        "filter_threads": args.filter_threads,
+        "audio_codec": args.audio_codec,
+        "audio_bitrate": args.audio_bitrate,
+        "hw_accel": args.hw,
+    }
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    if args.resolution == 'source':
+        settings["resolution_mode"] = "Исходное"
+    elif args.resolution is not None:
+        settings.update(resolution_mode="Особое", video_resolution=args.resolution)
+    if args.no_copy:
+        settings["stream_copy"] = False
+    if args.target_size is not None:
+        settings.update(use_target_size=True, target_size=args.target_size)
+    elif any(v is not None for v in (args.auto_crf, args.crf, args.bitrate)):
+        settings["use_target_size"] = False
+    if args.auto_crf is not None:
+        settings.update(use_crf=True, auto_quality=True, quality_metric=args.metric,
+                        quality_target=args.auto_crf)
+    elif args.crf is not None:
+        settings.update(use_crf=True, auto_quality=False, video_quality=args.crf)
+    elif args.bitrate is not None:
+        settings.update(use_crf=False, auto_quality=False, video_bitrate=args.bitrate)
+    if args.trim_start is not None or args.trim_end is not None:
+        settings["enable_trim"] = True
+        if args.trim_start is not None:
+            settings["trim_start"] = args.trim_start
+        if args.trim_end is not None:
+            settings["trim_end"] = args.trim_end
+    if args.smart_cut:
+        settings["smart_cut"] = True
+    if args.resumable:
+        settings["resumable"] = True
+    if args.segment_seconds:
+        settings["segment_seconds"] = args.segment_seconds
+    return settings
+
+
+def output_for(input_file, output, single):
+    if not output:
+        return default_output_path(input_file)
+    if os.path.isdir(output) or output.endswith(('/', os.sep)) or not single:
+        os.makedirs(output, exist_ok=True)
+        return default_output_path(input_file, output)
+    return output
+
+
+class ProgressPrinter:
+    """Вывод событий очереди в stdout (JSON-строки или текст)."""
+
+    def __init__(self, mode, stream=None):
+        self.mode = mode
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def emit(self, record):
+        if self.mode == 'none':
+            return
+        with self._lock:
+            if self.mode == 'json':
+                self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                self.stream.write(' '.join(f"{k}={v}" for k, v in record.items()) + '\n')
+            self.stream.flush()
+
+    def on_event(self, event):
+        if event['type'] == 'job':
+            job = event['job']
+            now = time.monotonic()
+            if job.status == Job.RUNNING and now - self._last.get(job.id, 0) < PROGRESS_INTERVAL:
+                return
+            self._last[job.id] = now
+            record = {'event': 'job', 'id': job.id, 'input': job.input_file,
+                      'output': job.output_file, 'status': job.status,
+                      'progress': round(job.progress, 1)}
+            if job.status == Job.RUNNING and job.last_progress is not None:
+                p = job.last_progress
+                record.update(frame=p.frame, fps=p.fps, out_time=p.out_time,
+                              total_size=p.total_size, speed=p.speed)
+            if job.status == Job.RUNNING and job.eta is not None:
+                estimate = job.eta.estimate()
+                if estimate:
+                    record.update(eta=round(estimate[0]), eta_low=round(estimate[1]),
+                                  eta_high=round(estimate[2]))
+            self.emit(record)
+        elif event['type'] == 'queue_eta' and event['eta']:
+            remaining, low, high = event['eta']
+            self.emit({'event': 'queue_eta', 'eta': round(remaining), 'eta_low': round(low),
+                       'eta_high': round(high)})
+        elif event['type'] == 'log' and event['level'] in ('error', 'warning'):
+            self.emit({'event': 'log', 'level': event['level'], 'message': event['message']})
+
+
+def search_crf(settings, ffmpeg_path, input_file, source, printer):
+    """Подбор CRF для одного входа (vvc_quality.CrfSearch). Возвращает настройки с найденным CRF."""
+    from vvc_quality import CrfSearch, plan_samples
+    trim = trim_range(settings)
+    start, duration = trim if trim else (0.0, media_duration(source))
+    if not duration:
+        printer.emit({'event': 'log', 'level': 'warning',
+                      'message': f"{input_file}: длительность неизвестна, подбор CRF пропущен"})
+        return settings
+    search = CrfSearch(settings, ffmpeg_path, input_file, plan_samples(start, duration),
+                       metric=settings["quality_metric"], target=settings["quality_target"],
+                       source=source,
+                       on_step=lambda crf, score: printer.emit({
+                           'event': 'auto_crf', 'input': input_file, 'crf': crf,
+                           'metric': settings["quality_metric"], 'score': round(score, 4)}))
+    try:
+        crf, score = search.run()
+    except KeyboardInterrupt:
+        search.stop()
+        raise
+    printer.emit({'event': 'auto_crf', 'input': input_file, 'crf': crf, 'selected': True,
+                  'metric': settings["quality_metric"], 'score': round(score, 4)})
+    return dict(settings, video_quality=str(crf))
+
+
+def forecast_file(settings, ffmpeg_path, input_file, output_file, source, printer):
+    """Прогноз размера и времени для одного входа (vvc_forecast.Forecast)."""
+    from vvc_forecast import Forecast
+    trim = trim_range(settings)
+    start, duration = trim if trim else (0.0, media_duration(source))
+    if not duration:
+        raise ValueError("длительность неизвестна, прогноз невозможен")
+    forecast = Forecast(settings, ffmpeg_path, input_file, output_file, start, duration,
+                        source=source, on_event=printer.on_event)
+    try:
+        result = forecast.run()
+    except KeyboardInterrupt:
+        forecast.stop()
+        raise
+    printer.emit(dict({'event': 'forecast', 'input': input_file, 'output': output_file,
+                       'duration': round(duration, 3)},
+                      **{k: round(v, 3) if isinstance(v, float) else v for k, v in result.items()}))
+
+
+def smart_cut_commands(settings, ffmpeg_path, ffprobe_path, input_file, output_file, source,
+                       dry_run=False):
+    """Команды умной обрезки (vvc_chunks) или None, если копировать нечего."""
+    from vvc_chunks import build_smart_cut_commands, plan_smart_cut, probe_cut_keyframes
+    start, duration = trim_range(settings)
+    keyframes = probe_cut_keyframes(ffprobe_path, input_file, start, start + duration)
+    segments = plan_smart_cut(start, start + duration, keyframes)
+    if segments is None:
+        return None
+    return build_smart_cut_commands(settings, ffmpeg_path, input_file, output_file, segments,
+                                    source, write_list=not dry_run)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = ConfigManager(args.config).load()
+    settings = settings_from_args(config, args)
+    if settings.get("use_crf") and settings.get("auto_quality"):
+        from vvc_quality import validate_target
+        try:
+            validate_target(settings["quality_metric"], settings["quality_target"])
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    ffmpeg_path, ffprobe_path = resolve_ffmpeg_paths(config)
+    ffmpeg_path = args.ffmpeg or ffmpeg_path
+    ffprobe_path = args.ffprobe or ffprobe_path
+
+    inputs = expand_inputs(args.input)
+    if not inputs:
+        print("Не найдено ни одного входного файла", file=sys.stderr)
+        return 2
+    if args.output and len(inputs) > 1 and os.path.isfile(args.output):
+        print("Для нескольких входных файлов --output должен быть папкой", file=sys.stderr)
+        return 2
+
+    printer = ProgressPrinter(args.progress)
+    done_event = threading.Event()
+    cpu_report = {}
+
+    def on_event(event):
+        if event['type'] == 'queue_done':
+            cpu_report.update(event.get('cpu') or {})
+            done_event.set()
+        else:
+            printer.on_event(event)
+
+    supervisor.configure(config)
+    queue = JobQueue(workers=args.jobs or config.get("max_workers", 1), on_event=on_event,
+                     probe_duration=lambda path: media_duration(get_media_info(ffprobe_path, path)),
+                     probe_frames=lambda path: media_frames(get_media_info(ffprobe_path, path)),
+                     history=None if args.no_history or args.dry_run or args.forecast
+                     else history_from_config(config),
+                     metrics=None if args.dry_run or args.forecast else metrics_from_config(
+                         config, args.metrics_textfile, args.metrics_jsonl, on_event=on_event),
+                     farm=None if args.dry_run or args.forecast else farm_from_config(
+                         dict(config, farm_token=args.farm_token or config.get("farm_token")),
+                         args.farm))
+    errors = 0
+    for input_file in inputs:
+        output_file = output_for(input_file, args.output, len(inputs) == 1)
+        try:
+            # Сведения кэшируются — рабочий поток возьмёт длительность оттуда же
+            source = get_media_info(ffprobe_path, input_file)
+            job_settings = settings
+            if (settings.get("use_crf") and settings.get("auto_quality")
+                    and not settings.get("use_target_size") and not args.dry_run):
+                job_settings = search_crf(settings, ffmpeg_path, input_file, source, printer)
+            if args.forecast:
+                forecast_file(job_settings, ffmpeg_path, input_file, output_file, source, printer)
+                continue
+            planned = None
+            if smart_cut_supported(job_settings, source, output_file):
+                planned = smart_cut_commands(job_settings, ffmpeg_path, ffprobe_path, input_file,
+                                             output_file, source, args.dry_run)
+            cmds, work_dir = planned or build_encode_commands(job_settings, ffmpeg_path, input_file,
+                                                              output_file, source=source)
+            trim = trim_range(settings)
+        except KeyboardInterrupt:
+            return 130
+        except (ValueError, OSError, RuntimeError) as e:
+            printer.emit({'event': 'log', 'level': 'error', 'message': f"{input_file}: {e}"})
+            errors += 1
+            continue
+        resumable = None
+        if job_settings.get("resumable") and not planned:
+            from vvc_resume import resumable_for
+            resumable = resumable_for(job_settings, ffmpeg_path, input_file, output_file, source,
+                                      on_event=on_event)
+        if args.dry_run:
+            if resumable:
+                print(f"# сегменты по {resumable.segment_seconds:g} с в {resumable.work_dir}")
+            print('\n'.join(' '.join(cmd) for cmd in cmds))
+            continue
+        job = Job(input_file, output_file, cmds[-1], duration=trim[1] if trim else None,
+                  passes=cmds, work_dir=work_dir)
+        job.resumable = resumable
+        if planned:
+            job.mode = 'smart_cut'
+        if settings.get("use_target_size"):
+            job.target_size = settings["target_size"]
+        queue.add(job)
+
+    if args.dry_run or not queue.jobs():
+        return 1 if errors else 0
+
+    started = time.time()
+    if queue.metrics:
+        queue.metrics.start()
+    queue.start()
+    try:
+        while not done_event.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        queue.stop()
+        done_event.wait(10)
+        return 130
+    finally:
+        if queue.metrics:
+            queue.metrics.stop()
+
+    done = sum(1 for j in queue.jobs() if j.status == Job.DONE)
+    failed = len(queue.jobs()) - done + errors
+    summary = {'event': 'summary', 'done': done, 'failed': failed,
+               'elapsed': round(time.time() - started, 1)}
+    if cpu_report.get('utilization') is not None:
+        summary.update(cores=cpu_report['cores'], cpu_utilization=cpu_report['utilization'])
+    printer.emit(summary)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
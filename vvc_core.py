@@ -0,0 +1,773 @@
+"""Модель настроек и построение команд FFmpeg без зависимости от Tkinter.
+
+Настройки — обычный словарь с теми же ключами, что и в конфигурации
+(ConfigManager.default_config). Его заполняет либо окно (FFmpegConverter.
+collect_settings), либо командная строка (vvc_cli), поэтому одна и та же
+команда строится в GUI и на headless-узлах.
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import uuid
+
+# Версия приложения
+VERSION = "v0.21"
+
+# Режим без аппаратного ускорения. "CPU (Программное)" — старое значение,
+# которое могло сохраниться в конфигурации.
+CPU_MODES = ("ЦП (Программное)", "CPU (Программное)")
+
+# Карта: текстовый пресет → числовое значение скорости для каждого кодека
+SPEED_MAP = {
+    'libaom-av1':  {'faster': 6, 'fast': 4, 'medium': 2, 'slow': 1, 'slower': 0},
+    'librav1e':    {'faster': 8, 'fast': 6, 'medium': 4, 'slow': 2, 'slower': 1},
+    'libvpx-vp9':  {'faster': 5, 'fast': 4, 'medium': 2, 'slow': 1, 'slower': 0},
+}
+
+# Режим «Размер файла»: доля размера на контейнер (заголовки, индексы),
+# допустимое отклонение результата от цели и нижняя граница битрейта видео
+MUX_OVERHEAD = 0.02
+TARGET_SIZE_TOLERANCE = 0.05
+MIN_VIDEO_KBPS = 16
+
+# Кодеки с двухпроходным контролем битрейта
+TWO_PASS_CODECS = ("libx264", "libx265", "libvvenc", "libaom-av1", "librav1e", "libvpx-vp9")
+
+# Имена кодеков в ffprobe для энкодеров — для сравнения с исходными потоками
+ENCODER_CODEC_NAMES = {
+    "libvvenc": "vvc", "libx265": "hevc", "libx264": "h264", "librav1e": "av1",
+    "libaom-av1": "av1", "libvpx-vp9": "vp9",
+    "libopus": "opus", "aac": "aac", "libvorbis": "vorbis", "ac3": "ac3",
+}
+# Кодеки, которые контейнер принимает без перекодирования (нет в словаре — любые)
+CONTAINER_CODECS = {
+    ".mp4": {"vvc", "hevc", "h264", "av1", "vp9", "opus", "aac", "ac3"},
+    ".webm": {"av1", "vp9", "opus", "vorbis"},
+}
+# Запас, в пределах которого битрейт исходника считается «не выше целевого»
+COPY_BITRATE_SLACK = 1.1
+
+# Алгоритмы масштабирования swscale (flags фильтра scale): fast_bilinear —
+# черновики, lanczos — мастер-копии; bicubic — умолчание ffmpeg
+SCALERS = ("fast_bilinear", "bilinear", "bicubic", "spline", "lanczos")
+DEFAULT_SCALER = "bicubic"
+# Фильтры деинтерлейса ("" — без деинтерлейса)
+DEINTERLACE_FILTERS = ("", "yadif", "bwdif")
+# Пиксельные форматы результата ("" — как у исходника/по выбору энкодера)
+PIXEL_FORMATS = ("", "yuv420p", "yuv420p10le", "yuv422p10le", "yuv444p10le")
+
+# Классы разрешений для настроек параллелизма libvvenc (vvc_tune):
+# класс → наибольшее число пикселей кадра; последний — всё, что больше
+RESOLUTION_CLASSES = (("sd", 720 * 576), ("hd", 1280 * 720), ("fhd", 1920 * 1080), ("uhd", None))
+
+class ConfigManager:
+    """Управление настройками приложения"""
+    def __init__(self, config_file="ffmpeg_converter_config.json"):
+        self.config_file = config_file
+        self.default_config = {
+            "use_local_ffmpeg": False,
+            "ffmpeg_path": "ffmpeg",
+            "hw_accel": "ЦП (Программное)",
+            "last_input_dir": "",
+            "last_output_dir": "",
+            "video_codec": "libvvenc",
+            "video_preset": "medium",
+            "video_bitrate": "384k",
+            "resolution_mode": "Исходное",
+            "video_resolution": "1280x720",
+            "video_quality": "25",
+            "video_fps": "30",
+            "audio_codec": "libopus",
+            "audio_bitrate": "64k",
+            "use_crf": False,
+            "stream_copy": True,
+            "use_target_size": False,
+            "target_size": "50",
+            "auto_quality": False,
+            "quality_metric": "ssim",
+            "quality_target": "0.98",
+            "show_all_video_codecs": False,
+            "show_all_audio_codecs": False,
+            "enable_trim": False,
+            "smart_cut": False,
+            "trim_start": "00:00:00",
+            "trim_end": "00:00:00",
+            "max_workers": 1,
+            "parallel_chunks": False,
+            "chunk_count": 4,
+            "resumable": False,
+            "segment_seconds": 120,
+            "vvenc_tuning": {},
+            "video_scaler": DEFAULT_SCALER,
+            "video_crop": "",
+            "deinterlace": "",
+            "pix_fmt": "",
+            "filter_threads": 0,
+            "watch_enabled": False,
+            "watch_folders": [],
+            "profiles": {},
+            "watch_stable_seconds": 5,
+            "history_enabled": True,
+            "history_path": "",
+            "metrics_textfile": "",
+            "metrics_jsonl": "",
+            "metrics_interval": 15,
+            "ffmpeg_idle_timeout": 0,
+            "farm_workers": [],
+            "farm_token": "",
+            "log_max_lines": 5000,
+            "log_level": "info"
+        }
+
+    def load(self):
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                return {**self.default_config, **config}
+        except Exception as e:
+            print(f"Ошибка загрузки конфигурации: {e}", file=sys.stderr)
+        return self.default_config.copy()
+
+    def save(self, config):
+        try:
+            with open(self.config_file, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=4, ensure_ascii=False)
+        except Exception as e:
+            print(f"Ошибка сохранения конфигурации: {e}", file=sys.stderr)
+
+class CodecManager:
+    """Управление кодеками и их отображением"""
+    CODEC_DISPLAY_NAMES = {
+        "libvvenc": "H.266 (VVC/libvvenc)",
+        "libx265": "H.265 (HEVC/libx265)",
+        "librav1e": "AV1 (librav1e)",
+        "libvpx-vp9": "VP9 (libvpx-vp9)",
+        "libaom-av1": "AV1 (libaom-av1)",
+        "libopus": "Opus (libopus)",
+        "aac": "AAC",
+        "libvorbis": "Vorbis (libvorbis)",
+        "ac3": "AC3"
+    }
+
+    VIDEO_CODECS = ["libvvenc", "libx265", "librav1e", "libvpx-vp9", "libaom-av1"]
+    AUDIO_CODECS = ["libopus", "aac", "libvorbis", "ac3"]
+
+    # Карта соответствия программных кодеков аппаратным
+    HW_MAP = {
+        "NVIDIA (NVENC)": {
+            "libx264": "h264_nvenc",
+            "libx265": "hevc_nvenc",
+            "librav1e": "av1_nvenc",
+            "libaom-av1": "av1_nvenc"
+        },
+        "AMD (AMF)": {
+            "libx264": "h264_amf",
+            "libx265": "hevc_amf",
+            "librav1e": "av1_amf",
+            "libaom-av1": "av1_amf"
+        },
+        "Intel (QSV)": {
+            "libx264": "h264_qsv",
+            "libx265": "hevc_qsv",
+            "librav1e": "av1_qsv",
+            "libaom-av1": "av1_qsv",
+            "libvpx-vp9": "vp9_qsv"
+        }
+    }
+
+    @staticmethod
+    def get_display_name(codec):
+        return CodecManager.CODEC_DISPLAY_NAMES.get(codec, codec)
+
+    @staticmethod
+    def get_tech_name(display_name):
+        for tech, disp in CodecManager.CODEC_DISPLAY_NAMES.items():
+            if disp == display_name:
+                return tech
+        return display_name
+
+class FFmpegValidator:
+    """Валидация параметров FFmpeg"""
+    @staticmethod
+    def validate_file_path(path, must_exist=True):
+        if not path:
+            raise ValueError("Путь к файлу не указан")
+        if must_exist and not os.path.exists(path):
+            raise FileNotFoundError(f"Файл не найден: {path}")
+        return True
+
+    @staticmethod
+    def validate_bitrate(bitrate):
+        pattern = r'^\d+[kKmM]$'
+        if not re.match(pattern, bitrate):
+            raise ValueError(f"Неверный формат битрейта: {bitrate}. Используйте формат: 384k, 2M")
+        return True
+
+    @staticmethod
+    def validate_resolution(resolution):
+        pattern = r'^\d+x\d+$'
+        if not re.match(pattern, resolution):
+            raise ValueError(f"Неверный формат разрешения: {resolution}. Используйте формат: 1280x720")
+        return True
+
+    @staticmethod
+    def validate_fps(fps):
+        try:
+            fps_value = float(fps)
+            if fps_value <= 0 or fps_value > 300:
+                raise ValueError("FPS должен быть в диапазоне 1-300")
+            return True
+        except ValueError:
+            raise ValueError(f"Неверное значение FPS: {fps}")
+
+    @staticmethod
+    def validate_quality(quality):
+        try:
+            quality_value = int(quality)
+            if quality_value < 0 or quality_value > 51:
+                raise ValueError("Качество (CRF) должно быть в диапазоне 0-51")
+            return True
+        except ValueError:
+            raise ValueError(f"Неверное значение качества: {quality}")
+
+    @staticmethod
+    def validate_target_size(size):
+        try:
+            size_value = float(size)
+        except (TypeError, ValueError):
+            raise ValueError(f"Неверный размер файла: {size}. Укажите число мегабайт, например 50")
+        if size_value <= 0:
+            raise ValueError("Размер файла должен быть больше нуля")
+        return True
+
+    @staticmethod
+    def validate_crop(crop):
+        pattern = r'^\d+:\d+(:\d+:\d+)?$'
+        if not re.match(pattern, crop):
+            raise ValueError(f"Неверный формат кадрирования: {crop}. Используйте формат: "
+                             "ширина:высота[:x:y], например 1920:800:0:140")
+        return True
+
+    @staticmethod
+    def validate_timestamp(timestamp):
+        pattern = r'^(\d{1,2}:)?(\d{1,2}:)?\d{1,2}(\.\d+)?$'
+        if not re.match(pattern, timestamp):
+            raise ValueError(f"Неверный формат времени: {timestamp}. Используйте формат: HH:MM:SS")
+        return True
+
+
+def get_app_dir():
+    """Папка программы (рядом с exe для собранной версии)."""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def get_cache_dir():
+    """Папка кэшей пользователя (зонды ffmpeg/ffprobe, миниатюры)."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'vvc_converter')
+
+
+def get_data_dir():
+    """Папка данных пользователя (история заданий)."""
+    if os.name == 'nt':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'vvc_converter')
+
+
+def resolve_ffmpeg_paths(config, app_dir=None):
+    """Рабочие пути (ffmpeg, ffprobe): локальные из папки программы или системные."""
+    app_dir = app_dir or get_app_dir()
+    local_ffmpeg = os.path.join(app_dir, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+    local_ffprobe = os.path.join(app_dir, 'ffprobe.exe' if os.name == 'nt' else 'ffprobe')
+    if config.get("use_local_ffmpeg", False) and os.path.exists(local_ffmpeg):
+        return local_ffmpeg, local_ffprobe
+    return config.get("ffmpeg_path", "ffmpeg"), "ffprobe"
+
+
+def normalize_bitrate(bitrate):
+    bitrate = bitrate.strip()
+    if bitrate and bitrate[-1].lower() not in ['k', 'm'] and bitrate.isdigit():
+        return bitrate + 'k'
+    return bitrate
+
+
+def bitrate_to_kbps(bitrate):
+    """'64k' → 64, '2M' → 2000."""
+    value = normalize_bitrate(str(bitrate))
+    multiplier = 1000 if value[-1].lower() == 'm' else 1
+    return float(value[:-1]) * multiplier
+
+
+def timestamp_to_seconds(timestamp):
+    """Конвертация HH:MM:SS / MM:SS / SS в секунды (fix #9 helper)."""
+    parts = timestamp.split(':')
+    if len(parts) == 3:
+        h, m, s = map(float, parts)
+        return h * 3600 + m * 60 + s
+    elif len(parts) == 2:
+        m, s = map(float, parts)
+        return m * 60 + s
+    return float(parts[0])
+
+
+def seconds_to_timestamp(seconds):
+    """Конвертация секунд в HH:MM:SS (fix #9 helper)."""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def format_time(seconds):
+    """HH:MM:SS или MM:SS."""
+    if seconds < 0:
+        return "00:00"
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    return f"{h:02d}:{m:02d}:{s:02d}" if h > 0 else f"{m:02d}:{s:02d}"
+
+
+def get_actual_video_codec(settings):
+    """Возвращает кодек с учетом аппаратного ускорения"""
+    base_codec = settings["video_codec"]
+    hw_mode = settings.get("hw_accel", CPU_MODES[0])
+    if hw_mode in CPU_MODES:
+        return base_codec
+    return CodecManager.HW_MAP.get(hw_mode, {}).get(base_codec, base_codec)
+
+
+def trim_range(settings):
+    """(начало, длительность) обрезки в секундах или None, если обрезка выключена."""
+    if not settings.get("enable_trim"):
+        return None
+    FFmpegValidator.validate_timestamp(settings["trim_start"])
+    FFmpegValidator.validate_timestamp(settings["trim_end"])
+    start_s = timestamp_to_seconds(settings["trim_start"])
+    end_s = timestamp_to_seconds(settings["trim_end"])
+    if end_s <= start_s:
+        raise ValueError("Время конца должно быть позже времени начала")
+    return start_s, end_s - start_s
+
+
+def target_video_bitrate(target_mb, duration, audio_kbps=0):
+    """Битрейт видео (кбит/с), при котором файл длительностью duration секунд
+    уложится в target_mb мегабайт (МБ = 1024×1024 байт, как в окне) вместе со звуком."""
+    total_kbits = float(target_mb) * 1024 * 1024 * 8 / 1000 * (1 - MUX_OVERHEAD)
+    video_kbps = total_kbits / duration - audio_kbps
+    if video_kbps < MIN_VIDEO_KBPS:
+        raise ValueError(f"Размер {target_mb} МБ слишком мал для {format_time(duration)}: "
+                         f"на видео остаётся {video_kbps:.0f} кбит/с")
+    return int(video_kbps)
+
+
+def apply_target_size(settings, duration):
+    """Настройки для режима «Размер файла»: битрейт видео рассчитан по цели."""
+    FFmpegValidator.validate_target_size(settings["target_size"])
+    if not duration or duration <= 0:
+        raise ValueError("Для режима «Размер файла» нужна длительность видео")
+    kbps = target_video_bitrate(settings["target_size"], duration,
+                                bitrate_to_kbps(settings["audio_bitrate"]))
+    return dict(settings, use_crf=False, video_bitrate=f"{kbps}k")
+
+
+def check_target_size(output_file, target_mb):
+    """(размер результата в МБ, отклонение от цели в долях) или None, если файла нет."""
+    try:
+        size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    except OSError:
+        return None
+    return size_mb, size_mb / float(target_mb) - 1
+
+
+def two_pass_args(codec, pass_num, log_prefix):
+    """Флаги прохода pass_num (1 или 2) с журналом статистики log_prefix.
+
+    x265 и vvenc принимают проход и файл статистики через собственные
+    параметры (разделитель — двоеточие, поэтому оно в пути экранируется).
+    """
+    escaped = log_prefix.replace('\\', '/').replace(':', '\\:')
+    if codec == 'libx265':
+        return ['-x265-params', f"pass={pass_num}:stats={escaped}.log"]
+    if codec == 'libvvenc':
+        return ['-vvenc-params', f"passes=2:pass={pass_num}:rcstatsfile={escaped}.json"]
+    return ['-pass', str(pass_num), '-passlogfile', log_prefix]
+
+
+def copy_streams(settings, source, output_file, trimmed=False):
+    """Потоки, которые можно скопировать без перекодирования: множество из 'video'/'audio'.
+
+    Звук копируется, если исходная дорожка в том же кодеке, битрейт не выше
+    целевого (или неизвестен) и число каналов подходит. Видео — если кодек тот
+    же, разрешение и частота кадров не меняются, обрезки нет (копирование
+    режет только по ключевым кадрам) и в режиме битрейта исходный битрейт не
+    выше целевого; в режимах CRF и «Размер файла» видео всегда кодируется.
+    Всё — при условии, что контейнер результата принимает этот кодек.
+    """
+    if not source or not settings.get("stream_copy", True):
+        return set()
+    allowed = CONTAINER_CODECS.get(os.path.splitext(output_file)[1].lower())
+    result = set()
+
+    audio = source.get('audio') or []
+    audio_codec = ENCODER_CODEC_NAMES.get(settings["audio_codec"])
+    if len(audio) == 1 and audio[0].get('codec') == audio_codec and (allowed is None or audio_codec in allowed):
+        target_kbps = bitrate_to_kbps(settings["audio_bitrate"])
+        bit_rate = audio[0].get('bit_rate')
+        channels = audio[0].get('channels') or 0
+        if ((bit_rate is None or bit_rate / 1000 <= target_kbps * COPY_BITRATE_SLACK)
+                and not (audio_codec == 'opus' and channels > 2)):
+            result.add('audio')
+
+    video = source.get('video')
+    codec = get_actual_video_codec(settings)
+    video_codec = ENCODER_CODEC_NAMES.get(codec)
+    if (video and video.get('codec') == video_codec and not trimmed
+            and not settings["use_crf"] and not settings.get("use_target_size")
+            and (allowed is None or video_codec in allowed)
+            and not video_geometry_args(settings, source)):
+        bit_rate = video.get('bit_rate') or source.get('bit_rate')
+        if bit_rate and bit_rate / 1000 <= bitrate_to_kbps(settings["video_bitrate"]) * COPY_BITRATE_SLACK:
+            result.add('video')
+    return result
+
+
+def describe_copy(copied):
+    """Подпись для окна: какие потоки копируются без перекодирования."""
+    names = [name for key, name in (('video', "видео"), ('audio', "аудио")) if key in copied]
+    return ", ".join(names) if names else "нет"
+
+
+def audio_args(settings):
+    args = ['-c:a', settings["audio_codec"], '-b:a', normalize_bitrate(settings["audio_bitrate"])]
+    if settings["audio_codec"] == 'libopus': args.extend(['-ac', '2'])
+    return args
+
+
+def crop_size(settings):
+    """(ширина, высота) кадрирования video_crop или None, если оно не задано."""
+    crop = str(settings.get("video_crop") or "").strip()
+    if not crop:
+        return None
+    FFmpegValidator.validate_crop(crop)
+    width, height = crop.split(':')[:2]
+    return int(width), int(height)
+
+
+def video_filters(settings, source=None):
+    """Цепочка видеофильтров: кадрирование → деинтерлейс → масштабирование → формат.
+
+    Масштабирование и перевод в pix_fmt стоят рядом, поэтому ffmpeg выполняет
+    их одним проходом swscale с выбранным алгоритмом (video_scaler) — вместо
+    -s с алгоритмом по умолчанию. Фильтр не добавляется, если ничего не
+    меняет: разрешение после кадрирования уже равно целевому, pix_fmt
+    совпадает с исходником.
+    """
+    video = (source or {}).get('video') or {}
+    filters = []
+    crop = crop_size(settings)
+    if crop:
+        filters.append(f"crop={settings['video_crop'].strip()}")
+        width, height = crop
+    else:
+        width, height = video.get('width'), video.get('height')
+    deinterlace = settings.get("deinterlace")
+    if deinterlace:
+        if deinterlace not in DEINTERLACE_FILTERS:
+            raise ValueError(f"Неизвестный фильтр деинтерлейса: {deinterlace}")
+        filters.append(deinterlace)
+    if settings.get("resolution_mode") != "Исходное":
+        resolution = settings["video_resolution"]
+        if resolution != f"{width}x{height}":
+            scaler = settings.get("video_scaler") or DEFAULT_SCALER
+            if scaler not in SCALERS:
+                raise ValueError(f"Неизвестный алгоритм масштабирования: {scaler}")
+            filters.append(f"scale={resolution.replace('x', ':')}:flags={scaler}")
+    pix_fmt = settings.get("pix_fmt")
+    if pix_fmt and pix_fmt != video.get('pix_fmt'):
+        filters.append(f"format={pix_fmt}")
+    return filters
+
+
+def video_geometry_args(settings, source=None):
+    """-vf с цепочкой video_filters и -r — только там, где они что-то меняют.
+
+    Режим разрешения «Исходное» не масштабирует вовсе; если сведения об
+    исходнике (vvc_probe.get_media_info) известны и разрешение/частота
+    кадров совпадают с ними, фильтр и флаг не передаются — ffmpeg не
+    вставляет масштабирование и fps-фильтр впустую.
+    """
+    video = (source or {}).get('video') or {}
+    args = []
+    filters = video_filters(settings, source)
+    if filters:
+        args.extend(['-vf', ','.join(filters)])
+    fps = str(settings["video_fps"])
+    try:
+        same_fps = video.get('fps') is not None and abs(float(fps) - video['fps']) < 0.01
+    except ValueError:
+        same_fps = False
+    if not same_fps:
+        args.extend(['-r', fps])
+    return args
+
+
+def resolution_class(width, height):
+    """Класс разрешения ('sd', 'hd', 'fhd', 'uhd') по размеру кадра."""
+    pixels = width * height
+    for name, limit in RESOLUTION_CLASSES:
+        if limit is None or pixels <= limit:
+            return name
+
+
+def output_size(settings, source=None):
+    """(ширина, высота) результата или None, если её не определить."""
+    if settings.get("resolution_mode") == "Исходное":
+        video = (source or {}).get('video') or {}
+        if crop_size(settings):
+            return crop_size(settings)
+        if video.get('width') and video.get('height'):
+            return video['width'], video['height']
+        return None
+    try:
+        width, height = str(settings["video_resolution"]).lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        return None
+
+
+def vvenc_tuning(settings, source=None):
+    """Параллелизм libvvenc для разрешения результата из конфигурации
+    (ключ vvenc_tuning, заполняет vvc_tune) или None."""
+    size = output_size(settings, source)
+    tuning = settings.get("vvenc_tuning") or {}
+    return tuning.get(resolution_class(*size)) if size else None
+
+
+def vvenc_tuning_params(tuning):
+    """Параметры -vvenc-params для настройки параллелизма: tiles, wpp, ifp."""
+    params = []
+    if tuning.get("tiles") and tuning["tiles"] != "1x1":
+        params.append(f"tiles={tuning['tiles']}")
+    for key in ("wpp", "ifp"):
+        if key in tuning:
+            params.append(f"{key}={int(tuning[key])}")
+    return params
+
+
+def build_ffmpeg_command(settings, ffmpeg_path, input_file, output_file,
+                         start=None, duration=None, include_audio=True, source=None,
+                         input_format=None, pass_num=None, pass_log=None):
+    """Построение команды FFmpeg (fixes #6, #7, #9).
+
+    start/duration (секунды) заменяют диапазон обрезки — так строятся
+    команды фрагментов при параллельном кодировании; include_audio=False
+    отключает звук (-an). source — сведения об исходнике для пропуска
+    лишних фильтров и -r (см. video_geometry_args). input_format — формат входа
+    (-f перед -i), например "lavfi" для синтетических источников бенчмарка;
+    такой вход не проверяется как путь к файлу. pass_num/pass_log — номер
+    прохода двухпроходного кодирования и префикс журнала статистики; первый
+    проход пишет только статистику (без звука, в null-выход).
+
+    #6 — CRF/качество для каждого кодека:
+        - libx264/libx265/libvvenc  → -crf N
+        - libaom-av1                 → -crf N -b:v 0  (иначе режим не активируется)
+        - librav1e                   → -qp N          (-crf игнорируется)
+        - libvpx-vp9                 → -crf N -b:v 0
+        - nvenc                      → -rc vbr -cq N
+        - amf                        → -rc cqp -qp_i N -qp_p N
+        - qsv                        → -global_quality N
+    #7 — пресет: x264/x265/vvenc используют -preset; остальным нужны
+        числовые флаги (-cpu-used для aom, -speed для rav1e/vpx).
+    #9 — trim: -ss до -i (быстрый seek) + -t после -i (длительность).
+        Старая схема -ss + -to до -i имела путаную семантику абсолютного
+        таймштампа и давала неточные результаты.
+    """
+    if input_format is None:
+        FFmpegValidator.validate_file_path(input_file)
+    v_bitrate = normalize_bitrate(settings["video_bitrate"])
+
+    cmd = [ffmpeg_path]
+    filter_threads = int(settings.get("filter_threads") or 0)
+    if filter_threads > 0:
+        # Глобальный параметр: потоки графа фильтров (кадрирование, масштаб, формат)
+        cmd.extend(['-filter_threads', str(filter_threads)])
+
+    # --- Trim (fix #9): -ss до -i, -t после -i ---
+    trim_duration_seconds = None
+    if start is not None:
+        cmd.extend(['-ss', f"{start:.3f}"])
+    else:
+        trim = trim_range(settings)
+        if trim is not None:
+            trim_duration_seconds = trim[1]
+            cmd.extend(['-ss', settings["trim_start"]])
+
+    if input_format is not None:
+        cmd.extend(['-f', input_format])
+    cmd.extend(['-i', input_file])
+
+    # Длительность фрагмента (после -i)
+    if duration is not None:
+        cmd.extend(['-t', f"{duration:.3f}"])
+    elif trim_duration_seconds is not None:
+        cmd.extend(['-t', seconds_to_timestamp(trim_duration_seconds)])
+
+    actual_codec = get_actual_video_codec(settings)
+    trimmed = start is not None or duration is not None or trim_duration_seconds is not None
+    copied = copy_streams(settings, source, output_file, trimmed) if pass_num is None else set()
+
+    if 'video' in copied:
+        # Быстрый путь: видео без перекодирования (ремукс)
+        cmd.extend(['-c:v', 'copy'])
+        if include_audio:
+            cmd.extend(['-c:a', 'copy'] if 'audio' in copied else audio_args(settings))
+        else:
+            cmd.append('-an')
+        cmd.extend(['-y', output_file])
+        return cmd
+
+    # Видео кодек; для libvvenc — потоки и параллелизм из автонастройки
+    tuning = vvenc_tuning(settings, source) if actual_codec == 'libvvenc' else None
+    codec_params = vvenc_tuning_params(tuning) if tuning else []
+    threads = str(tuning.get("threads", 0)) if tuning else '0'
+    cmd.extend(['-c:v', actual_codec, '-threads', threads])
+
+    # Контроль качества / битрейт (fix #6)
+    if settings["use_crf"]:
+        quality = str(settings["video_quality"])
+        if "nvenc" in actual_codec:
+            cmd.extend(['-rc', 'vbr', '-cq', quality])
+        elif "amf" in actual_codec:
+            cmd.extend(['-rc', 'cqp', '-qp_i', quality, '-qp_p', quality])
+        elif "qsv" in actual_codec:
+            cmd.extend(['-global_quality', quality, '-look_ahead', '0'])
+        elif actual_codec == 'librav1e':
+            # librav1e не понимает -crf, нужен -qp
+            cmd.extend(['-qp', quality])
+        elif actual_codec == 'libaom-av1':
+            # aom-av1: -crf активируется только вместе с -b:v 0
+            cmd.extend(['-crf', quality, '-b:v', '0'])
+        elif actual_codec == 'libvpx-vp9':
+            # VP9: -crf + -b:v 0 включает режим постоянного качества
+            cmd.extend(['-crf', quality, '-b:v', '0'])
+        else:
+            # libx264, libx265, libvvenc
+            cmd.extend(['-crf', quality])
+    else:
+        cmd.extend(['-b:v', v_bitrate])
+
+    # Пресет / скорость (fix #7)
+    # x264/x265/vvenc используют текстовый -preset; остальным нужны числовые флаги.
+    preset = settings["video_preset"]
+    if "nvenc" in actual_codec or "amf" in actual_codec or "qsv" in actual_codec:
+        # Для HW-энкодеров -preset валиден, но значения другие (p1..p7 для nvenc,
+        # speed/quality/balanced для amf, veryfast..slower для qsv).
+        # Не передаём, чтобы не падать — пусть кодек использует свой дефолт.
+        pass
+    elif actual_codec == 'libaom-av1':
+        cmd.extend(['-cpu-used', str(SPEED_MAP[actual_codec].get(preset, 2))])
+    elif actual_codec == 'librav1e':
+        cmd.extend(['-speed', str(SPEED_MAP[actual_codec].get(preset, 4))])
+    elif actual_codec == 'libvpx-vp9':
+        cmd.extend(['-speed', str(SPEED_MAP[actual_codec].get(preset, 2))])
+    else:
+        # libx264, libx265, libvvenc — текстовый -preset
+        cmd.extend(['-preset', preset])
+
+    if pass_num is not None:
+        pass_args = two_pass_args(actual_codec, pass_num, pass_log)
+        if actual_codec == 'libvvenc':
+            # -vvenc-params передаётся один раз: повторный флаг заменил бы первый
+            codec_params.append(pass_args[1])
+        else:
+            cmd.extend(pass_args)
+    if codec_params:
+        cmd.extend(['-vvenc-params', ':'.join(codec_params)])
+
+    cmd.extend(video_geometry_args(settings, source))
+    if pass_num == 1:
+        cmd.extend(['-an', '-f', 'null', '-y', os.devnull])
+        return cmd
+    if not include_audio:
+        cmd.append('-an')
+    else:
+        cmd.extend(['-c:a', 'copy'] if 'audio' in copied else audio_args(settings))
+    cmd.extend(['-y', output_file])
+    return cmd
+
+
+def build_encode_commands(settings, ffmpeg_path, input_file, output_file, source=None, duration=None):
+    """Команды кодирования одного файла: ([cmd], None) или, в режиме «Размер
+    файла», два прохода ([pass1, pass2], work_dir).
+
+    duration — длительность кодируемого диапазона (по умолчанию — из обрезки
+    или source). work_dir — уникальная папка для журналов проходов, чтобы
+    одновременные задания не затирали статистику друг друга; создаёт и
+    удаляет её исполнитель. Кодеки без двухпроходного режима (аппаратные)
+    кодируются одним проходом с рассчитанным битрейтом.
+    """
+    if not settings.get("use_target_size"):
+        return [build_ffmpeg_command(settings, ffmpeg_path, input_file, output_file, source=source)], None
+    if duration is None:
+        trim = trim_range(settings)
+        duration = trim[1] if trim else (source or {}).get('duration')
+    settings = apply_target_size(settings, duration)
+    if get_actual_video_codec(settings) not in TWO_PASS_CODECS:
+        return [build_ffmpeg_command(settings, ffmpeg_path, input_file, output_file, source=source)], None
+    work_dir = os.path.join(tempfile.gettempdir(), f"vvc_2pass_{uuid.uuid4().hex[:12]}")
+    pass_log = os.path.join(work_dir, 'pass')
+    return [build_ffmpeg_command(settings, ffmpeg_path, input_file, output_file, source=source,
+                                 pass_num=n, pass_log=pass_log) for n in (1, 2)], work_dir
+
+
+def smart_cut_supported(settings, source, output_file):
+    """Можно ли обрезать «умно»: перекодировать только края, середину копировать.
+
+    Нужны включённые обрезка и режим smart_cut, исходное видео в том же
+    кодеке, что и выбранный энкодер, без смены разрешения/частоты кадров,
+    и контейнер, принимающий этот кодек. Режим «Размер файла» исключён —
+    его битрейт рассчитан на весь диапазон.
+    """
+    if not (settings.get("smart_cut") and settings.get("enable_trim")) or settings.get("use_target_size"):
+        return False
+    video = (source or {}).get('video')
+    codec = ENCODER_CODEC_NAMES.get(get_actual_video_codec(settings))
+    allowed = CONTAINER_CODECS.get(os.path.splitext(output_file)[1].lower())
+    return bool(video and video.get('codec') == codec and (allowed is None or codec in allowed)
+                and not video_geometry_args(settings, source))
+
+
+def build_segment_copy_command(ffmpeg_path, input_file, output_file, start, duration):
+    """Видео диапазона без перекодирования; start должен быть ключевым кадром."""
+    return [ffmpeg_path, '-ss', f"{start:.6f}", '-i', input_file, '-t', f"{duration:.6f}",
+            '-map', '0:v:0', '-c:v', 'copy', '-an', '-avoid_negative_ts', 'make_zero',
+            '-y', output_file]
+
+
+def build_concat_command(settings, ffmpeg_path, input_file, list_file, output_file, start, duration):
+    """Склейка фрагментов concat-демуксером (видео без перекодирования)
+    и кодирование звука одним проходом из исходника за тот же диапазон."""
+    cmd = [ffmpeg_path, '-f', 'concat', '-safe', '0', '-i', list_file,
+           '-ss', f"{start:.3f}", '-t', f"{duration:.3f}", '-i', input_file,
+           '-map', '0:v:0', '-map', '1:a?', '-c:v', 'copy']
+    cmd.extend(audio_args(settings))
+    cmd.extend(['-y', output_file])
+    return cmd
+
+
+def default_output_path(input_file, output_dir=None):
+    """<имя>_converted.mp4 рядом с исходником или в output_dir."""
+    input_path = os.path.abspath(input_file)
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir or os.path.dirname(input_path), f"{stem}_converted.mp4")
@@ -0,0 +1,240 @@
+"""Распределение ядер процессора между одновременными процессами ffmpeg.
+
+Без распределения каждый ffmpeg запускается с -threads 0 и считает все
+ядра своими: при нескольких заданиях (очередь с N потоками, параллельные
+фрагменты, образцы авто-CRF) потоков получается в разы больше, чем ядер,
+и процессы вытесняют друг друга из кэшей. CoreBudget делит доступные ядра
+(os.sched_getaffinity) на непересекающиеся доли по числу процессов:
+процесс получает -threads и -filter_threads по размеру доли и
+привязывается к её ядрам. Число долей — не меньше ожидаемой
+одновременности (expect: рабочие потоки очереди, фрагменты, образцы),
+иначе первый процесс пачки, запущенный в одиночку, получил бы все ядра.
+Когда процесс завершается, доли остальных расширяются: привязка меняется
+на лету для всех потоков процесса (/proc/<pid>/task), число потоков ffmpeg
+задаётся при запуске и остаётся прежним.
+
+Привязка есть только там, где есть os.sched_setaffinity (Linux); на других
+системах ограничивается только число потоков.
+"""
+import contextlib
+import itertools
+import os
+import threading
+import time
+
+
+def available_cores():
+    """Ядра, доступные этому процессу (с учётом taskset/cgroup cpuset)."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def children_cpu():
+    """Процессорное время завершённых дочерних процессов (на Windows недоступно — 0)."""
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+def split_cores(cores, count):
+    """Деление списка ядер на count непрерывных долей (размеры отличаются не более чем на 1).
+
+    Если процессов больше, чем ядер, доли повторяются по кругу.
+    """
+    if count <= 0:
+        return []
+    if count > len(cores):
+        return [[cores[i % len(cores)]] for i in range(count)]
+    size, extra = divmod(len(cores), count)
+    shares, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        shares.append(cores[start:end])
+        start = end
+    return shares
+
+
+def with_thread_limit(cmd, threads):
+    """Команда с -threads и -filter_threads не больше threads (для графов
+    -filter_complex/-lavfi — и -filter_complex_threads).
+
+    Явно заданное меньшее число потоков (например, из vvc_tune или
+    настройки filter_threads) сохраняется.
+    """
+    cmd = list(cmd)
+    flags = ['-threads', '-filter_threads']
+    if '-filter_complex' in cmd or '-lavfi' in cmd:
+        flags.append('-filter_complex_threads')
+    for flag in flags:
+        if flag in cmd:
+            index = cmd.index(flag) + 1
+            current = int(cmd[index]) if cmd[index].isdigit() else 0
+            cmd[index] = str(min(current, threads) if current > 0 else threads)
+        elif flag != '-threads':
+            cmd[1:1] = [flag, str(threads)]
+    return cmd
+
+
+class CoreShare:
+    """Доля ядер одного процесса; выдаётся CoreBudget.share() как контекстный менеджер."""
+
+    def __init__(self, budget, share_id):
+        self.budget = budget
+        self.id = share_id
+        self.cores = []
+        self.process = None
+
+    @property
+    def threads(self):
+        return max(1, len(self.cores))
+
+    def apply(self, cmd):
+        return with_thread_limit(cmd, self.threads)
+
+    def pin(self, process):
+        """Привязка запущенного процесса к ядрам доли (вызывается из on_start)."""
+        self.process = process
+        self.budget._pin(self)
+
+    def __enter__(self):
+        self.budget._acquire(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.budget._release(self)
+        return False
+
+
+class CoreBudget:
+    """Менеджер долей ядер (потокобезопасный).
+
+    Считает также время, когда работал хотя бы один процесс, и процессорное
+    время завершённых процессов за это время — для отчёта об использовании
+    (report).
+    """
+
+    def __init__(self, cores=None):
+        self.cores = sorted(cores) if cores else available_cores()
+        self._lock = threading.Lock()
+        self._shares = []
+        # Ожидаемая одновременность (сумма активных expect)
+        self._expected = 0
+        self._ids = itertools.count(1)
+        # Накопленные показатели (см. stats)
+        self._busy_s = 0.0
+        self._cpu_s = 0.0
+        self._processes = 0
+        self._peak = 0
+        self._busy_since = None
+        self._cpu_since = None
+
+    def share(self):
+        return CoreShare(self, next(self._ids))
+
+    @contextlib.contextmanager
+    def expect(self, count):
+        """На время блока ядра делятся не меньше чем на count долей (плюс
+        другие активные expect): процессы пачки с самого начала получают
+        -threads по размеру своей доли."""
+        with self._lock:
+            self._expected += count
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._expected -= count
+                self._rebalance()
+
+    def _acquire(self, share):
+        with self._lock:
+            if not self._shares:
+                self._busy_since, self._cpu_since = time.monotonic(), children_cpu()
+            self._shares.append(share)
+            self._processes += 1
+            self._peak = max(self._peak, len(self._shares))
+            self._rebalance()
+
+    def _release(self, share):
+        with self._lock:
+            if share in self._shares:
+                self._shares.remove(share)
+            share.process = None
+            if not self._shares and self._busy_since is not None:
+                self._busy_s += time.monotonic() - self._busy_since
+                self._cpu_s += children_cpu() - self._cpu_since
+                self._busy_since = None
+            self._rebalance()
+
+    def _rebalance(self):
+        count = max(len(self._shares), self._expected)
+        for share, cores in zip(self._shares, split_cores(self.cores, count)):
+            if share.cores != cores:
+                share.cores = cores
+                self._set_affinity(share)
+
+    def _pin(self, share):
+        with self._lock:
+            self._set_affinity(share)
+
+    @staticmethod
+    def _set_affinity(share):
+        process = share.process
+        if process is None or not share.cores or not hasattr(os, 'sched_setaffinity'):
+            return
+        # sched_setaffinity(pid) меняет только главный поток: потоки кодировщика,
+        # уже созданные ffmpeg, перепривязываются по одному
+        try:
+            tids = [int(tid) for tid in os.listdir(f"/proc/{process.pid}/task")]
+        except (OSError, ValueError):
+            tids = [process.pid]
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, share.cores)
+            except OSError:
+                pass  # Поток или процесс уже завершился
+
+    def stats(self):
+        """Накопленные показатели: busy_s, cpu_s, processes, peak."""
+        with self._lock:
+            busy, cpu = self._busy_s, self._cpu_s
+            if self._busy_since is not None:
+                busy += time.monotonic() - self._busy_since
+                cpu += children_cpu() - self._cpu_since
+            return {'busy_s': busy, 'cpu_s': cpu, 'processes': self._processes, 'peak': self._peak}
+
+    def report(self, since=None):
+        """Использование процессора с момента снимка since (stats()) или с начала.
+
+            cores — ядер в распоряжении, processes — запущено процессов,
+            busy_s — время, когда работал хотя бы один, cpu_s — их процессорное
+            время, utilization — cpu_s / (busy_s × cores), None, если
+            процессорное время недоступно (Windows) или ничего не запускалось.
+        """
+        now = self.stats()
+        since = since or {'busy_s': 0.0, 'cpu_s': 0.0, 'processes': 0}
+        busy = now['busy_s'] - since['busy_s']
+        cpu = now['cpu_s'] - since['cpu_s']
+        return {
+            'cores': len(self.cores),
+            'processes': now['processes'] - since['processes'],
+            'peak': now['peak'],
+            'busy_s': round(busy, 1),
+            'cpu_s': round(cpu, 1),
+            'utilization': round(cpu / (busy * len(self.cores)), 3) if busy > 0 and cpu > 0 else None,
+        }
+
+
+def describe_report(report):
+    """Строка отчёта для лога."""
+    if report['utilization'] is None:
+        return f"ядер {report['cores']}, процессов {report['processes']}"
+    return (f"загрузка ЦП {report['utilization'] * 100:.0f}% "
+            f"({report['cpu_s']:.0f} с ЦП за {report['busy_s']:.0f} с на {report['cores']} ядрах, "
+            f"процессов {report['processes']}, одновременно до {report['peak']})")
+
+
+# Общий менеджер на процесс приложения: очередь, фрагменты и подбор CRF
+# делят одни и те же ядра
+cpu_budget = CoreBudget()
@@ -0,0 +1,152 @@
+"""Оценка оставшегося времени: сглаженная скорость и история.
+
+Прямая экстраполяция elapsed / progress сильно скачет: первые десятки
+секунд libvvenc заполняет lookahead и почти ничего не выдаёт, а на сменах
+сцен скорость меняется в разы. EtaEstimator считает мгновенную скорость
+между соседними блоками -progress (speed= и fps= ffmpeg — средние с начала
+работы, они запаздывают) и сглаживает её EWMA с постоянной времени
+SMOOTHING секунд. Пока наблюдений мало, оценка опирается на скорость из
+истории (vvc_history) для того же кодека, пресета и разрешения; вес
+наблюдений растёт со временем работы (WARMUP).
+
+Вместе с оценкой возвращается диапазон: разброс сглаженной скорости (или,
+пока наблюдений нет, условный разброс истории) переводится в
+оптимистичную и пессимистичную оценку. batch_eta раскладывает оставшиеся
+задания очереди по рабочим потокам тем же способом, что и очередь.
+"""
+import heapq
+import math
+import time
+
+from vvc_core import format_time
+
+# Постоянная времени сглаживания скорости, секунд
+SMOOTHING = 20.0
+# Время работы, за которое наблюдения набирают половину веса против истории, секунд
+WARMUP = 30.0
+# Наименьший интервал между точками для мгновенной скорости, секунд
+MIN_INTERVAL = 1.0
+# Относительный разброс скорости из истории и без каких-либо данных
+PRIOR_SPREAD = 0.25
+UNKNOWN_SPREAD = 0.5
+# Квантиль нормального распределения для диапазона (≈80%)
+Z = 1.28
+
+
+class EtaEstimator:
+    """Оставшееся время одного задания по доле выполнения.
+
+    prior_rate — ожидаемая скорость в долях задания в секунду (например,
+    скорость из истории / длительность) или None. update(fraction, rate)
+    вызывается на каждом блоке прогресса; rate — скорость, сообщённая
+    ffmpeg, в тех же единицах (используется, пока нет второй точки).
+    """
+
+    def __init__(self, prior_rate=None, start_time=None):
+        self.prior_rate = prior_rate if prior_rate and prior_rate > 0 else None
+        self.start_time = start_time if start_time is not None else time.time()
+        self.fraction = 0.0
+        self._origin = None  # Доля при первом обновлении (продолжение прерванного задания)
+        self._mean = None
+        self._var = 0.0
+        self._anchor = None  # (время, доля) последней точки для мгновенной скорости
+
+    def update(self, fraction, rate=None, now=None):
+        now = now if now is not None else time.time()
+        fraction = min(1.0, max(0.0, fraction))
+        if self._anchor is None:
+            self._anchor, self._origin = (now, fraction), fraction
+            if rate and rate > 0:
+                self._observe(rate, 1.0)
+        else:
+            dt = now - self._anchor[0]
+            if dt >= MIN_INTERVAL:
+                self._observe(max(0.0, fraction - self._anchor[1]) / dt, dt)
+                self._anchor = (now, fraction)
+        self.fraction = fraction
+
+    def _observe(self, x, dt):
+        if self._mean is None:
+            self._mean = x
+            return
+        alpha = 1 - math.exp(-dt / SMOOTHING)
+        diff = x - self._mean
+        self._mean += alpha * diff
+        self._var = (1 - alpha) * (self._var + alpha * diff * diff)
+
+    def rate(self, now=None):
+        """(скорость в долях/с, относительный разброс) или None, если её не оценить."""
+        now = now if now is not None else time.time()
+        elapsed = max(0.0, now - self.start_time)
+        weight = elapsed / (elapsed + WARMUP)
+        observed = self._mean
+        if not observed and self._origin is not None and elapsed > 0:
+            observed = (self.fraction - self._origin) / elapsed
+        if observed:
+            spread = math.sqrt(self._var) / observed if self._mean else UNKNOWN_SPREAD
+            if self.prior_rate:
+                return (weight * observed + (1 - weight) * self.prior_rate,
+                        weight * spread + (1 - weight) * PRIOR_SPREAD)
+            return observed, min(0.9, spread + (1 - weight) * UNKNOWN_SPREAD)
+        if self.prior_rate:
+            return self.prior_rate, PRIOR_SPREAD
+        return None
+
+    def estimate(self, now=None):
+        """(оставшиеся секунды, оптимистично, пессимистично) или None."""
+        estimate = self.rate(now)
+        if estimate is None:
+            return None
+        rate, spread = estimate
+        spread = min(0.9, spread)
+        work = 1.0 - self.fraction
+        return (work / rate, work / (rate * (1 + Z * spread)),
+                work / (rate * max(0.1, 1 - Z * spread)))
+
+
+def prior_rate(history, cmd, duration, input_file=None):
+    """Ожидаемая скорость задания (долей в секунду) по истории
+    (vvc_history.JobHistory) или None. Скорость в истории считается на всё
+    задание, включая проходы, поэтому число проходов здесь не нужно."""
+    if history is None or not duration:
+        return None
+    try:
+        speed = history.speed_for(cmd, input_file)
+    except Exception:
+        return None  # История недоступна — оценка только по наблюдениям
+    return speed / duration if speed else None
+
+
+def prior_estimate(seconds, spread=PRIOR_SPREAD):
+    """Оценка задания, которое ещё не запускалось: (секунды, оптимистично, пессимистично)."""
+    return seconds, seconds / (1 + Z * spread), seconds / max(0.1, 1 - Z * spread)
+
+
+def _makespan(running, queued, workers):
+    """Время до завершения всех заданий при раскладке по workers потокам."""
+    slots = sorted(running)[-workers:] if running else []
+    slots += [0.0] * (workers - len(slots))
+    heapq.heapify(slots)
+    for seconds in queued:
+        heapq.heappush(slots, heapq.heappop(slots) + seconds)
+    return max(slots) if slots else 0.0
+
+
+def batch_eta(running, queued, workers):
+    """Оставшееся время очереди: running и queued — оценки заданий
+    (секунды, оптимистично, пессимистично) в порядке очереди.
+
+    Задания раскладываются по workers потокам: каждое следующее — в поток,
+    который освободится первым. Возвращает тройку в том же формате.
+    """
+    workers = max(1, workers)
+    return tuple(_makespan([e[i] for e in running], [e[i] for e in queued], workers)
+                 for i in range(3))
+
+
+def format_eta(estimate):
+    """«~12:30 (10:05–15:40)» или пустая строка."""
+    if estimate is None:
+        return ""
+    remaining, low, high = estimate
+    return f"~{format_time(remaining)} ({format_time(low)}–{format_time(high)})"
@@ -0,0 +1,454 @@
+"""Ферма кодирования: агенты на других машинах принимают задания по TCP.
+
+    python vvc_farm.py --listen 0.0.0.0:8765 --slots 2 --token SECRET --map /mnt/video=/srv/video
+    python vvc_farm.py --listen 127.0.0.1:8766 --listen 127.0.0.1:8767   # две «машины» на одной
+    python vvc_farm.py --status 10.0.0.5:8765                             # состояние агента
+
+Агент — отдельный процесс на машине фермы. Задание — снимок команды
+build_ffmpeg_command из очереди и путь входного файла на общем хранилище.
+Агент подставляет свой ffmpeg, переводит пути по --map (префикс
+клиента=префикс агента), запускает команду через run_ffmpeg с долей ядер
+vvc_cpu и передаёт прогресс и код возврата обратно по тому же соединению.
+
+Протокол — строки JSON (UTF-8), одно соединение на запрос:
+    → {"op": "hello"}            ← {"ok": true, "host", "slots", "busy", "protocol"}
+    → {"op": "run", "cmd": [...], "input": путь}
+                                 ← {"ok": true}, затем {"event": "progress", "record": {...}},
+                                   {"event": "output", "line": ...}, ...,
+                                   {"event": "exit", "code", "cpu_time", "killed"}
+    → {"op": "stop"} в том же соединении (или его закрытие) — остановка процесса.
+Отказ — {"ok": false, "error": ...}: неверный токен, нет свободных мест,
+входной файл недоступен. Во всех запросах — "token", если он задан.
+
+Агент выполняет только свой ffmpeg, но аргументы (в том числе путь
+результата) приходят от клиента: слушать стоит только доверенную сеть и
+задавать токен (--token, у клиента — farm_token); без токена агент
+слушает только локальные адреса. Адрес по умолчанию — 127.0.0.1:
+несколько агентов на разных портах одной машины заменяют ферму при проверке.
+
+Клиентская сторона — RemoteWorker и Farm: очередь (vvc_jobs.JobQueue)
+запускает по рабочему потоку на каждое свободное место агента.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import platform
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from vvc_core import VERSION, ConfigManager, resolve_ffmpeg_paths
+from vvc_cpu import cpu_budget
+from vvc_jobs import ProgressRecord, run_ffmpeg
+from vvc_supervisor import supervisor
+
+DEFAULT_PORT = 8765
+PROTOCOL_VERSION = 1
+# Ожидание соединения и ответа на hello, секунд
+CONNECT_TIMEOUT = 5.0
+
+
+def parse_address(text, default_host='127.0.0.1'):
+    """«host:port», «:port» или «host» → (host, port)."""
+    host, sep, port = text.strip().rpartition(':')
+    if not sep:
+        host, port = port, DEFAULT_PORT
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"Неверный адрес агента: {text}") from None
+    return host.strip('[]') or default_host, port
+
+
+def is_loopback(host):
+    """Адрес доступен только с этой машины (127.0.0.0/8, ::1, localhost)."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # Имя машины или интерфейса — виден из сети
+
+
+def parse_map(text):
+    """«префикс клиента=префикс агента» → (клиент, агент)."""
+    client, sep, local = text.partition('=')
+    if not sep or not client or not local:
+        raise ValueError(f"Неверное соответствие путей: {text} (нужно КЛИЕНТ=АГЕНТ)")
+    return client, local
+
+
+def _under(path, prefix):
+    """path — сам prefix или путь внутри него (/mnt/video не захватывает /mnt/video2)."""
+    if not path.startswith(prefix):
+        return False
+    return (len(path) == len(prefix) or prefix.endswith(('/', '\\'))
+            or path[len(prefix)] in '/\\')
+
+
+def map_paths(args, path_map):
+    """Аргументы команды с путями клиента, переведёнными в пути агента."""
+    result = []
+    for arg in args:
+        for client, local in path_map:
+            if _under(arg, client):
+                rest = arg[len(client):]
+                if os.sep == '/':
+                    rest = rest.replace('\\', '/')  # Клиент на Windows, агент — нет
+                arg = local + rest
+                break
+        result.append(arg)
+    return result
+
+
+def _send(sock, message):
+    sock.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+def _record_fields(record):
+    return {name: getattr(record, name) for name in ProgressRecord.__slots__}
+
+
+# --- Агент ---
+
+class FarmAgent:
+    """Приём заданий по TCP и их выполнение на этой машине (не больше slots одновременно)."""
+
+    def __init__(self, ffmpeg_path, slots=1, token=None, path_map=(), budget=cpu_budget):
+        self.ffmpeg_path = ffmpeg_path
+        self.slots = max(1, int(slots))
+        self.token = token or None
+        self.path_map = list(path_map)
+        self.budget = budget
+        self.busy = 0
+        self._lock = threading.Lock()
+
+    def serve(self, address):
+        """Сервер на address ((host, port)); обслуживание — в фоновом потоке. Возвращает сервер."""
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                agent.handle(self.connection, self.rfile)
+
+        server = socketserver.ThreadingTCPServer(address, Handler, bind_and_activate=False)
+        server.daemon_threads = True
+        server.allow_reuse_address = True
+        server.server_bind()
+        server.server_activate()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def handle(self, sock, rfile):
+        try:
+            request = json.loads(rfile.readline() or b'{}')
+        except ValueError:
+            return _send(sock, {'ok': False, 'error': "неверный запрос"})
+        if self.token and not hmac.compare_digest(str(request.get('token') or ''), self.token):
+            return _send(sock, {'ok': False, 'error': "неверный токен"})
+        if request.get('op') == 'hello':
+            return _send(sock, {'ok': True, 'host': platform.node(), 'slots': self.slots,
+                                'busy': self.busy, 'protocol': PROTOCOL_VERSION,
+                                'version': VERSION})
+        if request.get('op') == 'run':
+            return self._run(request, sock, rfile)
+        _send(sock, {'ok': False, 'error': f"неизвестная операция: {request.get('op')}"})
+
+    def _run(self, request, sock, rfile):
+        cmd = request.get('cmd')
+        if not isinstance(cmd, list) or len(cmd) < 2 or not all(isinstance(a, str) for a in cmd):
+            return _send(sock, {'ok': False, 'error': "неверная команда"})
+        cmd = [self.ffmpeg_path] + map_paths(cmd[1:], self.path_map)
+        input_file = map_paths([request.get('input') or ''], self.path_map)[0]
+        if input_file and not os.path.exists(input_file):
+            return _send(sock, {'ok': False, 'error': f"входной файл недоступен: {input_file}"})
+        with self._lock:
+            if self.busy >= self.slots:
+                return _send(sock, {'ok': False, 'error': "нет свободных мест"})
+            self.busy += 1
+        try:
+            _send(sock, {'ok': True})
+            print(f"Запуск: {input_file or cmd[-1]}", flush=True)
+            code = self._execute(cmd, sock, rfile)
+            print(f"Завершено: {input_file or cmd[-1]} (код {code})", flush=True)
+        finally:
+            with self._lock:
+                self.busy -= 1
+
+    def _execute(self, cmd, sock, rfile):
+        """Процесс задания; события уходят клиенту из этого потока по мере поступления."""
+        events = queue.Queue()
+        state = {'process': None, 'requested': False, 'stop': None}
+        lock = threading.Lock()
+
+        def stop():
+            with lock:
+                state['requested'] = True
+                if state['process'] is not None and state['stop'] is None:
+                    state['stop'] = state['process'].stop()
+
+        def on_start(process):
+            with lock:
+                state['process'] = process
+            if state['requested']:
+                stop()  # Остановку запросили до запуска
+
+        def watch():
+            # Команда stop или закрытое соединение — остановка процесса
+            try:
+                for line in rfile:
+                    if json.loads(line or b'{}').get('op') == 'stop':
+                        break
+            except (OSError, ValueError):
+                pass
+            stop()
+
+        def execute():
+            try:
+                code = run_ffmpeg(cmd, on_output=lambda line: events.put({'event': 'output', 'line': line}),
+                                  on_progress=lambda r: events.put({'event': 'progress',
+                                                                    'record': _record_fields(r)}),
+                                  on_start=on_start, budget=self.budget)
+            except Exception as e:
+                events.put({'event': 'output', 'line': f"Агент: {e}"})
+                code = -1
+            process, stopping = state['process'], state['stop']
+            killed = bool(stopping.result()) if stopping is not None else False
+            events.put({'event': 'exit', 'code': code, 'killed': killed,
+                        'cpu_time': process.cpu_time if process is not None else None})
+
+        threading.Thread(target=watch, daemon=True).start()
+        threading.Thread(target=execute, daemon=True).start()
+        connected = True
+        while True:
+            event = events.get()
+            if connected:
+                try:
+                    _send(sock, event)
+                except OSError:
+                    connected = False
+                    stop()
+            if event['event'] == 'exit':
+                return event['code']
+
+
+# --- Клиент ---
+
+class FarmUnavailable(ConnectionError):
+    """Агент недоступен или отказал до запуска — задание можно выполнить в другом месте."""
+
+
+class RemoteProcess:
+    """Процесс задания на агенте.
+
+    Повторяет нужную очереди часть интерфейса vvc_supervisor.ManagedProcess:
+    returncode, cpu_time и stop() → Future (True, если агенту понадобился kill).
+    """
+
+    def __init__(self, worker, sock, rfile):
+        self.worker = worker
+        self.returncode = None
+        self.cpu_time = None
+        self._sock = sock
+        self._rfile = rfile
+        self._stopped = Future()
+
+    def poll(self):
+        return self.returncode
+
+    def stop(self, grace=5.0):
+        """Остановка без ожидания; эскалацию terminate → kill выполняет агент."""
+        try:
+            _send(self._sock, {'op': 'stop'})
+        except OSError:
+            pass
+        return self._stopped
+
+    def follow(self, on_progress=None, on_output=None):
+        """События процесса до его завершения. Возвращает код возврата (-1 — связь потеряна)."""
+        killed = False
+        try:
+            for line in self._rfile:
+                event = json.loads(line)
+                if event.get('event') == 'progress' and on_progress:
+                    on_progress(ProgressRecord(**event['record']))
+                elif event.get('event') == 'output' and on_output:
+                    on_output(event['line'])
+                elif event.get('event') == 'exit':
+                    self.returncode, self.cpu_time = event['code'], event.get('cpu_time')
+                    killed = bool(event.get('killed'))
+                    break
+        except (OSError, ValueError) as e:
+            if on_output:
+                on_output(f"Агент {self.worker.address}: {e}")
+        finally:
+            self._rfile.close()
+            self._sock.close()
+            if self.returncode is None:
+                self.returncode = -1
+                if on_output:
+                    on_output(f"Агент {self.worker.address}: соединение потеряно")
+            self._stopped.set_result(killed)
+        return self.returncode
+
+
+class RemoteWorker:
+    """Агент фермы с точки зрения очереди: адрес, число мест, состояние."""
+
+    def __init__(self, address, token=None, timeout=CONNECT_TIMEOUT):
+        self.host, self.port = parse_address(address)
+        self.address = f"{self.host}:{self.port}"
+        self.token = token or None
+        self.timeout = timeout
+        # Заполняются hello(): имя машины агента, мест всего и свободных
+        self.name = self.address
+        self.slots = 0
+        self.free = 0
+        self.online = False
+
+    def _request(self, request):
+        """Соединение с отправленным запросом и ответ агента на него."""
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise FarmUnavailable(f"{self.address}: {e}") from None
+        rfile = sock.makefile('rb')
+        try:
+            if self.token:
+                request = dict(request, token=self.token)
+            _send(sock, request)
+            reply = json.loads(rfile.readline() or b'{}')
+        except (OSError, ValueError) as e:
+            rfile.close()
+            sock.close()
+            raise FarmUnavailable(f"{self.address}: {e}") from None
+        if not reply.get('ok'):
+            rfile.close()
+            sock.close()
+            raise FarmUnavailable(f"{self.address}: {reply.get('error') or 'нет ответа'}")
+        return sock, rfile, reply
+
+    def hello(self):
+        """Опрос агента: обновляет name, slots, free, online. Ответ агента — словарь."""
+        try:
+            sock, rfile, reply = self._request({'op': 'hello'})
+        except FarmUnavailable:
+            self.online = False
+            raise
+        rfile.close()
+        sock.close()
+        self.name = reply.get('host') or self.address
+        self.slots = int(reply.get('slots') or 0)
+        self.free = max(0, self.slots - int(reply.get('busy') or 0))
+        self.online = True
+        return reply
+
+    def start(self, cmd, input_file=None, output_file=None):
+        """Запуск команды на агенте; RemoteProcess или FarmUnavailable.
+
+        Пути входа и результата передаются абсолютными: у агента другая
+        текущая папка.
+        """
+        paths = {p: os.path.abspath(p) for p in (input_file, output_file) if p}
+        cmd = [paths.get(arg, arg) for arg in cmd]
+        sock, rfile, _ = self._request({'op': 'run', 'cmd': cmd,
+                                        'input': paths.get(input_file)})
+        sock.settimeout(None)  # Кодирование может надолго замолкать (lookahead)
+        return RemoteProcess(self, sock, rfile)
+
+
+class Farm:
+    """Зарегистрированные агенты (ключ farm_workers в конфигурации)."""
+
+    def __init__(self, addresses, token=None):
+        self.workers = [RemoteWorker(address, token) for address in addresses]
+
+    def probe(self, workers=None):
+        """Опрос агентов (по умолчанию всех) параллельно: [(RemoteWorker, ошибка или None)]."""
+        def hello(worker):
+            try:
+                worker.hello()
+                return worker, None
+            except FarmUnavailable as e:
+                return worker, e
+
+        workers = self.workers if workers is None else workers
+        if not workers:
+            return []
+        with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+            return list(pool.map(hello, workers))
+
+    def capacity(self):
+        """Свободных мест на доступных агентах (по последнему опросу)."""
+        return sum(w.free for w in self.workers if w.online)
+
+
+def farm_from_config(config, addresses=None):
+    """Farm по конфигурации (farm_workers, farm_token) или None, если агентов нет."""
+    addresses = addresses or config.get("farm_workers") or []
+    if not addresses:
+        return None
+    return Farm(addresses, config.get("farm_token") or None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="vvc_farm.py",
+        description="Агент фермы кодирования: принимает задания очереди по TCP.")
+    parser.add_argument('--listen', action='append', metavar='HOST:PORT',
+                        help=f"адрес агента (по умолчанию 127.0.0.1:{DEFAULT_PORT}); "
+                             "несколько --listen — несколько агентов в одном процессе")
+    parser.add_argument('--slots', type=int, default=1, help="одновременных заданий на агент")
+    parser.add_argument('--token', help="общий токен (по умолчанию farm_token из конфигурации)")
+    parser.add_argument('--map', action='append', default=[], metavar='КЛИЕНТ=АГЕНТ',
+                        help="перевод путей общего хранилища, например /mnt/video=/srv/video")
+    parser.add_argument('--config', default="ffmpeg_converter_config.json")
+    parser.add_argument('--ffmpeg', help="путь к ffmpeg (перекрывает конфигурацию)")
+    parser.add_argument('--status', metavar='HOST:PORT', help="опросить агент и выйти")
+    args = parser.parse_args(argv)
+
+    config = ConfigManager(args.config).load()
+    token = args.token or config.get("farm_token") or None
+    try:
+        if args.status:
+            reply = RemoteWorker(args.status, token).hello()
+            print(f"{reply.get('host')}: занято {reply.get('busy')} из {reply.get('slots')} "
+                  f"(версия {reply.get('version')})")
+            return 0
+        path_map = [parse_map(m) for m in args.map]
+        addresses = [parse_address(a) for a in args.listen or [f"127.0.0.1:{DEFAULT_PORT}"]]
+        for host, port in addresses:
+            if not token and not is_loopback(host):
+                raise ValueError(f"{host}:{port}: адрес доступен из сети — задайте --token "
+                                 "(или farm_token в конфигурации)")
+    except (ValueError, FarmUnavailable) as e:
+        print(e, file=sys.stderr)
+        return 2
+    ffmpeg_path = args.ffmpeg or resolve_ffmpeg_paths(config)[0]
+    supervisor.configure(config)
+    servers = []
+    for address in addresses:
+        try:
+            servers.append(FarmAgent(ffmpeg_path, args.slots, token, path_map).serve(address))
+        except OSError as e:
+            print(f"{address[0]}:{address[1]}: {e}", file=sys.stderr)
+            return 2
+        print(f"Агент {address[0]}:{address[1]}: мест {args.slots}"
+              + ("" if token else " (без токена)"), flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
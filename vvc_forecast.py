@@ -0,0 +1,155 @@
+"""Прогноз размера результата и времени кодирования по образцам.
+
+Несколько коротких фрагментов, равномерно распределённых по диапазону,
+кодируются одновременно той же командой, что и полная конвертация
+(build_ffmpeg_command, со звуком и в тот же контейнер). По ним считаются
+байты на секунду видео и общая производительность машины: фрагменты
+делят ядра (vvc_cpu), поэтому суммарные секунды видео, делённые на время
+всей пачки, — это скорость, с которой машина кодирует этими настройками.
+Запуск кодировщика на коротком фрагменте стоит заметную долю его времени,
+поэтому прогноз времени скорее завышен, чем занижен.
+"""
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vvc_core import (TWO_PASS_CODECS, apply_target_size, build_ffmpeg_command, copy_streams,
+                      format_time, get_actual_video_codec, trim_range)
+from vvc_cpu import cpu_budget
+from vvc_jobs import ProcessGroup, processes_cpu_time
+from vvc_quality import plan_samples
+
+SAMPLE_COUNT = 3
+SAMPLE_SECONDS = 4.0
+
+
+def extrapolate(samples, duration, wall_seconds, passes=1):
+    """Прогноз по измерениям образцов.
+
+    samples — [(секунд видео, байт, процессорных секунд или None)],
+    wall_seconds — время кодирования всей пачки, passes — число проходов
+    полной конвертации. Возвращает словарь: size_bytes, bitrate_kbps,
+    seconds, cpu_seconds (None, если неизвестно), speed.
+    """
+    media = sum(s[0] for s in samples)
+    size = sum(s[1] for s in samples)
+    cpu = [s[2] for s in samples]
+    speed = media / wall_seconds / passes if wall_seconds > 0 else None
+    return {
+        'size_bytes': round(size / media * duration),
+        'bitrate_kbps': round(size * 8 / media / 1000),
+        'seconds': duration / speed if speed else None,
+        'cpu_seconds': sum(cpu) / media * duration * passes if None not in cpu else None,
+        'speed': speed,
+        'samples': len(samples),
+        'sample_seconds': media,
+    }
+
+
+def _format_size(size):
+    if size >= 1024 ** 3:
+        return f"{size / 1024 ** 3:.2f} ГБ"
+    return f"{size / 1024 ** 2:.1f} МБ"
+
+
+def describe_forecast(forecast):
+    """Прогноз одной строкой для лога и окна."""
+    text = f"~{_format_size(forecast['size_bytes'])} ({forecast['bitrate_kbps']} кбит/с)"
+    if forecast['seconds'] is not None:
+        text += f", время ~{format_time(forecast['seconds'])} (скорость {forecast['speed']:.2f}x)"
+    if forecast['cpu_seconds'] is not None:
+        text += f", ЦП {forecast['cpu_seconds'] / 3600:.1f} ч"
+    return text
+
+
+class Forecast:
+    """Кодирование образцов и прогноз для полной конвертации.
+
+    События уходят в on_event в формате ui_queue ({'type': 'log', ...}).
+    stop() прерывает прогноз из другого потока.
+    """
+
+    def __init__(self, settings, ffmpeg_path, input_file, output_file, start, duration,
+                 source=None, count=SAMPLE_COUNT, length=SAMPLE_SECONDS, on_event=None):
+        self.passes = 1
+        # Видео, которое полная конвертация скопирует, образцы кодировать не должны
+        self.copy_video = 'video' in copy_streams(settings, source, output_file,
+                                                  trim_range(settings) is not None)
+        if settings.get("use_target_size"):
+            # Битрейт — как у полной конвертации, время — на оба прохода
+            settings = apply_target_size(settings, duration)
+            if get_actual_video_codec(settings) in TWO_PASS_CODECS:
+                self.passes = 2
+        # Фрагменты задаются явно; обрезка из настроек уже учтена в start/duration
+        self.settings = dict(settings, enable_trim=False)
+        self.ffmpeg_path = ffmpeg_path
+        self.input_file = input_file
+        self.extension = os.path.splitext(output_file)[1] or '.mp4'
+        self.duration = duration
+        self.samples = plan_samples(start, duration, count, length)
+        self.source = source
+        self.on_event = on_event or (lambda event: None)
+        self._group = ProcessGroup()
+
+    @property
+    def stopped(self):
+        return self._group.stopped
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def run(self):
+        """Выполнение в текущем потоке. Возвращает прогноз (см. extrapolate) или None при остановке."""
+        if self.copy_video:
+            return self._copy_forecast()
+        work_dir = tempfile.mkdtemp(prefix='vvc_forecast_')
+        try:
+            self._log(f"Прогноз: кодирование образцов ({len(self.samples)} × "
+                      f"{self.samples[0][1]:g} с)")
+            started = time.monotonic()
+            with cpu_budget.expect(len(self.samples)), \
+                    ThreadPoolExecutor(max_workers=len(self.samples)) as pool:
+                results = list(pool.map(lambda i: self._encode_sample(i, work_dir),
+                                        range(len(self.samples))))
+            wall = time.monotonic() - started
+            if self.stopped:
+                return None
+            if None in results:
+                raise RuntimeError("образец не закодирован (подробности — в логе)")
+            forecast = extrapolate(results, self.duration, wall, self.passes)
+            self._log(f"Прогноз: {describe_forecast(forecast)}", "success")
+            return forecast
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _copy_forecast(self):
+        """Видео копируется без перекодирования: размер — по битрейту исходника."""
+        bit_rate = self.source.get('bit_rate') or 0
+        forecast = {'size_bytes': round(bit_rate / 8 * self.duration),
+                    'bitrate_kbps': round(bit_rate / 1000), 'seconds': None, 'cpu_seconds': None,
+                    'speed': None, 'samples': 0, 'sample_seconds': 0.0}
+        self._log(f"Прогноз: видео копируется без перекодирования, {describe_forecast(forecast)}",
+                  "success")
+        return forecast
+
+    def _encode_sample(self, index, work_dir):
+        if self.stopped:
+            return None
+        start, duration = self.samples[index]
+        output = os.path.join(work_dir, f"sample{index}{self.extension}")
+        cmd = build_ffmpeg_command(self.settings, self.ffmpeg_path, self.input_file, output,
+                                   start=start, duration=duration, source=self.source)
+        holder, lines = [], []
+        rc = self._group.run(cmd, on_output=lines.append, on_start=holder.append, budget=cpu_budget)
+        if rc != 0 or not os.path.exists(output):
+            if not self.stopped:
+                self._log(f"Образец {index + 1}: код возврата {rc}"
+                          + (f" — {lines[-1]}" if lines else ""), "error")
+            return None
+        return duration, os.path.getsize(output), processes_cpu_time(holder)
+
+    def stop(self):
+        """Остановка образцов без ожидания (vvc_jobs.ProcessGroup.stop)."""
+        return self._group.stop()
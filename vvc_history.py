@@ -0,0 +1,321 @@
+"""История заданий в SQLite.
+
+    python vvc_history.py                   # последние задания
+    python vvc_history.py --summary         # производительность по кодеку/пресету
+    python vvc_history.py --csv history.csv
+
+Каждое завершённое задание (очередь, окно, командная строка, папки
+наблюдения) записывается одной строкой: пути и размеры файлов, точная
+команда ffmpeg, кодек/пресет/качество, время (по часам и процессорное),
+средние fps и скорость, код возврата и степень сжатия. По накопленным
+строкам считается производительность (секунд видео в секунду работы) для
+оценки времени новых заданий (vvc_eta) — по кодеку, пресету и классу
+разрешения результата (колонка resolution: sd/hd/fhd/uhd); колонка host
+позволяет сводить CSV с разных машин для планирования мощностей.
+
+Файл базы — history.sqlite3 в папке данных пользователя (ключ
+history_path в конфигурации переопределяет путь).
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+
+from vvc_core import ConfigManager, get_data_dir, resolution_class
+from vvc_jobs import Job
+from vvc_probe import cached_media_info
+
+DB_NAME = 'history.sqlite3'
+SCHEMA_VERSION = 2
+# Колонки таблицы jobs в порядке CSV (кроме id)
+COLUMNS = (
+    'started', 'finished', 'host', 'status', 'return_code', 'mode',
+    'input', 'output', 'input_size', 'output_size', 'compression',
+    'codec', 'preset', 'quality', 'bitrate', 'command',
+    'duration', 'frames', 'wall_s', 'cpu_s', 'fps', 'speed', 'resolution',
+)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL, finished REAL, host TEXT, status TEXT, return_code INTEGER, mode TEXT,
+    input TEXT, output TEXT, input_size INTEGER, output_size INTEGER, compression REAL,
+    codec TEXT, preset TEXT, quality TEXT, bitrate TEXT, command TEXT,
+    duration REAL, frames INTEGER, wall_s REAL, cpu_s REAL, fps REAL, speed REAL,
+    resolution TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_codec ON jobs (codec, preset, status);
+"""
+# Флаги значения качества в командах build_ffmpeg_command (CRF и аналоги аппаратных)
+QUALITY_FLAGS = ('-crf', '-qp', '-cq', '-global_quality', '-qp_i')
+# Размер кадра в фильтрах scale= и crop= цепочки -vf
+_FILTER_SIZE = re.compile(r'(?:^|,)(scale|crop)=(\d+):(\d+)')
+
+
+def default_db_path():
+    return os.path.join(get_data_dir(), DB_NAME)
+
+
+def db_path_from_config(config):
+    return config.get("history_path") or default_db_path()
+
+
+def command_params(cmd):
+    """Кодек, пресет, качество и битрейт видео из команды ffmpeg (None — нет в команде)."""
+    params = {'codec': None, 'preset': None, 'quality': None, 'bitrate': None}
+    for flag, value in zip(cmd, cmd[1:]):
+        if flag == '-c:v':
+            params['codec'] = value
+        elif flag == '-preset':
+            params['preset'] = value
+        elif flag in QUALITY_FLAGS and params['quality'] is None:
+            params['quality'] = value
+        elif flag == '-b:v' and value != '0':
+            params['bitrate'] = value
+    return params
+
+
+def command_resolution(cmd, input_file=None):
+    """Класс разрешения результата команды ffmpeg ('sd'…'uhd') или None.
+
+    Размер берётся из scale=/crop= в -vf (масштабирование — последнее в
+    цепочке vvc_core.video_filters), без них — из сведений об исходнике в
+    кэше vvc_probe (ffprobe не запускается).
+    """
+    size = None
+    for flag, value in zip(cmd, cmd[1:]):
+        if flag == '-vf':
+            for kind, width, height in _FILTER_SIZE.findall(value):
+                if kind == 'scale' or size is None:
+                    size = int(width), int(height)
+    if size is None and input_file:
+        video = (cached_media_info(input_file) or {}).get('video') or {}
+        if video.get('width') and video.get('height'):
+            size = video['width'], video['height']
+    return resolution_class(*size) if size else None
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def job_mode(job):
+    if job.mode:
+        return job.mode
+    if job.resumable is not None:
+        return 'resumable'
+    return '2pass' if len(job.passes) > 1 else 'single'
+
+
+def record_from_job(job):
+    """Строка истории из завершённого vvc_jobs.Job."""
+    wall = (job.end_time - job.start_time) if job.start_time and job.end_time else None
+    last = job.last_progress
+    frames = last.frame if last is not None and last.frame else job.total_frames or None
+    input_size, output_size = _size(job.input_file), _size(job.output_file)
+    if job.status != Job.DONE:
+        output_size = None  # Незавершённый результат не показателен
+    record = {
+        'started': job.start_time, 'finished': job.end_time, 'host': job.host or platform.node(),
+        'status': job.status, 'return_code': job.return_code, 'mode': job_mode(job),
+        'input': os.path.abspath(job.input_file), 'output': os.path.abspath(job.output_file),
+        'input_size': input_size, 'output_size': output_size,
+        'compression': round(input_size / output_size, 3) if input_size and output_size else None,
+        'command': json.dumps(job.cmd, ensure_ascii=False),
+        'duration': job.duration or None, 'frames': frames,
+        'wall_s': round(wall, 3) if wall is not None else None,
+        'cpu_s': round(job.cpu_time, 3) if job.cpu_time is not None else None,
+        'fps': round(frames / wall, 3) if frames and wall else None,
+        'speed': round(job.duration / wall, 4) if job.duration and wall else None,
+    }
+    record.update(command_params(job.cmd))
+    record['resolution'] = command_resolution(job.cmd, job.input_file)
+    return record
+
+
+class JobHistory:
+    """База истории заданий (потокобезопасная: пишут рабочие потоки очереди).
+
+    Файл открывается при первом обращении, поэтому создание объекта ничего
+    не стоит при запуске программы.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_db_path()
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            import sqlite3
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._db.row_factory = sqlite3.Row
+            with self._db:
+                self._db.executescript(_SCHEMA)
+                columns = {row['name'] for row in self._db.execute("PRAGMA table_info(jobs)")}
+                if 'resolution' not in columns:
+                    # База версии 1: разрешение старых заданий неизвестно
+                    self._db.execute("ALTER TABLE jobs ADD COLUMN resolution TEXT")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return self._db
+
+    def add(self, record):
+        """Запись строки (словарь с ключами COLUMNS). Возвращает id."""
+        values = [record.get(c) for c in COLUMNS]
+        with self._lock:
+            db = self._connect()
+            with db:
+                cursor = db.execute(
+                    f"INSERT INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    values)
+            return cursor.lastrowid
+
+    def add_job(self, job):
+        return self.add(record_from_job(job))
+
+    def rows(self, limit=None):
+        """Строки истории, новые первыми (словари с id и COLUMNS)."""
+        sql = "SELECT * FROM jobs ORDER BY started DESC, id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._connect().execute(sql)]
+
+    def summary(self, host=None):
+        """Производительность по кодеку и пресету (только успешные задания).
+
+        Для каждой пары: jobs, media_s (секунд видео), wall_s, cpu_s,
+        speed (media_s / wall_s), fps, compression — средние.
+        """
+        sql = ("SELECT codec, preset, COUNT(*) AS jobs, SUM(duration) AS media_s, "
+               "SUM(wall_s) AS wall_s, SUM(cpu_s) AS cpu_s, AVG(fps) AS fps, "
+               "AVG(compression) AS compression FROM jobs "
+               "WHERE status = 'done' AND wall_s > 0 AND duration > 0")
+        args = []
+        if host:
+            sql += " AND host = ?"
+            args.append(host)
+        sql += " GROUP BY codec, preset ORDER BY jobs DESC"
+        with self._lock:
+            rows = [dict(row) for row in self._connect().execute(sql, args)]
+        for row in rows:
+            row['speed'] = row['media_s'] / row['wall_s'] if row['wall_s'] else None
+        return rows
+
+    def speed(self, codec, preset=None, host=None, resolution=None):
+        """Средняя скорость (секунд видео в секунду работы) для кодека/пресета/
+        класса разрешения по истории этой машины или None, если успешных заданий нет."""
+        sql = ("SELECT SUM(duration), SUM(wall_s) FROM jobs WHERE status = 'done' "
+               "AND wall_s > 0 AND duration > 0 AND codec = ? AND host = ?")
+        args = [codec, host or platform.node()]
+        if preset:
+            sql += " AND preset = ?"
+            args.append(preset)
+        if resolution:
+            sql += " AND resolution = ?"
+            args.append(resolution)
+        with self._lock:
+            media_s, wall_s = self._connect().execute(sql, args).fetchone()
+        return media_s / wall_s if media_s and wall_s else None
+
+    def speed_for(self, cmd, input_file=None):
+        """Скорость для команды cmd: сначала задания того же кодека, пресета и
+        разрешения (command_resolution), затем без разрешения, затем только
+        кодека. None — нет данных."""
+        params = command_params(cmd)
+        if not params['codec']:
+            return None
+        codec, preset = params['codec'], params['preset']
+        resolution = command_resolution(cmd, input_file)
+        return ((resolution and self.speed(codec, preset, resolution=resolution))
+                or self.speed(codec, preset) or self.speed(codec))
+
+    def estimate_seconds(self, cmd, duration, input_file=None):
+        """Оценка времени кодирования duration секунд видео командой cmd по истории."""
+        if not duration:
+            return None
+        speed = self.speed_for(cmd, input_file)
+        return duration / speed if speed else None
+
+    def export_csv(self, path):
+        """Выгрузка всей истории в CSV (UTF-8 с BOM — открывается в Excel). Возвращает число строк."""
+        rows = self.rows()
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(('id',) + COLUMNS)
+            for row in reversed(rows):
+                values = dict(row)
+                for key in ('started', 'finished'):
+                    if values[key]:
+                        values[key] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(values[key]))
+                if values['command']:
+                    values['command'] = ' '.join(json.loads(values['command']))
+                writer.writerow([values['id']] + [values[c] for c in COLUMNS])
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def history_from_config(config):
+    """JobHistory по конфигурации или None, если история отключена."""
+    if not config.get("history_enabled", True):
+        return None
+    return JobHistory(db_path_from_config(config))
+
+
+def _fmt(value, width, digits=2):
+    return f"{value:>{width}.{digits}f}" if value is not None else f"{'—':>{width}}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="vvc_history.py",
+        description="История заданий конвертации: просмотр, сводка, выгрузка в CSV.")
+    parser.add_argument('--config', default="ffmpeg_converter_config.json")
+    parser.add_argument('--db', help="файл базы (перекрывает конфигурацию)")
+    parser.add_argument('-n', '--limit', type=int, default=20, help="сколько последних заданий показать")
+    parser.add_argument('--summary', action='store_true', help="производительность по кодеку и пресету")
+    parser.add_argument('--host', help="только задания этой машины (для --summary)")
+    parser.add_argument('--csv', metavar='PATH', help="выгрузить всю историю в CSV")
+    args = parser.parse_args(argv)
+
+    path = args.db or db_path_from_config(ConfigManager(args.config).load())
+    if not os.path.exists(path):
+        print(f"История пуста: {path}", file=sys.stderr)
+        return 1
+    history = JobHistory(path)
+    if args.csv:
+        count = history.export_csv(args.csv)
+        print(f"Выгружено заданий: {count} → {args.csv}")
+    elif args.summary:
+        print(f"{'кодек':<14}{'пресет':<10}{'заданий':>8}{'видео, ч':>10}{'скорость':>10}"
+              f"{'fps':>9}{'ЦП, ч':>8}{'сжатие':>8}")
+        for row in history.summary(args.host):
+            cpu_h = row['cpu_s'] / 3600 if row['cpu_s'] else None
+            print(f"{row['codec'] or '—':<14}{row['preset'] or '—':<10}{row['jobs']:>8}"
+                  f"{row['media_s'] / 3600:>10.2f}{_fmt(row['speed'], 10)}{_fmt(row['fps'], 9, 1)}"
+                  f"{_fmt(cpu_h, 8)}{_fmt(row['compression'], 8, 1)}")
+    else:
+        for row in history.rows(args.limit):
+            started = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['started'] or 0))
+            print(f"{started}  {row['status']:<8}{row['codec'] or '—':<12}{_fmt(row['wall_s'], 9, 0)} с"
+                  f"{_fmt(row['speed'], 8)}x  {os.path.basename(row['input'])}")
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,684 @@
+"""Очередь заданий конвертации и пул рабочих потоков ffmpeg.
+
+Модуль не зависит от Tkinter: все изменения состояния сообщаются через
+callback on_event(dict) — GUI кладёт эти словари в свой ui_queue.
+"""
+import collections
+import contextlib
+import itertools
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vvc_core import TARGET_SIZE_TOLERANCE, check_target_size
+from vvc_cpu import cpu_budget
+from vvc_eta import EtaEstimator, batch_eta, format_eta, prior_estimate, prior_rate
+from vvc_supervisor import supervisor
+
+# Как часто пересчитывать оставшееся время очереди, секунд
+QUEUE_ETA_INTERVAL = 2.0
+
+
+def _to_float(value):
+    """Число из значения -progress; 'N/A' и пустые значения → None."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProgressRecord:
+    """Один блок структурированного прогресса ffmpeg (-progress).
+
+    ffmpeg пишет блоки строк key=value, завершающиеся progress=continue
+    или progress=end. Неизвестные на момент записи значения (N/A) — None.
+    """
+    __slots__ = ('frame', 'fps', 'out_time', 'total_size', 'bitrate', 'speed', 'finished')
+
+    def __init__(self, frame=None, fps=None, out_time=None, total_size=None,
+                 bitrate=None, speed=None, finished=False):
+        self.frame = frame            # обработано кадров
+        self.fps = fps                # кадров в секунду
+        self.out_time = out_time      # позиция в выходном потоке, секунд
+        self.total_size = total_size  # записано байт
+        self.bitrate = bitrate        # кбит/с
+        self.speed = speed            # множитель скорости относительно реального времени
+        self.finished = finished      # progress=end
+
+    @classmethod
+    def from_fields(cls, fields):
+        frame = _to_float(fields.get('frame'))
+        total_size = _to_float(fields.get('total_size'))
+        # out_time_ms исторически тоже в микросекундах
+        out_time_us = _to_float(fields.get('out_time_us', fields.get('out_time_ms')))
+        return cls(
+            frame=int(frame) if frame is not None else None,
+            fps=_to_float(fields.get('fps')),
+            out_time=max(0.0, out_time_us / 1_000_000) if out_time_us is not None else None,
+            total_size=int(total_size) if total_size is not None else None,
+            bitrate=_to_float(fields.get('bitrate', '').replace('kbits/s', '')),
+            speed=_to_float(fields.get('speed', '').rstrip('x')),
+            finished=fields.get('progress') == 'end',
+        )
+
+
+def run_ffmpeg(cmd, on_output=None, on_progress=None, on_start=None, budget=None):
+    """Выполнение ffmpeg со структурированным прогрессом.
+
+    К команде добавляются -nostats (строка статистики с \r больше не засоряет
+    лог) и -progress pipe:1: блоки key=value читаются из stdout и передаются
+    в on_progress(ProgressRecord). Сообщения stderr — в on_output(line),
+    on_start(process) вызывается сразу после запуска (для остановки извне).
+    budget (vvc_cpu.CoreBudget) — процесс получает долю ядер: число потоков
+    по её размеру и привязку к её ядрам на всё время работы.
+    Процесс запускается супервизором (vvc_supervisor): вывод читается в его
+    потоке, вызывающий поток только ждёт. Возвращает код возврата процесса;
+    процессорное время процесса после завершения — в process.cpu_time
+    (None, если неизвестно).
+    """
+    if budget is not None:
+        with budget.share() as share:
+            def pin_and_start(process):
+                share.pin(process)
+                if on_start:
+                    on_start(process)
+            return run_ffmpeg(share.apply(cmd), on_output, on_progress, pin_and_start)
+    cmd = [cmd[0], '-nostats', '-progress', 'pipe:1'] + list(cmd[1:])
+    parse = (lambda fields: on_progress(ProgressRecord.from_fields(fields))) if on_progress else None
+    return supervisor.run(cmd, on_output=on_output, on_progress=parse, on_start=on_start)
+
+
+def progress_fraction(record, duration=None, total_frames=None):
+    """Доля выполнения 0..1 по времени, а при неизвестной длительности — по кадрам."""
+    if duration and record.out_time is not None:
+        return min(1.0, record.out_time / duration)
+    if total_frames and record.frame is not None:
+        return min(1.0, record.frame / total_frames)
+    return None
+
+
+def processes_cpu_time(processes):
+    """Суммарное процессорное время завершённых процессов run_ffmpeg; None, если
+    хотя бы для одного оно неизвестно или процессов не было."""
+    times = [getattr(p, 'cpu_time', None) for p in processes]
+    if not times or None in times:
+        return None
+    return sum(times)
+
+
+class ProcessGroup:
+    """Процессы run_ffmpeg одной операции (образцы, фрагменты, миниатюры).
+
+    run() запускает процесс и учитывает его, пока он работает; stop() из
+    любого потока (в том числе из Tk) останавливает все процессы группы без
+    ожидания и не даёт запуститься новым. После stop() stopped — True.
+    """
+
+    def __init__(self):
+        self._processes = set()
+        self._lock = threading.Lock()
+        self.stopped = False
+
+    def run(self, cmd, on_output=None, on_progress=None, on_start=None, budget=None):
+        """run_ffmpeg с учётом процесса; -1, если группа уже остановлена."""
+        holder = []
+
+        def track(process):
+            holder.append(process)
+            with self._lock:
+                self._processes.add(process)
+                stopped = self.stopped
+            if stopped:
+                process.stop()  # stop() пришёл, пока процесс запускался
+            if on_start:
+                on_start(process)
+
+        if self.stopped:
+            return -1
+        try:
+            return run_ffmpeg(cmd, on_output=on_output, on_progress=on_progress, on_start=track,
+                              budget=budget)
+        finally:
+            with self._lock:
+                self._processes.difference_update(holder)
+
+    def stop(self, grace=5.0):
+        """terminate → kill выполняет супервизор; список Future (True — понадобился kill)."""
+        with self._lock:
+            self.stopped = True
+            processes = list(self._processes)
+        return [process.stop(grace) for process in processes]
+
+
+class Job:
+    """Задание очереди: снимок команды ffmpeg и состояние выполнения"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STOPPED = "stopped"
+
+    STATUS_NAMES = {
+        QUEUED: "В очереди",
+        RUNNING: "Выполняется",
+        DONE: "Готово",
+        FAILED: "Ошибка",
+        STOPPED: "Остановлено",
+    }
+
+    _ids = itertools.count(1)
+
+    def __init__(self, input_file, output_file, cmd, duration=None, passes=None, work_dir=None):
+        self.id = next(Job._ids)
+        self.input_file = input_file
+        self.output_file = output_file
+        # Команда фиксируется при добавлении — последующие изменения
+        # настроек в окне не влияют на уже поставленные задания.
+        self.cmd = list(cmd)
+        # Двухпроходное кодирование: команды проходов по порядку (cmd — последний)
+        self.passes = [list(c) for c in passes] if passes else [self.cmd]
+        # Папка журналов проходов: создаётся перед запуском, удаляется после
+        self.work_dir = work_dir
+        # Цель режима «Размер файла», МБ — для проверки результата
+        self.target_size = None
+        # Возобновляемый режим (vvc_resume.ResumableEncoder) вместо passes
+        self.resumable = None
+        # on_finish(job) — вызывается в рабочем потоке после завершения (папки наблюдения)
+        self.on_finish = None
+        # Режим для истории (vvc_history): None — определяется по passes/resumable
+        self.mode = None
+        # None — длительность определит рабочий поток перед запуском
+        self.duration = duration
+        # Число кадров — для прогресса, если длительность неизвестна
+        self.total_frames = None
+        self.last_progress = None
+        # Оценка оставшегося времени (vvc_eta.EtaEstimator), пока задание выполняется
+        self.eta = None
+        self.status = Job.QUEUED
+        self.progress = 0.0
+        self.return_code = None
+        self.start_time = None
+        self.end_time = None
+        # Процессорное время всех процессов задания, секунд (None — неизвестно)
+        self.cpu_time = None
+        self.process = None
+        # Машина, выполнившая задание (агент фермы vvc_farm); None — эта
+        self.host = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.input_file)
+
+    @property
+    def status_name(self):
+        return Job.STATUS_NAMES.get(self.status, self.status)
+
+    @property
+    def remote_capable(self):
+        """Задание можно отдать агенту фермы: одна команда без локальных файлов
+        (журналы двух проходов и сегменты возобновляемого режима — только здесь)."""
+        return len(self.passes) == 1 and self.resumable is None and not self.work_dir
+
+
+class JobQueue:
+    """Очередь заданий, разбираемая пулом из N рабочих потоков.
+
+    Каждый рабочий поток запускает собственный процесс ffmpeg. События:
+        {'type': 'job', 'job': Job, 'text': str}  — изменение статуса/прогресса
+        {'type': 'log', 'message': str, 'level': str}
+        {'type': 'queue_eta', 'eta': tuple|None}   — оставшееся время очереди (batch_eta):
+                                                     (секунды, оптимистично, пессимистично)
+        {'type': 'queue_done', 'cpu': dict}        — все рабочие потоки завершились;
+                                                     cpu — отчёт CoreBudget.report за прогон
+    Одновременные процессы делят ядра через budget (vvc_cpu.CoreBudget).
+    Завершённые задания записываются в history (vvc_history.JobHistory),
+    все изменения заданий передаются в metrics (vvc_metrics.Metrics).
+    Агенты farm (vvc_farm.Farm) опрашиваются при запуске, и на каждое их
+    свободное место запускается ещё один рабочий поток: он берёт задания
+    remote_capable и выполняет их на агенте. Если агент недоступен, задание
+    возвращается в очередь и выполняется локально.
+    """
+
+    def __init__(self, workers=1, on_event=None, probe_duration=None, probe_frames=None,
+                 budget=cpu_budget, history=None, metrics=None, farm=None):
+        self.max_workers = max(1, int(workers))
+        self.budget = budget
+        self.history = history
+        self.metrics = metrics
+        self.farm = farm
+        self._cpu_stats = None
+        self.on_event = on_event or (lambda event: None)
+        self.probe_duration = probe_duration
+        self.probe_frames = probe_frames
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._workers = []
+        self._stopping = False
+        self._eta_thread = None
+        # Для batch_eta: длительность по входному файлу и ожидаемая скорость по
+        # id задания. Считаются в фоне при добавлении (_plan_job), читаются под _lock
+        self._durations = {}
+        self._priors = {}
+        self._planner = None
+
+    # --- Управление списком ---
+
+    def add(self, job):
+        with self._lock:
+            self._jobs.append(job)
+        self._plan_job(job)
+        self._emit_job(job)
+        if self.is_running():
+            self._spawn_workers()
+        return job
+
+    def remove(self, job_id):
+        """Удаление задания. Выполняющиеся задания не удаляются."""
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id and job.status != Job.RUNNING:
+                    self._jobs.remove(job)
+                    self._priors.pop(job.id, None)
+                    if self.metrics is not None:
+                        self.metrics.forget(job)
+                    return True
+        return False
+
+    def move(self, job_id, delta):
+        """Сдвиг задания на delta позиций (отрицательное — вверх)."""
+        with self._lock:
+            for index, job in enumerate(self._jobs):
+                if job.id == job_id:
+                    new_index = max(0, min(len(self._jobs) - 1, index + delta))
+                    self._jobs.insert(new_index, self._jobs.pop(index))
+                    return new_index
+        return None
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def get(self, job_id):
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def requeue(self, job_id):
+        """Вернуть завершившееся с ошибкой/остановленное задание в очередь."""
+        with self._lock:
+            job = next((j for j in self._jobs if j.id == job_id), None)
+            if job is None or job.status not in (Job.FAILED, Job.STOPPED):
+                return False
+            job.status, job.progress, job.return_code = Job.QUEUED, 0.0, None
+        self._emit_job(job)
+        if self.is_running():
+            self._spawn_workers()
+        return True
+
+    def clear_finished(self):
+        with self._lock:
+            self._jobs = [j for j in self._jobs if j.status in (Job.QUEUED, Job.RUNNING)]
+
+    # --- Рабочие потоки ---
+
+    def set_workers(self, count):
+        self.max_workers = max(1, int(count))
+        if self.is_running():
+            self._spawn_workers()
+
+    def is_running(self):
+        with self._lock:
+            return any(t.is_alive() for t in self._workers)
+
+    def start(self):
+        self._stopping = False
+        if not self.is_running():
+            self._cpu_stats = self.budget.stats() if self.budget else None
+        self._spawn_workers()
+        if self.farm is not None:
+            # Опрос агентов по сети — не в вызывающем (возможно, Tk-) потоке
+            threading.Thread(target=self._start_farm, daemon=True).start()
+        if self._eta_thread is None or not self._eta_thread.is_alive():
+            self._eta_thread = threading.Thread(target=self._eta_loop, name="queue-eta", daemon=True)
+            self._eta_thread.start()
+
+    def _start_farm(self):
+        with self._lock:
+            busy = {t.remote for t in self._workers if t.is_alive()}
+        # Агенты, где уже работают наши потоки, не опрашиваются: их места заняты нами
+        for worker, error in self.farm.probe([w for w in self.farm.workers if w not in busy]):
+            if error is not None:
+                self.on_event({'type': 'log', 'level': 'warning',
+                               'message': f"Ферма: агент недоступен — {error}"})
+            else:
+                self.on_event({'type': 'log', 'level': 'info',
+                               'message': f"Ферма: {worker.name} ({worker.address}) — "
+                                          f"свободно мест {worker.free} из {worker.slots}"})
+        self._spawn_workers()
+
+    def _spawn_workers(self):
+        with self._lock:
+            self._workers = [t for t in self._workers if t.is_alive()]
+            pending = [j for j in self._jobs if j.status == Job.QUEUED]
+            local = sum(1 for t in self._workers if t.remote is None)
+            needed = max(0, min(self.max_workers - local, len(pending)))
+            spawn = [None] * needed
+            # Оставшиеся задания — свободным местам агентов
+            remote_pending = sum(1 for j in pending[needed:] if j.remote_capable)
+            for remote in self.farm.workers if self.farm is not None else []:
+                if not remote.online:
+                    continue
+                running = sum(1 for t in self._workers if t.remote is remote)
+                count = max(0, min(remote.free - running, remote_pending))
+                spawn += [remote] * count
+                remote_pending -= count
+            for remote in spawn:
+                worker = threading.Thread(target=self._worker_loop, args=(remote,), daemon=True)
+                worker.remote = remote
+                self._workers.append(worker)
+                worker.start()
+
+    def stop(self):
+        """Остановка: новые задания не берутся, текущие процессы завершаются.
+
+        Не ждёт процессы: terminate → kill выполняет супервизор, результат
+        приходит событием log (метод можно вызывать из Tk-потока).
+        """
+        self._stopping = True
+        for job in self.jobs():
+            process = job.process
+            if job.status == Job.RUNNING and process is not None:
+                process.stop().add_done_callback(
+                    lambda future, name=job.name: self._report_stop(name, future))
+
+    def _report_stop(self, name, future):
+        try:
+            if future.result():
+                self.on_event({'type': 'log', 'level': 'error',
+                               'message': f"{name}: принудительно завершено (kill)"})
+        except Exception as e:
+            self.on_event({'type': 'log', 'level': 'error',
+                           'message': f"{name}: ошибка при остановке: {e}"})
+
+    def _next_job(self, remote=None):
+        with self._lock:
+            if self._stopping:
+                return None
+            for job in self._jobs:
+                if job.status == Job.QUEUED and (remote is None or job.remote_capable):
+                    job.status = Job.RUNNING
+                    return job
+        return None
+
+    def _worker_loop(self, remote=None):
+        # Локальный рабочий поток заранее занимает долю ядер: -threads
+        # первых заданий пачки считается по числу потоков, а не по одному
+        planned = (self.budget.expect(1) if self.budget and remote is None
+                   else contextlib.nullcontext())
+        try:
+            with planned:
+                while True:
+                    job = self._next_job(remote)
+                    if job is None:
+                        break
+                    process = None
+                    if remote is not None:
+                        try:
+                            process = remote.start(job.cmd, job.input_file, job.output_file)
+                        except ConnectionError as e:
+                            self._requeue_remote(job, remote, e)
+                            break
+                    self._run_job(job, process)
+        finally:
+            with self._lock:
+                current = threading.current_thread()
+                self._workers = [t for t in self._workers if t is not current]
+                last = not self._workers
+            if last:
+                report = self.budget.report(self._cpu_stats) if self.budget else None
+                self.on_event({'type': 'queue_done', 'cpu': report})
+
+    def _requeue_remote(self, job, remote, error):
+        """Агент отказал до запуска: задание — обратно в очередь, агент — вне работы."""
+        remote.online = False
+        with self._lock:
+            job.status = Job.QUEUED
+        self._emit_job(job)
+        self.on_event({'type': 'log', 'level': 'warning',
+                       'message': f"[{job.id}] Ферма: {error} — задание вернётся в очередь"})
+        self._spawn_workers()
+
+    def _run_job(self, job, remote_process=None):
+        """Выполнение задания; remote_process — уже запущенный на агенте (vvc_farm.RemoteProcess)."""
+        job.start_time = time.time()
+        job.progress = 0.0
+        job.host = remote_process.worker.name if remote_process is not None else None
+        processes = []
+        # Хвост вывода ffmpeg на агенте (и ошибки связи с ним) — в лог при ошибке
+        tail = collections.deque(maxlen=5)
+        self._emit_job(job, "Запуск...")
+        try:
+            if job.duration is None and self.probe_duration:
+                job.duration = self.probe_duration(job.input_file) or 0.0
+            if not job.duration and self.probe_frames:
+                job.total_frames = self.probe_frames(job.input_file) or None
+            with self._lock:
+                planned = self._priors.get(job.id)
+            job.eta = EtaEstimator(planned or prior_rate(self.history, job.cmd, job.duration,
+                                                         job.input_file), job.start_time)
+            if job.work_dir:
+                os.makedirs(job.work_dir, exist_ok=True)
+
+            def on_start(process):
+                job.process = process
+                processes.append(process)
+
+            if remote_process is not None:
+                on_start(remote_process)
+                self.on_event({'type': 'log', 'level': 'info',
+                               'message': f"[{job.id}] Агент {job.host}: Запуск: {' '.join(job.cmd)}"})
+                rc = remote_process.follow(
+                    on_progress=lambda record: self._update_job_progress(job, record),
+                    on_output=tail.append)
+            elif job.resumable is not None:
+                rc = job.resumable.run(
+                    on_start=on_start, duration=job.duration,
+                    on_progress=lambda seconds, text: self._update_job_seconds(job, seconds))
+            else:
+                rc = self._run_passes(job, on_start)
+                if rc == 0 and job.mode == 'smart_cut' and not self._stopping:
+                    rc = self._check_decode(job, on_start)
+            job.return_code = rc
+            if self._stopping:
+                job.status = Job.STOPPED
+            elif rc == 0:
+                job.status, job.progress = Job.DONE, 100.0
+                self._check_target_size(job)
+            else:
+                job.status = Job.FAILED
+                for line in tail:
+                    self.on_event({'type': 'log', 'level': 'error',
+                                   'message': f"[{job.id}] {job.host}: {line}"})
+                self.on_event({'type': 'log', 'level': 'error',
+                               'message': f"[{job.id}] {job.name}: код возврата {rc}"})
+        except Exception as e:
+            job.status = Job.FAILED
+            self.on_event({'type': 'log', 'level': 'error',
+                           'message': f"[{job.id}] {job.name}: {e}"})
+        finally:
+            if job.work_dir:
+                shutil.rmtree(job.work_dir, ignore_errors=True)
+            job.process = None
+            job.eta = None
+            job.end_time = time.time()
+            job.cpu_time = processes_cpu_time(processes)
+            self._emit_job(job)
+            self._emit_eta()
+            self._record_history(job)
+            if job.on_finish:
+                try:
+                    job.on_finish(job)
+                except Exception as e:
+                    self.on_event({'type': 'log', 'level': 'error',
+                                   'message': f"[{job.id}] {job.name}: {e}"})
+
+    def _record_history(self, job):
+        if self.history is None:
+            return
+        try:
+            self.history.add_job(job)
+        except Exception as e:
+            self.on_event({'type': 'log', 'level': 'warning',
+                           'message': f"[{job.id}] История заданий: {e}"})
+
+    def _run_passes(self, job, on_start):
+        rc = 0
+        for index, cmd in enumerate(job.passes):
+            label = f"Проход {index + 1}/{len(job.passes)}: " if len(job.passes) > 1 else ""
+            self.on_event({'type': 'log', 'level': 'info',
+                           'message': f"[{job.id}] {label}Запуск: {' '.join(cmd)}"})
+
+            def on_progress(record, index=index):
+                self._update_job_progress(job, record, index, len(job.passes))
+
+            rc = run_ffmpeg(cmd, on_progress=on_progress, on_start=on_start, budget=self.budget)
+            if rc != 0 or self._stopping:
+                break
+        return rc
+
+    def _check_decode(self, job, on_start):
+        """Умная обрезка: результат должен декодироваться и за стыками частей."""
+        from vvc_chunks import check_decode
+        self._emit_job(job, "Проверка склейки...")
+        rc, errors = check_decode(job.cmd[0], job.output_file, on_start)
+        for line in errors:
+            self.on_event({'type': 'log', 'level': 'error',
+                           'message': f"[{job.id}] {job.name}: ошибка декодирования: {line}"})
+        return rc
+
+    def _check_target_size(self, job):
+        result = check_target_size(job.output_file, job.target_size) if job.target_size else None
+        if result is None:
+            return
+        size_mb, deviation = result
+        level = 'success' if abs(deviation) <= TARGET_SIZE_TOLERANCE else 'warning'
+        self.on_event({'type': 'log', 'level': level,
+                       'message': f"[{job.id}] {job.name}: {size_mb:.1f} МБ "
+                                  f"(цель {job.target_size} МБ, {deviation * 100:+.1f}%)"})
+
+    def _update_job_progress(self, job, record, pass_index=0, pass_count=1):
+        job.last_progress = record
+        fraction = progress_fraction(record, job.duration, job.total_frames)
+        if fraction is not None:
+            job.progress = min(100.0, (pass_index + fraction) / pass_count * 100)
+            # Скорость ffmpeg — в долях всего задания в секунду
+            rate = None
+            if record.speed and job.duration:
+                rate = record.speed / (job.duration * pass_count)
+            elif record.fps and job.total_frames:
+                rate = record.fps / (job.total_frames * pass_count)
+            self._progress_text(job, rate)
+        elif record.frame is not None:
+            self._emit_job(job, f"кадр {record.frame}")
+
+    def _update_job_seconds(self, job, seconds):
+        if job.duration:
+            job.progress = min(100.0, seconds / job.duration * 100)
+            self._progress_text(job)
+
+    def _progress_text(self, job, rate=None):
+        text = f"{job.progress:.1f}%"
+        if job.eta is not None:
+            job.eta.update(job.progress / 100, rate)
+            estimate = job.eta.estimate()
+            if estimate:
+                text += f" · {format_eta(estimate)}"
+        self._emit_job(job, text)
+
+    # --- Оценка времени очереди ---
+
+    def _plan_job(self, job):
+        """Длительность и скорость из истории для batch_eta — в фоне, без ffprobe
+        и SQLite в вызывающем потоке (Tk или цикл супервизора)."""
+        with self._lock:
+            if self._planner is None:
+                self._planner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-plan")
+            planner = self._planner
+        planner.submit(self._plan, job)
+
+    def _plan(self, job):
+        duration = job.duration
+        if not duration:
+            with self._lock:
+                known = job.input_file in self._durations
+                duration = self._durations.get(job.input_file)
+            if not known and self.probe_duration:
+                try:
+                    duration = self.probe_duration(job.input_file) or None
+                except Exception:
+                    duration = None
+                with self._lock:
+                    self._durations[job.input_file] = duration
+        rate = prior_rate(self.history, job.cmd, duration, job.input_file)
+        with self._lock:
+            self._priors[job.id] = rate
+
+    def batch_eta(self):
+        """Оставшееся время очереди (vvc_eta.batch_eta) или None, если его не оценить.
+
+        Выполняющиеся задания — по их EtaEstimator, ожидающие — по скорости из
+        истории для их команды (_plan_job), а без истории — по средней скорости
+        выполняющихся заданий. Только расчёт по готовым данным: ожидающие
+        задания, для которых _plan_job ещё не закончил, дают None.
+        """
+        with self._lock:
+            running = [j for j in self._jobs if j.status == Job.RUNNING]
+            queued = [(j, j.duration or self._durations.get(j.input_file), self._priors.get(j.id))
+                      for j in self._jobs if j.status == Job.QUEUED]
+            planned = all(j.id in self._priors for j, _, _ in queued)
+        if not planned:
+            return None
+        running_eta, speeds = [], []
+        for job in running:
+            estimate = job.eta.estimate() if job.eta is not None else None
+            if estimate is None:
+                return None
+            running_eta.append(estimate)
+            rate = job.eta.rate()
+            if rate and job.duration:
+                speeds.append(rate[0] * job.duration)
+        queued_eta = []
+        for _, duration, rate in queued:
+            if not duration:
+                return None
+            if rate:
+                queued_eta.append(prior_estimate(1 / rate))
+            elif speeds:
+                queued_eta.append(prior_estimate(duration / (sum(speeds) / len(speeds))))
+            else:
+                return None
+        if not running_eta and not queued_eta:
+            return None
+        workers = self.max_workers + (self.farm.capacity() if self.farm is not None else 0)
+        return batch_eta(running_eta, queued_eta, workers)
+
+    def _eta_loop(self):
+        """Периодическая оценка очереди в своём потоке, пока работают рабочие потоки."""
+        while True:
+            time.sleep(QUEUE_ETA_INTERVAL)
+            if not self.is_running():
+                return
+            self._emit_eta()
+
+    def _emit_eta(self):
+        self.on_event({'type': 'queue_eta', 'eta': self.batch_eta()})
+
+    def _emit_job(self, job, text=None):
+        if self.metrics is not None:
+            self.metrics.observe_job(job)
+        self.on_event({'type': 'job', 'job': job,
+                       'text': text if text is not None else job.status_name})
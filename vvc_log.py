@@ -0,0 +1,96 @@
+"""Кольцевой буфер лога с пакетной выдачей строк в интерфейс.
+
+Рабочие потоки добавляют строки через append() (потокобезопасно), Tk-поток
+раз в тик забирает все накопившиеся строки через drain() и вставляет их в
+виджет одним вызовом. И хранилище, и очередь на отображение ограничены
+max_lines, а длина строки — max_line_chars, поэтому память лога ограничена
+сверху независимо от длительности кодирования.
+"""
+import collections
+import sys
+import threading
+
+# Порядок уровней для фильтрации: показываются строки с уровнем >= порога
+LEVEL_ORDER = {'info': 0, 'success': 0, 'warning': 1, 'error': 2}
+
+# Приблизительные накладные расходы на запись (кортеж + ссылки в deque), байт
+_ENTRY_OVERHEAD = sys.getsizeof((None, None)) + 16
+
+
+class LogBuffer:
+    """Ограниченное хранилище строк лога и очередь ещё не показанных строк"""
+
+    def __init__(self, max_lines=5000, max_line_chars=2000):
+        self.max_line_chars = max_line_chars
+        self._lock = threading.Lock()
+        self._lines = collections.deque(maxlen=max_lines)
+        self._pending = collections.deque(maxlen=max_lines)
+        self._bytes = 0
+        # Строки, вытесненные из очереди до того, как их успели показать
+        self.dropped = 0
+        self.last_tick = 0.0
+        self.max_tick = 0.0
+
+    @property
+    def max_lines(self):
+        return self._lines.maxlen
+
+    def set_max_lines(self, max_lines):
+        with self._lock:
+            self._lines = collections.deque(self._lines, maxlen=max_lines)
+            self._pending = collections.deque(self._pending, maxlen=max_lines)
+            self._bytes = sum(self._entry_size(e) for e in self._lines)
+
+    @staticmethod
+    def _entry_size(entry):
+        return sys.getsizeof(entry[1]) + _ENTRY_OVERHEAD
+
+    def append(self, message, level='info'):
+        if len(message) > self.max_line_chars:
+            message = message[:self.max_line_chars] + '…'
+        entry = (level, message)
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._bytes -= self._entry_size(self._lines[0])
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._lines.append(entry)
+            self._pending.append(entry)
+            self._bytes += self._entry_size(entry)
+
+    def drain(self, limit=None):
+        """Забрать до limit ещё не показанных строк (старые первыми)."""
+        with self._lock:
+            if limit is None or limit >= len(self._pending):
+                entries = list(self._pending)
+                self._pending.clear()
+            else:
+                entries = [self._pending.popleft() for _ in range(limit)]
+        return entries
+
+    def snapshot(self):
+        """Все хранимые строки — для перерисовки при смене фильтра."""
+        with self._lock:
+            return list(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._pending.clear()
+            self._bytes = 0
+
+    def record_tick(self, seconds):
+        """Время, потраченное Tk-потоком на вывод лога за один тик."""
+        self.last_tick = seconds
+        self.max_tick = max(self.max_tick, seconds)
+
+    @property
+    def approx_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._lines)
+
+
+def level_visible(level, min_level):
+    return LEVEL_ORDER.get(level, 0) >= LEVEL_ORDER.get(min_level, 0)
@@ -0,0 +1,243 @@
+"""Метрики заданий для мониторинга: textfile для node_exporter и поток JSONL.
+
+Источник — те же данные, что показывает окно: статусы заданий и
+разобранный прогресс ffmpeg (vvc_jobs.ProgressRecord в job.last_progress).
+JobQueue передаёт каждое изменение задания в observe_job; конвертация из
+окна — тоже в виде Job.
+
+Раз в interval секунд (и при остановке) textfile переписывается целиком
+через временный файл и os.replace — node_exporter (--collector.textfile.directory)
+никогда не видит недописанный файл. В JSONL строка добавляется при каждом
+изменении статуса задания, а раз в interval — выборка по выполняющимся
+заданиям и итоги. Пути задаются в конфигурации (metrics_textfile,
+metrics_jsonl) или ключами --metrics-textfile / --metrics-jsonl.
+"""
+import json
+import os
+import threading
+import time
+
+from vvc_jobs import Job
+
+DEFAULT_INTERVAL = 15.0
+FINISHED = (Job.DONE, Job.FAILED, Job.STOPPED)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def job_codec(job):
+    """Видеокодек задания из команды (-c:v); 'unknown', если его нет."""
+    cmd = job.cmd
+    for flag, value in zip(cmd, cmd[1:]):
+        if flag == '-c:v':
+            return value
+    return 'unknown'
+
+
+class Metrics:
+    """Счётчики и текущие значения заданий (потокобезопасно) и их выгрузка.
+
+    Счётчики считаются с запуска процесса; Prometheus сам учитывает их
+    сброс при перезапуске (rate/increase).
+    """
+
+    def __init__(self, textfile=None, jsonl=None, interval=DEFAULT_INTERVAL, on_event=None):
+        self.textfile = textfile
+        self.jsonl = jsonl
+        self.interval = interval
+        self.on_event = on_event or (lambda event: None)
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        # id → Job для заданий в очереди и выполняющихся, id → последний учтённый статус
+        self._active = {}
+        self._statuses = {}
+        self._finished = {status: 0 for status in FINISHED}
+        self._failures = {}
+        self._bytes_written = 0
+        self._encode_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_error = None
+
+    # --- Сбор ---
+
+    def observe_job(self, job):
+        """Изменение задания: статус или прогресс (вызывается из рабочих потоков)."""
+        event = None
+        with self._lock:
+            previous = self._statuses.get(job.id)
+            if job.status in FINISHED:
+                if job.id not in self._active:
+                    return  # Завершение уже учтено
+                del self._active[job.id]
+                del self._statuses[job.id]
+                self._finished[job.status] += 1
+                if job.status == Job.FAILED:
+                    codec = job_codec(job)
+                    self._failures[codec] = self._failures.get(codec, 0) + 1
+                elif job.status == Job.DONE:
+                    self._bytes_written += self._output_size(job)
+                if job.start_time and job.end_time:
+                    self._encode_seconds += job.end_time - job.start_time
+            else:
+                self._active[job.id] = job
+                self._statuses[job.id] = job.status
+            if previous != job.status:
+                event = self._job_record(job, 'job')
+        if event is not None:
+            self._append_jsonl([event])
+
+    def forget(self, job):
+        """Задание удалено из очереди, не начавшись."""
+        with self._lock:
+            self._active.pop(job.id, None)
+            self._statuses.pop(job.id, None)
+
+    @staticmethod
+    def _output_size(job):
+        try:
+            return os.path.getsize(job.output_file)
+        except OSError:
+            return 0
+
+    def _job_record(self, job, event):
+        record = job.last_progress
+        elapsed = (job.end_time or time.time()) - job.start_time if job.start_time else None
+        return {
+            'ts': round(time.time(), 3), 'event': event, 'id': job.id, 'input': job.input_file,
+            'output': job.output_file, 'codec': job_codec(job), 'status': job.status,
+            'progress': round(job.progress, 2),
+            'fps': record.fps if record else None,
+            'speed': record.speed if record else None,
+            'bitrate_kbps': record.bitrate if record else None,
+            'bytes_written': record.total_size if record else None,
+            'elapsed_s': round(elapsed, 3) if elapsed is not None else None,
+            'return_code': job.return_code,
+        }
+
+    def snapshot(self):
+        """Текущее состояние: итоги и записи выполняющихся заданий."""
+        with self._lock:
+            jobs = list(self._active.values())
+            totals = {
+                'queued': sum(1 for j in jobs if j.status == Job.QUEUED),
+                'running': sum(1 for j in jobs if j.status == Job.RUNNING),
+                'finished': dict(self._finished),
+                'failures_by_codec': dict(self._failures),
+                'bytes_written': self._bytes_written,
+                'encode_seconds': round(self._encode_seconds, 3),
+            }
+            running = [self._job_record(j, 'sample') for j in jobs if j.status == Job.RUNNING]
+        return totals, running
+
+    # --- Выгрузка ---
+
+    def render_prometheus(self):
+        """Текст в формате экспозиции Prometheus."""
+        totals, running = self.snapshot()
+        lines = [
+            "# HELP vvc_jobs Задания в очереди и выполняющиеся.",
+            "# TYPE vvc_jobs gauge",
+            f"vvc_jobs{_labels(state='queued')} {totals['queued']}",
+            f"vvc_jobs{_labels(state='running')} {totals['running']}",
+            "# HELP vvc_jobs_finished_total Завершённые задания по результату.",
+            "# TYPE vvc_jobs_finished_total counter",
+        ]
+        lines += [f"vvc_jobs_finished_total{_labels(status=s)} {n}" for s, n in totals['finished'].items()]
+        lines += ["# HELP vvc_encoder_failures_total Задания с ошибкой по видеокодеку.",
+                  "# TYPE vvc_encoder_failures_total counter"]
+        lines += [f"vvc_encoder_failures_total{_labels(codec=c)} {n}"
+                  for c, n in sorted(totals['failures_by_codec'].items())]
+        lines += ["# HELP vvc_output_bytes_total Размер результатов успешных заданий.",
+                  "# TYPE vvc_output_bytes_total counter",
+                  f"vvc_output_bytes_total {totals['bytes_written']}",
+                  "# HELP vvc_encode_seconds_total Время выполнения завершённых заданий.",
+                  "# TYPE vvc_encode_seconds_total counter",
+                  f"vvc_encode_seconds_total {totals['encode_seconds']}"]
+        gauges = (('fps', 'vvc_job_fps', "Кадров в секунду."),
+                  ('speed', 'vvc_job_speed', "Скорость относительно реального времени."),
+                  ('bitrate_kbps', 'vvc_job_bitrate_kbps', "Текущий битрейт результата, кбит/с."),
+                  ('bytes_written', 'vvc_job_bytes_written', "Записано байт."),
+                  ('elapsed_s', 'vvc_job_elapsed_seconds', "Время с начала задания."),
+                  ('progress', 'vvc_job_progress_percent', "Выполнено, %."))
+        for key, name, help_text in gauges:
+            lines += [f"# HELP {name} {help_text} Только выполняющиеся задания.", f"# TYPE {name} gauge"]
+            for job in running:
+                if job[key] is not None:
+                    labels = _labels(job=job['id'], input=os.path.basename(job['input']),
+                                     codec=job['codec'])
+                    lines.append(f"{name}{labels} {job[key]}")
+        lines += ["# HELP vvc_metrics_updated_seconds Время записи файла.",
+                  "# TYPE vvc_metrics_updated_seconds gauge",
+                  f"vvc_metrics_updated_seconds {time.time():.3f}"]
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        if not self.textfile:
+            return
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.textfile}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, self.textfile)
+
+    def _append_jsonl(self, records):
+        if not self.jsonl or not records:
+            return
+        with self._file_lock:
+            with open(self.jsonl, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        """Запись textfile и выборки JSONL (вызывается по таймеру и при остановке)."""
+        totals, running = self.snapshot()
+        self._append_jsonl(running + [dict(totals, ts=round(time.time(), 3), event='totals')])
+        self.write_textfile()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.flush()
+                self._last_error = None
+            except OSError as e:
+                # Одна и та же ошибка не повторяется в логе каждые interval секунд
+                if str(e) != self._last_error:
+                    self._last_error = str(e)
+                    self.on_event({'type': 'log', 'level': 'warning', 'message': f"Метрики: {e}"})
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self):
+        """Остановка с последней записью."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+
+def metrics_from_config(config, textfile=None, jsonl=None, on_event=None):
+    """Metrics по конфигурации (metrics_textfile, metrics_jsonl, metrics_interval)
+    или None, если выгрузка не настроена. Аргументы перекрывают конфигурацию."""
+    textfile = textfile or config.get("metrics_textfile")
+    jsonl = jsonl or config.get("metrics_jsonl")
+    if not textfile and not jsonl:
+        return None
+    return Metrics(textfile, jsonl, float(config.get("metrics_interval", DEFAULT_INTERVAL)),
+                   on_event=on_event)
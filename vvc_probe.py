@@ -0,0 +1,243 @@
+"""Зондирование ffmpeg/ffprobe с постоянным кэшем на диске.
+
+Результаты зондов кэшируются по ключу (путь, размер, mtime) исследуемого
+файла: пока бинарник ffmpeg или входной файл не изменился, повторный
+запуск не порождает ни одного подпроцесса.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+from vvc_core import CodecManager, get_cache_dir
+
+
+def file_key(path):
+    """Ключ кэша для файла: абсолютный путь, размер и mtime. None, если файла нет."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def binary_key(program):
+    """Ключ кэша для исполняемого файла: имя из PATH разрешается через shutil.which."""
+    resolved = program if os.path.sep in program or os.path.exists(program) else shutil.which(program)
+    return file_key(resolved) if resolved else None
+
+
+class JsonCache:
+    """Словарь с сохранением в JSON-файл (потокобезопасный).
+
+    max_entries ограничивает размер: при переполнении удаляются самые
+    старые записи (словарь хранит порядок вставки).
+    """
+
+    def __init__(self, filename, max_entries=1000):
+        self.path = os.path.join(get_cache_dir(), filename)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, value):
+        if key is None:
+            return
+        with self._lock:
+            data = self._load()
+            data.pop(key, None)
+            data[key] = value
+            while len(data) > self.max_entries:
+                data.pop(next(iter(data)))
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+
+# --- Возможности ffmpeg (версия и список энкодеров) ---
+
+encoder_cache = JsonCache("ffmpeg_encoders.json", max_entries=20)
+
+
+def probe_encoders(ffmpeg_path):
+    """Запуск ffmpeg -version и -encoders и разбор списка энкодеров.
+
+    Возвращает словарь, пригодный для JSON:
+        version, video, audio — списки имён, video_desc/audio_desc — описания,
+        supported — базовые кодеки из CodecManager, присутствующие в сборке.
+    """
+    result = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True, errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg -version завершился с кодом {result.returncode}")
+    info = {'version': result.stdout.split('\n')[0], 'video': [], 'audio': [],
+            'video_desc': {}, 'audio_desc': {}, 'supported': []}
+
+    res = subprocess.run([ffmpeg_path, '-encoders'], capture_output=True, text=True, errors='replace')
+    in_encoders = False
+    for line in res.stdout.split('\n'):
+        if '------' in line: in_encoders = True; continue
+        if in_encoders and line.strip():
+            parts = line.strip().split(maxsplit=2)
+            if len(parts) >= 2:
+                etype, ename = parts[0], parts[1]
+                desc = parts[2] if len(parts) >= 3 else ename
+                if 'V' in etype:
+                    info['video'].append(ename)
+                    info['video_desc'][ename] = desc
+                    if ename in CodecManager.VIDEO_CODECS: info['supported'].append(ename)
+                elif 'A' in etype:
+                    info['audio'].append(ename)
+                    info['audio_desc'][ename] = desc
+                    if ename in CodecManager.AUDIO_CODECS: info['supported'].append(ename)
+    return info
+
+
+def cached_encoders(ffmpeg_path):
+    """Возможности ffmpeg из кэша — без запуска подпроцессов. None при промахе."""
+    return encoder_cache.get(binary_key(ffmpeg_path))
+
+
+def discover_encoders(ffmpeg_path):
+    """Возможности ffmpeg: из кэша или зондированием с сохранением в кэш."""
+    key = binary_key(ffmpeg_path)
+    info = encoder_cache.get(key)
+    if info is None:
+        info = probe_encoders(ffmpeg_path)
+        encoder_cache.put(key, info)
+    return info
+
+
+# --- Сведения о медиафайле (ffprobe -show_format -show_streams) ---
+
+media_cache = JsonCache("media_info.json", max_entries=2000)
+
+
+def _parse_rate(rate):
+    """'30000/1001' → 29.97; '0/0' и мусор → None."""
+    try:
+        num, _, den = rate.partition('/')
+        value = float(num) / float(den or 1)
+        return value if value > 0 else None
+    except (AttributeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_media_info(data):
+    """Разбор JSON ffprobe в компактный словарь.
+
+        duration, size, bit_rate, format
+        video: codec, width, height, fps, frames, pix_fmt, bit_rate (или None)
+        audio: список {codec, channels, sample_rate, bit_rate}
+    """
+    fmt = data.get('format', {})
+    info = {
+        'duration': _to_float(fmt.get('duration')) or 0.0,
+        'size': _to_int(fmt.get('size')),
+        'bit_rate': _to_int(fmt.get('bit_rate')),
+        'format': fmt.get('format_name', ''),
+        'video': None,
+        'audio': [],
+    }
+    for stream in data.get('streams', []):
+        kind = stream.get('codec_type')
+        if kind == 'video' and info['video'] is None:
+            # Обложки (attached_pic) — не видеопоток
+            if stream.get('disposition', {}).get('attached_pic'):
+                continue
+            fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+            frames = _to_int(stream.get('nb_frames'))
+            duration = _to_float(stream.get('duration')) or info['duration']
+            if not frames and fps and duration:
+                frames = int(round(duration * fps))
+            info['video'] = {
+                'codec': stream.get('codec_name', ''),
+                'width': _to_int(stream.get('width')),
+                'height': _to_int(stream.get('height')),
+                'fps': round(fps, 3) if fps else None,
+                'frames': frames,
+                'pix_fmt': stream.get('pix_fmt', ''),
+                'bit_rate': _to_int(stream.get('bit_rate')),
+            }
+        elif kind == 'audio':
+            info['audio'].append({
+                'codec': stream.get('codec_name', ''),
+                'channels': _to_int(stream.get('channels')),
+                'sample_rate': _to_int(stream.get('sample_rate')),
+                'bit_rate': _to_int(stream.get('bit_rate')),
+            })
+    return info
+
+
+def probe_media(ffprobe_path, path):
+    """Один вызов ffprobe на файл: формат и все потоки в JSON."""
+    result = subprocess.run(
+        [ffprobe_path, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path],
+        capture_output=True, text=True, errors='replace', timeout=30
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe: код возврата {result.returncode}")
+    return parse_media_info(json.loads(result.stdout or '{}'))
+
+
+def cached_media_info(path):
+    """Сведения о файле из кэша — без запуска ffprobe. None при промахе."""
+    return media_cache.get(file_key(path))
+
+
+def get_media_info(ffprobe_path, path):
+    """Сведения о файле: из кэша по (путь, размер, mtime) или через ffprobe.
+
+    None, если файл не удалось разобрать.
+    """
+    key = file_key(path)
+    info = media_cache.get(key)
+    if info is None:
+        try:
+            info = probe_media(ffprobe_path, path)
+        except Exception:
+            return None
+        media_cache.put(key, info)
+    return info
+
+
+def media_duration(info):
+    return info['duration'] if info else 0.0
+
+
+def media_frames(info):
+    return (info.get('video') or {}).get('frames') or 0 if info else 0
@@ -0,0 +1,190 @@
+"""Автоподбор CRF под целевое качество (SSIM/PSNR).
+
+Из входного файла берётся несколько коротких равномерно распределённых
+фрагментов; для очередного значения CRF они кодируются одновременно теми же
+командами, что и полная конвертация (build_ffmpeg_command), и сравниваются с
+исходником фильтрами ffmpeg ssim/psnr. Бинарный поиск находит наибольший CRF
+(самый маленький файл), при котором средняя оценка не ниже цели.
+"""
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from vvc_core import build_ffmpeg_command, video_geometry_args
+from vvc_cpu import cpu_budget
+from vvc_jobs import ProcessGroup
+
+# Границы поиска CRF/QP
+CRF_MIN = 15
+CRF_MAX = 45
+# Значения цели по умолчанию для каждой метрики
+DEFAULT_TARGETS = {'ssim': 0.98, 'psnr': 40.0}
+METRIC_RANGES = {'ssim': (0.0, 1.0), 'psnr': (0.0, 100.0)}
+
+_SCORE_RE = {
+    'ssim': re.compile(r'SSIM .*All:(\d+(?:\.\d+)?)'),
+    'psnr': re.compile(r'PSNR .*average:(\d+(?:\.\d+)?|inf)'),
+}
+
+
+def validate_target(metric, target):
+    """Проверка метрики и цели; возвращает цель как float."""
+    if metric not in METRIC_RANGES:
+        raise ValueError(f"Неизвестная метрика качества: {metric}. Допустимо: ssim, psnr")
+    try:
+        value = float(target)
+    except (TypeError, ValueError):
+        raise ValueError(f"Неверное значение цели качества: {target}")
+    low, high = METRIC_RANGES[metric]
+    if not low < value <= high:
+        raise ValueError(f"Цель {metric.upper()} должна быть в диапазоне {low:g}-{high:g}")
+    return value
+
+
+def plan_samples(start, duration, count=3, length=4.0):
+    """(начало, длительность) образцов, равномерно распределённых по диапазону."""
+    if duration <= count * length:
+        return [(start, duration)]
+    step = duration / count
+    return [(start + step * i + (step - length) / 2, length) for i in range(count)]
+
+
+def parse_score(metric, lines):
+    """Итоговая оценка из вывода фильтра ssim/psnr; None, если её нет."""
+    for line in reversed(lines):
+        match = _SCORE_RE[metric].search(line)
+        if match:
+            value = match.group(1)
+            return 100.0 if value == 'inf' else float(value)
+    return None
+
+
+def build_score_command(ffmpeg_path, metric, encoded_file, input_file, start, duration, geometry,
+                        filter_threads=0):
+    """Сравнение закодированного образца с тем же диапазоном исходника.
+
+    Эталон проходит ту же цепочку фильтров и приводится к частоте кадров
+    результата (geometry — аргументы -vf/-r из video_geometry_args), оба
+    потока — к yuv420p. filter_threads > 0 — потоки графа сравнения
+    (-filter_complex_threads).
+    """
+    ref = []
+    for flag, value in zip(geometry[::2], geometry[1::2]):
+        if flag == '-vf':
+            # Формат результата не нужен: сравнение идёт в yuv420p
+            ref.extend(f for f in value.split(',') if not f.startswith('format='))
+        elif flag == '-r':
+            ref.append(f"fps={value}")
+    ref_chain = ','.join(ref + ['format=yuv420p', 'setpts=PTS-STARTPTS'])
+    graph = f"[0:v]format=yuv420p,setpts=PTS-STARTPTS[d];[1:v]{ref_chain}[r];[d][r]{metric}"
+    cmd = [ffmpeg_path]
+    if filter_threads > 0:
+        cmd.extend(['-filter_complex_threads', str(filter_threads)])
+    return cmd + ['-i', encoded_file,
+                  '-ss', f"{start:.3f}", '-t', f"{duration:.3f}", '-i', input_file,
+                  '-lavfi', graph, '-an', '-f', 'null', '-']
+
+
+class CrfSearch:
+    """Поиск наибольшего CRF, дающего качество не ниже цели.
+
+    События уходят в on_event в формате ui_queue ({'type': 'log', ...}),
+    ход поиска — в on_step(crf, score). stop() прерывает поиск из другого потока.
+    """
+
+    def __init__(self, settings, ffmpeg_path, input_file, samples, metric='ssim', target=None,
+                 source=None, crf_range=(CRF_MIN, CRF_MAX), on_event=None, on_step=None):
+        self.settings = dict(settings, use_crf=True, enable_trim=False)
+        self.ffmpeg_path = ffmpeg_path
+        self.input_file = input_file
+        self.samples = samples
+        self.metric = metric
+        self.target = validate_target(metric, target if target is not None else DEFAULT_TARGETS[metric])
+        self.source = source
+        self.crf_range = crf_range
+        self.on_event = on_event or (lambda event: None)
+        self.on_step = on_step or (lambda crf, score: None)
+        # Оценки уже проверенных значений CRF
+        self.scores = {}
+        self._group = ProcessGroup()
+
+    @property
+    def stopped(self):
+        return self._group.stopped
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def run(self):
+        """Выполнение в текущем потоке. Возвращает (crf, оценка) или None при остановке."""
+        work_dir = tempfile.mkdtemp(prefix='vvc_crf_')
+        try:
+            self._log(f"Подбор CRF: цель {self.metric.upper()} ≥ {self.target:g}, "
+                      f"образцов {len(self.samples)}")
+            lo, hi = self.crf_range
+            best = None
+            while lo <= hi:
+                crf = (lo + hi) // 2
+                score = self.evaluate(crf, work_dir)
+                if self.stopped:
+                    return None
+                if score is None:
+                    raise RuntimeError(f"не удалось оценить CRF {crf}")
+                if score >= self.target:
+                    best, lo = crf, crf + 1
+                else:
+                    hi = crf - 1
+            if best is None:
+                best = self.crf_range[0]
+                if self.evaluate(best, work_dir) is None:
+                    if self.stopped:
+                        return None
+                    raise RuntimeError(f"не удалось оценить CRF {best}")
+                self._log(f"Цель не достигнута даже при CRF {best} "
+                          f"({self.metric.upper()} {self.scores[best]:g})", "warning")
+            self._log(f"Выбран CRF {best} ({self.metric.upper()} {self.scores[best]:g})", "success")
+            return best, self.scores[best]
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def evaluate(self, crf, work_dir):
+        """Средняя оценка образцов при данном CRF (образцы кодируются параллельно)."""
+        if crf not in self.scores:
+            with cpu_budget.expect(len(self.samples)), \
+                    ThreadPoolExecutor(max_workers=len(self.samples)) as pool:
+                scores = list(pool.map(lambda i: self._score_sample(crf, i, work_dir),
+                                       range(len(self.samples))))
+            if self.stopped or None in scores:
+                return None
+            self.scores[crf] = sum(scores) / len(scores)
+            self._log(f"CRF {crf}: {self.metric.upper()} {self.scores[crf]:g}")
+            self.on_step(crf, self.scores[crf])
+        return self.scores[crf]
+
+    def _score_sample(self, crf, index, work_dir):
+        if self.stopped:
+            return None
+        start, duration = self.samples[index]
+        settings = dict(self.settings, video_quality=str(crf))
+        encoded = os.path.join(work_dir, f"crf{crf}_{index}.mp4")
+        cmd = build_ffmpeg_command(settings, self.ffmpeg_path, self.input_file, encoded,
+                                   start=start, duration=duration, include_audio=False,
+                                   source=self.source)
+        if self._run(cmd) != 0:
+            return None
+        lines = []
+        cmd = build_score_command(self.ffmpeg_path, self.metric, encoded, self.input_file,
+                                  start, duration, video_geometry_args(settings, self.source),
+                                  int(settings.get("filter_threads") or 0))
+        rc = self._run(cmd, on_output=lines.append)
+        os.remove(encoded)
+        return parse_score(self.metric, lines) if rc == 0 else None
+
+    def _run(self, cmd, on_output=None):
+        return self._group.run(cmd, on_output=on_output, budget=cpu_budget)
+
+    def stop(self):
+        """Остановка поиска без ожидания (vvc_jobs.ProcessGroup.stop)."""
+        return self._group.stop()
@@ -0,0 +1,208 @@
+"""Возобновляемое кодирование по сегментам.
+
+Обычная конвертация пишет результат одним процессом ffmpeg: остановка или
+сбой на 95% многочасового VVC-кодирования означает начать заново. В этом
+режиме диапазон кодируется сегментами фиксированной длительности (видео
+без звука) в рабочую папку рядом с результатом (<результат>.parts).
+Готовый сегмент сначала пишется во временный файл и переименовывается
+только после успешного завершения ffmpeg, затем отмечается в manifest.json.
+При повторном запуске того же задания (тот же исходник, те же настройки)
+готовые сегменты пропускаются. В конце сегменты склеиваются
+concat-демуксером, а звук кодируется одним проходом из исходника — как при
+параллельных фрагментах (vvc_chunks); рабочая папка удаляется.
+"""
+import collections
+import hashlib
+import json
+import math
+import os
+import shutil
+
+from vvc_core import build_ffmpeg_command, build_concat_command, copy_streams, trim_range
+from vvc_cpu import cpu_budget
+from vvc_chunks import write_concat_list
+from vvc_jobs import run_ffmpeg
+from vvc_probe import file_key
+from vvc_supervisor import terminate_process
+
+# Длительность сегмента по умолчанию, секунд: потеря при сбое — не больше сегмента
+DEFAULT_SEGMENT_SECONDS = 120
+MANIFEST = 'manifest.json'
+
+
+def plan_segments(start, duration, length=DEFAULT_SEGMENT_SECONDS):
+    """Сегменты (начало, длительность) по length секунд; последний — остаток."""
+    count = max(1, math.ceil(duration / length - 1e-6))
+    end = start + duration
+    return [(round(start + i * length, 3), round(min(length, end - start - i * length), 3))
+            for i in range(count)]
+
+
+def work_dir_for(output_file):
+    return os.path.abspath(output_file) + '.parts'
+
+
+def resumable_for(settings, ffmpeg_path, input_file, output_file, source=None, on_event=None):
+    """ResumableEncoder для задания или None, если режим выключен или неприменим.
+
+    Режим «Размер файла» не поддерживается (статистика двух проходов
+    относится ко всему диапазону), ремукс с копированием видео в нём не нужен.
+    """
+    if not settings.get("resumable") or settings.get("use_target_size"):
+        return None
+    trim = trim_range(settings)
+    if 'video' in copy_streams(settings, source, output_file, trimmed=trim is not None):
+        return None
+    start, duration = trim if trim else (0.0, None)
+    return ResumableEncoder(settings, ffmpeg_path, input_file, output_file, start, duration,
+                            source=source, on_event=on_event,
+                            segment_seconds=settings.get("segment_seconds") or DEFAULT_SEGMENT_SECONDS)
+
+
+class ResumableEncoder:
+    """Кодирование диапазона сегментами с манифестом готовых частей.
+
+    duration может быть неизвестна при создании (задание очереди) — тогда её
+    передают в run(). События уходят в on_event в формате ui_queue
+    ({'type': 'log', ...}); прогресс — в on_progress(секунды, текст).
+    """
+
+    def __init__(self, settings, ffmpeg_path, input_file, output_file, start=0.0, duration=None,
+                 source=None, segment_seconds=DEFAULT_SEGMENT_SECONDS, on_event=None):
+        self.settings = settings
+        self.ffmpeg_path = ffmpeg_path
+        self.input_file = input_file
+        self.output_file = output_file
+        self.start = start
+        self.duration = duration
+        self.source = source
+        self.segment_seconds = float(segment_seconds)
+        self.on_event = on_event or (lambda event: None)
+        self.work_dir = work_dir_for(output_file)
+        self.ext = os.path.splitext(output_file)[1] or '.mp4'
+        self.segments = []
+        self.process = None
+        self.stopped = False
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def _segment_path(self, index, partial=False):
+        suffix = '.partial' if partial else ''
+        return os.path.join(self.work_dir, f"part_{index:04d}{suffix}{self.ext}")
+
+    def _segment_command(self, index, output):
+        start, duration = self.segments[index]
+        return build_ffmpeg_command(self.settings, self.ffmpeg_path, self.input_file, output,
+                                    start=start, duration=duration, include_audio=False,
+                                    source=self.source)
+
+    def signature(self):
+        """Отпечаток задания: исходник (путь, размер, mtime), сегменты и команда
+        кодирования. Изменилось что-то из этого — старые сегменты не годятся."""
+        cmd = self._segment_command(0, 'OUT')
+        data = json.dumps({'input': file_key(self.input_file), 'segments': self.segments,
+                           'cmd': cmd[1:]}, ensure_ascii=False)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def load_done(self, signature):
+        """Номера готовых сегментов из манифеста; None, если манифеста нет или он от другого задания."""
+        try:
+            with open(os.path.join(self.work_dir, MANIFEST), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('signature') != signature:
+            return None
+        return {i for i in manifest.get('done', [])
+                if 0 <= i < len(self.segments) and os.path.exists(self._segment_path(i))}
+
+    def _save_manifest(self, signature, done):
+        path = os.path.join(self.work_dir, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature, 'input': self.input_file, 'output': self.output_file,
+                       'segments': self.segments, 'done': sorted(done)}, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def run(self, on_start=None, on_progress=None, duration=None):
+        """Выполнение в текущем потоке. Возвращает код возврата (0 — успех).
+
+        При ошибке или остановке рабочая папка с готовыми сегментами остаётся.
+        """
+        on_progress = on_progress or (lambda seconds, text: None)
+        duration = self.duration or duration
+        if not duration or duration <= 0:
+            raise ValueError("Для возобновляемого режима нужна длительность видео")
+        self.segments = plan_segments(self.start, duration, self.segment_seconds)
+        signature = self.signature()
+        os.makedirs(self.work_dir, exist_ok=True)
+        done = self.load_done(signature)
+        if done is None:
+            # Чужие или устаревшие части — начинаем с чистой папки
+            for name in os.listdir(self.work_dir):
+                os.remove(os.path.join(self.work_dir, name))
+            done = set()
+        elif done:
+            self._log(f"Продолжение: готово сегментов {len(done)} из {len(self.segments)}", "success")
+        self._save_manifest(signature, done)
+
+        def start_process(process):
+            self.process = process
+            if on_start:
+                on_start(process)
+
+        done_seconds = sum(d for i, (_, d) in enumerate(self.segments) if i in done)
+        on_progress(done_seconds, None)
+        for index, (start, seg_duration) in enumerate(self.segments):
+            if index in done:
+                continue
+            if self.stopped:
+                return -1
+            partial = self._segment_path(index, partial=True)
+            cmd = self._segment_command(index, partial)
+            self._log(f"[сегмент {index + 1}/{len(self.segments)}] {' '.join(cmd)}")
+
+            def progress(record, base=done_seconds, limit=seg_duration):
+                if record.out_time is not None:
+                    on_progress(base + min(limit, record.out_time), None)
+
+            tail = collections.deque(maxlen=5)
+            rc = run_ffmpeg(cmd, on_output=tail.append, on_progress=progress,
+                            on_start=start_process, budget=cpu_budget)
+            self.process = None
+            if rc != 0 or self.stopped:
+                if not self.stopped:
+                    for line in tail:
+                        self._log(f"[сегмент {index + 1}] {line}", "error")
+                return rc or -1
+            os.replace(partial, self._segment_path(index))
+            done.add(index)
+            self._save_manifest(signature, done)
+            done_seconds += seg_duration
+            on_progress(done_seconds, None)
+
+        on_progress(done_seconds, "Склейка сегментов...")
+        list_file = os.path.join(self.work_dir, 'parts.txt')
+        write_concat_list(list_file, [self._segment_path(i) for i in range(len(self.segments))])
+        cmd = build_concat_command(self.settings, self.ffmpeg_path, self.input_file, list_file,
+                                   self.output_file, self.start, duration)
+        self._log(f"Склейка: {' '.join(cmd)}")
+        rc = run_ffmpeg(cmd, on_output=self._log, on_start=start_process)
+        self.process = None
+        if rc == 0:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        return rc
+
+    def stop(self):
+        """Остановка текущего сегмента; готовые сегменты сохраняются.
+
+        Возвращает True, если процесс пришлось убить (kill).
+        """
+        self.stopped = True
+        process = self.process
+        if process is None:
+            return False
+        try:
+            return terminate_process(process)
+        except OSError:
+            return False
@@ -0,0 +1,353 @@
+"""Единый супервизор процессов ffmpeg на asyncio.
+
+Все процессы ffmpeg запускаются из одного цикла событий в отдельном потоке:
+каналы stdout (-progress) и stderr читаются без блокировок, завершение
+процесса ожидается там же (os.wait4 — вместе с процессорным временем), там
+же отправляются сигналы остановки. Сколько бы процессов ни работало
+одновременно, чтение их вывода стоит один поток, а остановка с эскалацией
+(terminate → ожидание → kill) не блокирует вызывающего: stop() сразу
+возвращает concurrent.futures.Future.
+
+Вызывающие потоки (рабочие потоки очереди, фрагменты) только ждут
+результат run(); callbacks on_start/on_output/on_progress вызываются в
+потоке супервизора и должны быть быстрыми (положить событие в ui_queue,
+обновить счётчик). Блоки прогресса прореживаются до одного за
+progress_interval секунд — последний блок (progress=end) передаётся всегда.
+
+Ограничение Windows: анонимные каналы Popen нельзя ждать в цикле событий,
+поэтому там на каждый канал остаётся поток чтения, передающий строки в цикл.
+
+asyncio импортируется при первом запуске цикла (_ensure_loop): модуль
+загружается при старте окна и CLI, а asyncio заметно удлиняет запуск.
+"""
+import locale
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+asyncio = None  # Импортируется в ProcessSupervisor._ensure_loop
+
+# Предел длины строки вывода ffmpeg, байт
+LINE_LIMIT = 1024 * 1024
+# Период проверки завершения процесса после закрытия его каналов, секунд
+REAP_INTERVAL = 0.05
+# Ожидание завершения после kill, секунд
+KILL_WAIT = 3.0
+
+
+def popen_ffmpeg(cmd):
+    """Запуск ffmpeg: stdout — канал -progress, stderr — сообщения для лога.
+
+    Windows: не показывать чёрное окно консоли.
+    """
+    creationflags = 0
+    if os.name == 'nt':
+        creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, creationflags=creationflags)
+
+
+def _exit_code(status):
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+
+class ManagedProcess:
+    """Процесс под управлением супервизора.
+
+    Повторяет нужную остальным модулям часть интерфейса subprocess.Popen
+    (pid, returncode, poll, wait, terminate, kill). Сигналы и ожидание
+    выполняются в потоке супервизора — там же, где процесс «дожидается»,
+    поэтому сигнал не может попасть в чужой процесс с тем же pid.
+    """
+
+    def __init__(self, supervisor, popen, args):
+        self._supervisor = supervisor
+        self.popen = popen
+        self.args = args
+        self.pid = popen.pid
+        self.returncode = None
+        # Процессорное время после завершения, секунд (None — неизвестно)
+        self.cpu_time = None
+        # Причина принудительной остановки по таймауту (None — не было)
+        self.timed_out = None
+        self._exited = threading.Event()
+        self._done = None  # asyncio.Future в цикле супервизора
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._supervisor._call(self._signal, False)
+
+    def kill(self):
+        self._supervisor._call(self._signal, True)
+
+    def stop(self, grace=5.0):
+        """Остановка с эскалацией без ожидания; Future → True, если понадобился kill."""
+        return self._supervisor.stop(self, grace)
+
+    def _signal(self, kill):
+        """Сигнал процессу (только в потоке супервизора)."""
+        if self.returncode is not None:
+            return
+        try:
+            if os.name == 'nt':
+                (self.popen.kill if kill else self.popen.terminate)()
+            else:
+                # Не Popen.send_signal: его poll() может «дождаться» процесс раньше
+                # супервизора, и процессорное время будет потеряно
+                os.kill(self.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except (ProcessLookupError, OSError):
+            pass
+
+
+class ProcessSupervisor:
+    """Цикл событий, владеющий всеми процессами ffmpeg (поток запускается при первом вызове)."""
+
+    def __init__(self, progress_interval=0.25, idle_timeout=None):
+        self.progress_interval = progress_interval
+        # Остановка процесса, который столько секунд ничего не выводит (None — без ограничения)
+        self.idle_timeout = idle_timeout
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._encoding = locale.getpreferredencoding(False)
+
+    # --- Цикл событий ---
+
+    def _ensure_loop(self):
+        global asyncio
+        with self._lock:
+            if self._loop is None:
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                                name="ffmpeg-supervisor", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def _call(self, fn, *args):
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            fn(*args)
+        else:
+            loop.call_soon_threadsafe(fn, *args)
+
+    def configure(self, config):
+        """Параметры из конфигурации (ffmpeg_idle_timeout: 0 — без ограничения)."""
+        self.idle_timeout = float(config.get("ffmpeg_idle_timeout") or 0) or None
+
+    def running(self):
+        """Число работающих процессов."""
+        return len(self._processes)
+
+    # --- Публичный интерфейс ---
+
+    def submit(self, cmd, on_output=None, on_progress=None, on_start=None,
+               idle_timeout=None, timeout=None):
+        """Запуск процесса; concurrent.futures.Future → код возврата.
+
+        on_output(line) — строки stderr, on_progress(fields) — блоки key=value
+        канала stdout (-progress), on_start(ManagedProcess) — сразу после запуска.
+        idle_timeout — остановка, если столько секунд нет вывода (по умолчанию
+        self.idle_timeout), timeout — ограничение общего времени работы.
+        """
+        loop = self._ensure_loop()
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        return asyncio.run_coroutine_threadsafe(
+            self._supervise(list(cmd), on_output, on_progress, on_start, idle_timeout, timeout), loop)
+
+    def run(self, cmd, **kwargs):
+        """Запуск и ожидание кода возврата в вызывающем потоке (не в потоке супервизора)."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("run() нельзя вызывать из callbacks супервизора")
+        return self.submit(cmd, **kwargs).result()
+
+    def stop(self, process, grace=5.0):
+        """terminate → ожидание grace секунд → kill. Future → True, если понадобился kill."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._stop(process, grace), loop)
+
+    # --- Корутины (поток супервизора) ---
+
+    async def _supervise(self, cmd, on_output, on_progress, on_start, idle_timeout, timeout):
+        popen = popen_ffmpeg(cmd)
+        process = ManagedProcess(self, popen, cmd)
+        process._done = self._loop.create_future()
+        self._processes.add(process)
+        activity = [time.monotonic()]
+        errors = []
+
+        def call(callback, *args):
+            # Ошибка в callback не должна оставить процесс без присмотра —
+            # она передаётся вызывающему после завершения процесса
+            if callback is None:
+                return
+            try:
+                callback(*args)
+            except Exception as e:
+                if not errors:
+                    errors.append(e)
+
+        watchdog = None
+        try:
+            call(on_start, process)
+            if idle_timeout or timeout:
+                watchdog = asyncio.ensure_future(
+                    self._watchdog(process, activity, idle_timeout, timeout, on_output, call))
+            await asyncio.gather(
+                self._read_progress(popen.stdout, on_progress, activity, call),
+                self._read_output(popen.stderr, on_output, activity, call))
+            process.returncode, process.cpu_time = await self._reap(process)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if process.returncode is None:
+                # Отмена корутины — процесс не должен остаться без хозяина
+                process._signal(True)
+                process.returncode = popen.wait()
+            for stream in (popen.stdout, popen.stderr):
+                stream.close()
+            self._processes.discard(process)
+            process._exited.set()
+            if not process._done.done():
+                process._done.set_result(process.returncode)
+        if errors:
+            raise errors[0]
+        return process.returncode
+
+    async def _lines(self, stream, activity):
+        """Строки канала процесса (bytes) по мере поступления."""
+        if os.name == 'nt':
+            queue = asyncio.Queue()
+            loop = self._loop
+
+            def pump():
+                for raw in stream:
+                    loop.call_soon_threadsafe(queue.put_nowait, raw)
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+            threading.Thread(target=pump, daemon=True).start()
+            while True:
+                raw = await queue.get()
+                if raw is None:
+                    return
+                activity[0] = time.monotonic()
+                yield raw
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        transport, _ = await self._loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), stream)
+        try:
+            while True:
+                try:
+                    raw = await reader.readline()
+                except ValueError:
+                    # Строка длиннее LINE_LIMIT — отбрасываем накопленное
+                    raw = await reader.read(LINE_LIMIT)
+                if not raw:
+                    return
+                activity[0] = time.monotonic()
+                yield raw
+        finally:
+            transport.close()
+
+    async def _read_output(self, stream, on_output, activity, call):
+        async for raw in self._lines(stream, activity):
+            line = raw.decode(self._encoding, errors='replace').rstrip()
+            if line and on_output:
+                call(on_output, line)
+
+    async def _read_progress(self, stream, on_progress, activity, call):
+        fields, pending, last_sent = {}, None, 0.0
+        async for raw in self._lines(stream, activity):
+            key, sep, value = raw.decode('utf-8', errors='replace').strip().partition('=')
+            if not sep:
+                continue
+            fields[key] = value
+            if key != 'progress':
+                continue
+            block, fields = fields, {}
+            if on_progress is None:
+                continue
+            now = time.monotonic()
+            if value == 'end' or now - last_sent >= self.progress_interval:
+                call(on_progress, block)
+                pending, last_sent = None, now
+            else:
+                pending = block
+        if pending is not None:
+            call(on_progress, pending)
+
+    async def _reap(self, process):
+        """Ожидание завершения без блокировки цикла: (код, процессорное время или None)."""
+        if hasattr(os, 'wait4'):
+            while True:
+                try:
+                    pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                except ChildProcessError:
+                    return process.popen.wait(), None
+                if pid:
+                    process.popen.returncode = _exit_code(status)
+                    return process.popen.returncode, usage.ru_utime + usage.ru_stime
+                await asyncio.sleep(REAP_INTERVAL)
+        while process.popen.poll() is None:
+            await asyncio.sleep(REAP_INTERVAL)
+        return process.popen.returncode, None
+
+    async def _watchdog(self, process, activity, idle_timeout, timeout, on_output, call):
+        started = time.monotonic()
+        while process.returncode is None:
+            await asyncio.sleep(min(1.0, idle_timeout or timeout))
+            now = time.monotonic()
+            if timeout and now - started > timeout:
+                process.timed_out = f"превышено время работы ({timeout:g} с)"
+            elif idle_timeout and now - activity[0] > idle_timeout:
+                process.timed_out = f"нет вывода {idle_timeout:g} с"
+            else:
+                continue
+            if on_output:
+                call(on_output, f"Процесс остановлен: {process.timed_out}")
+            await self._stop(process, KILL_WAIT)
+            return
+
+    async def _stop(self, process, grace):
+        if process.returncode is not None:
+            return False
+        process._signal(False)
+        try:
+            await asyncio.wait_for(asyncio.shield(process._done), grace)
+            return False
+        except asyncio.TimeoutError:
+            process._signal(True)
+            try:
+                await asyncio.wait_for(asyncio.shield(process._done), KILL_WAIT)
+            except asyncio.TimeoutError:
+                print(f"ffmpeg (pid {process.pid}) не завершился после kill", file=sys.stderr)
+            return True
+
+
+def terminate_process(process, timeout=5):
+    """terminate → wait(timeout) → kill с ожиданием результата. Возвращает True,
+    если понадобился kill. Для Tk-потока — process.stop() без ожидания."""
+    return process.stop(timeout).result()
+
+
+# Общий супервизор на процесс приложения
+supervisor = ProcessSupervisor()
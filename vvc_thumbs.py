@@ -0,0 +1,190 @@
+"""Полоса миниатюр по ключевым кадрам для выбора точек обрезки.
+
+Каждая миниатюра — отдельный короткий запуск ffmpeg: быстрый поиск (-ss до
+-i без точной доводки) и -skip_frame nokey — декодируется только ближайший
+ключевой кадр, затем он уменьшается до высоты полосы. Запуски идут
+параллельно в пуле потоков, каждая готовая миниатюра сразу передаётся в
+on_thumb, поэтому полоса заполняется постепенно.
+
+Момент миниатюры — время показанного ключевого кадра (по showinfo), а не
+запрошенная точка: щелчок по миниатюре ставит обрезку точно на ключевой
+кадр. PNG сохраняются в папке кэша по ключу (путь, размер, mtime)
+исходника и параметрам полосы, время — в имени файла: повторное открытие
+того же файла не запускает ffmpeg.
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from vvc_core import get_cache_dir
+from vvc_jobs import ProcessGroup
+from vvc_probe import file_key
+
+THUMB_COUNT = 10
+THUMB_HEIGHT = 45
+# Одновременных процессов ffmpeg при построении полосы
+THUMB_WORKERS = 4
+# Сколько полос хранить в кэше (старые удаляются)
+MAX_CACHED_STRIPS = 300
+
+_PTS_TIME = re.compile(r'pts_time:\s*(-?[\d.]+)')
+_THUMB_NAME = re.compile(r'^(\d{3})_(\d+)\.png$')
+
+
+def thumb_times(duration, count=THUMB_COUNT):
+    """Моменты миниатюр: середины count равных частей длительности."""
+    if not duration or duration <= 0:
+        return []
+    step = duration / count
+    return [step * (i + 0.5) for i in range(count)]
+
+
+def build_thumb_command(ffmpeg_path, input_file, seconds, output_file, height=THUMB_HEIGHT):
+    """Миниатюра ключевого кадра у момента seconds в PNG высотой height.
+
+    showinfo печатает pts_time кадра относительно точки поиска
+    (см. keyframe_time).
+    """
+    return [ffmpeg_path, '-hide_banner', '-noaccurate_seek', '-skip_frame', 'nokey',
+            '-ss', f"{seconds:.3f}", '-i', input_file, '-map', '0:v:0', '-frames:v', '1',
+            '-vf', f"showinfo,scale=-2:{height}:flags=fast_bilinear",
+            '-an', '-update', '1', '-y', output_file]
+
+
+def keyframe_time(seconds, lines):
+    """Время ключевого кадра по выводу showinfo; seconds, если его нет в выводе."""
+    for line in lines:
+        if 'showinfo' in line:
+            match = _PTS_TIME.search(line)
+            if match:
+                return max(0.0, seconds + float(match.group(1)))
+    return seconds
+
+
+def strip_dir(input_file, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    """Папка кэша полосы или None, если файла нет."""
+    key = file_key(input_file)
+    if key is None:
+        return None
+    digest = hashlib.sha1(f"{key}|{count}|{height}".encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_dir(), 'thumbs', digest)
+
+
+def thumb_path(directory, index, seconds):
+    """Файл миниатюры: номер и время ключевого кадра в миллисекундах."""
+    return os.path.join(directory, f"{index:03d}_{round(seconds * 1000)}.png")
+
+
+def cached_thumbs(directory):
+    """Готовые миниатюры папки полосы: номер → (момент, путь PNG)."""
+    thumbs = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return thumbs
+    for name in names:
+        match = _THUMB_NAME.match(name)
+        if match:
+            thumbs[int(match.group(1))] = (int(match.group(2)) / 1000, os.path.join(directory, name))
+    return thumbs
+
+
+def cached_strip(input_file, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    """[(момент, путь PNG)] полностью готовой полосы из кэша или None."""
+    directory = strip_dir(input_file, count, height)
+    if directory is None:
+        return None
+    thumbs = cached_thumbs(directory)
+    if len(thumbs) < count:
+        return None
+    os.utime(directory)  # Для prune_cache: полоса недавно использовалась
+    return [thumbs[i] for i in range(count)]
+
+
+def prune_cache(max_strips=MAX_CACHED_STRIPS):
+    """Удаление самых старых полос сверх max_strips."""
+    root = os.path.join(get_cache_dir(), 'thumbs')
+    try:
+        entries = [os.path.join(root, name) for name in os.listdir(root)]
+    except OSError:
+        return
+    entries.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+    for path in entries[:max(0, len(entries) - max_strips)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ThumbnailStrip:
+    """Фоновое построение полосы миниатюр одного файла.
+
+    on_thumb(index, seconds, path) вызывается из рабочих потоков по мере
+    готовности (в окне — через ui_queue), on_done() — после последней.
+    stop() отменяет оставшиеся миниатюры и останавливает запущенные процессы.
+    """
+
+    def __init__(self, ffmpeg_path, input_file, duration, on_thumb, on_done=None,
+                 count=THUMB_COUNT, height=THUMB_HEIGHT, workers=THUMB_WORKERS):
+        self.ffmpeg_path = ffmpeg_path
+        self.input_file = input_file
+        self.times = thumb_times(duration, count)
+        self.count = count
+        self.height = height
+        self.workers = max(1, min(workers, os.cpu_count() or 1))
+        self.on_thumb = on_thumb
+        self.on_done = on_done or (lambda: None)
+        self._group = ProcessGroup()
+
+    @property
+    def stopped(self):
+        return self._group.stopped
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        directory = strip_dir(self.input_file, self.count, self.height)
+        if directory is None or not self.times:
+            return
+        os.makedirs(directory, exist_ok=True)
+        # Готовые миниатюры — сразу, без очереди за процессами
+        cached = cached_thumbs(directory)
+        missing = []
+        for index in range(len(self.times)):
+            if index in cached:
+                self.on_thumb(index, *cached[index])
+            else:
+                missing.append(index)
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(lambda i: self._render(directory, i), missing))
+        if not self.stopped:
+            os.utime(directory)  # Для prune_cache: полоса недавно использовалась
+            prune_cache()
+            self.on_done()
+
+    def _render(self, directory, index):
+        if self.stopped:
+            return
+        seconds = self.times[index]
+        tmp_path = os.path.join(directory, f"{index:03d}.tmp.png")
+        lines = []
+        try:
+            rc = self._group.run(build_thumb_command(self.ffmpeg_path, self.input_file, seconds,
+                                                     tmp_path, self.height),
+                                 on_output=lines.append)
+        except OSError:
+            return
+        if rc == 0 and not self.stopped and os.path.exists(tmp_path):
+            # Запись через временный файл: в кэше не остаётся недописанных PNG
+            seconds = keyframe_time(seconds, lines)
+            path = thumb_path(directory, index, seconds)
+            os.replace(tmp_path, path)
+            self.on_thumb(index, seconds, path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def stop(self):
+        """Отмена без ожидания (можно вызывать из Tk-потока)."""
+        return self._group.stop()
@@ -0,0 +1,168 @@
+"""Автонастройка параллелизма libvvenc для этой машины.
+
+    python vvc_tune.py --resolutions 1280x720,1920x1080 --preset medium
+
+Для каждого разрешения короткий lavfi-источник кодируется libvvenc при
+разных сочетаниях числа потоков, тайлов, WPP (wavefront) и IFP (параллельное
+кодирование кадров) — теми же командами, что и обычная конвертация
+(vvc_bench.run_cell). Тайлы и WPP ускоряют кодирование, но немного
+увеличивают файл, поэтому выбирается самая быстрая конфигурация, размер
+результата которой не больше наименьшего на SIZE_TOLERANCE. Лучшая
+конфигурация сохраняется в конфигурацию (ключ vvenc_tuning, по классу
+разрешения), и build_ffmpeg_command применяет её ко всем последующим
+заданиям libvvenc.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+from vvc_core import (ConfigManager, FFmpegValidator, resolve_ffmpeg_paths, resolution_class,
+                      vvenc_tuning_params)
+from vvc_bench import run_cell, machine_info
+from vvc_probe import discover_encoders
+
+# Допустимый прирост размера относительно наименьшего ради скорости
+SIZE_TOLERANCE = 0.03
+# Тайлы (столбцы x строки) по классу разрешения: на малых кадрах больше
+# тайлов только теряют в сжатии
+TILES = {
+    "sd": ["1x1", "2x1"],
+    "hd": ["1x1", "2x1", "2x2"],
+    "fhd": ["1x1", "2x2", "4x2"],
+    "uhd": ["2x2", "4x2", "4x4"],
+}
+
+
+def candidates(res_class, cpu_count=None, threads=None):
+    """Проверяемые конфигурации: {threads, tiles, wpp, ifp}."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    threads = threads or sorted({cpu_count, max(1, cpu_count // 2)})
+    return [{"threads": t, "tiles": tiles, "wpp": wpp, "ifp": ifp}
+            for t, tiles, wpp, ifp in itertools.product(threads, TILES[res_class], (1, 0), (1, 0))]
+
+
+def choose_best(rows, size_tolerance=SIZE_TOLERANCE):
+    """Самая быстрая из успешных конфигураций с размером не больше
+    наименьшего на size_tolerance. None, если успешных нет."""
+    ok = [r for r in rows if r['status'] == 'ok' and r['encode_fps'] and r['size_bytes']]
+    if not ok:
+        return None
+    limit = min(r['size_bytes'] for r in ok) * (1 + size_tolerance)
+    return max((r for r in ok if r['size_bytes'] <= limit), key=lambda r: r['encode_fps'])
+
+
+def tune_resolution(ffmpeg_path, base_settings, resolution, preset="medium", crf=32,
+                    duration=2.0, fps=30, threads=None, on_row=None):
+    """Прогон конфигураций для одного разрешения. Возвращает (лучшая, все строки)."""
+    width, height = (int(v) for v in resolution.split('x'))
+    res_class = resolution_class(width, height)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='vvc_tune_') as work_dir:
+        for config in candidates(res_class, threads=threads):
+            settings = dict(base_settings, vvenc_tuning={res_class: config})
+            row = run_cell(ffmpeg_path, settings, ('testsrc2', resolution, 'libvvenc', preset, crf),
+                           duration, fps, work_dir)
+            row.update(config, res_class=res_class)
+            rows.append(row)
+            if on_row:
+                on_row(row)
+    return choose_best(rows), rows
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="vvc_tune.py",
+        description="Подбор потоков/тайлов/WPP/IFP libvvenc для этой машины.")
+    parser.add_argument('--resolutions', default="1280x720,1920x1080",
+                        help="разрешения через запятую (по одному на класс sd/hd/fhd/uhd)")
+    parser.add_argument('--preset', default="medium",
+                        choices=["faster", "fast", "medium", "slow", "slower"])
+    parser.add_argument('--crf', type=int, default=32)
+    parser.add_argument('--threads', help="числа потоков через запятую "
+                                          "(по умолчанию все ядра и половина)")
+    parser.add_argument('--duration', type=float, default=2.0, help="длительность образца, секунд")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--config', default="ffmpeg_converter_config.json")
+    parser.add_argument('--ffmpeg', help="путь к ffmpeg (перекрывает конфигурацию)")
+    parser.add_argument('--no-save', action='store_true', help="не записывать результат в конфигурацию")
+    parser.add_argument('--json', metavar='PATH', help="сохранить все замеры в JSON")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    resolutions = [r.strip() for r in args.resolutions.split(',') if r.strip()]
+    try:
+        for r in resolutions:
+            FFmpegValidator.validate_resolution(r)
+        FFmpegValidator.validate_quality(args.crf)
+        threads = [int(t) for t in args.threads.split(',')] if args.threads else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    config_manager = ConfigManager(args.config)
+    config = config_manager.load()
+    ffmpeg_path = args.ffmpeg or resolve_ffmpeg_paths(config)[0]
+    try:
+        machine = machine_info(ffmpeg_path)
+    except Exception as e:
+        print(f"FFmpeg не найден: {e}", file=sys.stderr)
+        return 2
+    if 'libvvenc' not in discover_encoders(ffmpeg_path)['video']:
+        print("Сборка ffmpeg без libvvenc — настраивать нечего", file=sys.stderr)
+        return 2
+    print(f"{machine['ffmpeg']} | {machine['processor']} ×{machine['cpu_count']}")
+    print(f"{'класс':<6}{'потоки':>7}{'тайлы':>7}{'wpp':>5}{'ifp':>5}{'fps':>9}{'размер, КБ':>12}")
+
+    def print_row(row):
+        if row['status'] != 'ok':
+            print(f"{row['res_class']:<6}{row['threads']:>7}{row['tiles']:>7}{row['wpp']:>5}"
+                  f"{row['ifp']:>5}  {row['status']}", flush=True)
+            return
+        print(f"{row['res_class']:<6}{row['threads']:>7}{row['tiles']:>7}{row['wpp']:>5}"
+              f"{row['ifp']:>5}{row['encode_fps']:>9.2f}{row['size_bytes'] / 1024:>12.1f}", flush=True)
+
+    tuning = dict(config.get("vvenc_tuning") or {})
+    all_rows, tuned = [], 0
+    # Замеры идут без уже сохранённой настройки — только перебираемые конфигурации
+    base_settings = dict(config, hw_accel="ЦП (Программное)")
+    try:
+        for resolution in resolutions:
+            best, rows = tune_resolution(ffmpeg_path, base_settings, resolution, args.preset,
+                                         args.crf, args.duration, args.fps, threads, print_row)
+            all_rows.extend(rows)
+            if best is None:
+                print(f"{resolution}: ни одна конфигурация не закодировалась", file=sys.stderr)
+                continue
+            tuning[best['res_class']] = {
+                "threads": best['threads'], "tiles": best['tiles'], "wpp": best['wpp'],
+                "ifp": best['ifp'], "fps": best['encode_fps'], "size_bytes": best['size_bytes'],
+                "preset": args.preset, "date": time.strftime('%Y-%m-%d'),
+            }
+            tuned += 1
+            params = ':'.join(vvenc_tuning_params(tuning[best['res_class']])) or "—"
+            print(f"→ {best['res_class']}: -threads {best['threads']} -vvenc-params {params} "
+                  f"({best['encode_fps']:.2f} fps)")
+    except KeyboardInterrupt:
+        return 130
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'machine': machine, 'results': all_rows, 'tuning': tuning}, f,
+                      indent=2, ensure_ascii=False)
+    if tuned and not args.no_save:
+        # Перечитываем файл: окно или другой процесс могли изменить его за время замеров
+        config = config_manager.load()
+        config["vvenc_tuning"] = tuning
+        config_manager.save(config)
+        print(f"Сохранено в {args.config}")
+    return 0 if tuned else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""Папки наблюдения: автоматическая постановка новых файлов в очередь.
+
+    python vvc_watch.py --jobs 2            # без окна, до Ctrl+C
+
+Папки задаются в конфигурации (ключ watch_folders):
+
+    "watch_folders": [
+        {"path": "//capture/share/in",
+         "profile": "hevc",                     # имя из "profiles" или словарь настроек
+         "output_dir": "//capture/share/out",   # по умолчанию <path>/converted
+         "done_dir": "//capture/share/done",    # исходники после успеха, по умолчанию <path>/done
+         "failed_dir": "//capture/share/failed"}  # после ошибки, по умолчанию <path>/failed
+    ],
+    "profiles": {"hevc": {"video_codec": "libx265", "use_crf": true, "video_quality": "26"}}
+
+Файл ставится в очередь только когда он дописан: размер и mtime не
+менялись watch_stable_seconds секунд. Папки просматриваются раз в interval
+секунд; на Linux inotify (ctypes, без сторонних модулей) дополнительно
+сообщает о новых файлах сразу. Только на inotify полагаться нельзя: записи
+других машин в сетевую папку (CIFS/NFS) он не видит, а при переполнении
+очереди событий теряет их — тогда папки просматриваются немедленно. Всё
+выполняется в фоновом потоке, поэтому окно не блокируется.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import shutil
+import struct
+import sys
+import threading
+import time
+
+from vvc_core import ConfigManager, resolve_ffmpeg_paths, build_encode_commands, default_output_path
+from vvc_farm import farm_from_config
+from vvc_history import history_from_config
+from vvc_jobs import Job, JobQueue
+from vvc_metrics import metrics_from_config
+from vvc_probe import get_media_info, media_duration, media_frames
+from vvc_supervisor import supervisor
+
+VIDEO_PATTERNS = ["*.mkv", "*.mp4", "*.mov", "*.avi", "*.ts", "*.m2ts", "*.mxf", "*.webm", "*.flv"]
+DEFAULT_STABLE_SECONDS = 5.0
+DEFAULT_INTERVAL = 2.0
+# Ключи настроек, которые не переносятся в профиль папки
+NON_PROFILE_KEYS = ("enable_trim", "trim_start", "trim_end", "smart_cut",
+                    "show_all_video_codecs", "show_all_audio_codecs")
+
+
+class _Inotify:
+    """Минимальная обёртка inotify через ctypes (только Linux)."""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    _HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify доступен только в Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.watches = {}
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for path in paths:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+            self.watches[wd] = path
+        # Очередь событий ядра переполнялась — часть событий потеряна
+        self.overflowed = False
+
+    def read(self, timeout):
+        """Пути изменившихся файлов за время ожидания (не дольше timeout секунд).
+
+        Переполнение очереди отмечается в overflowed.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths, offset = [], 0
+        while offset + self._HEADER.size <= len(data):
+            wd, mask, _cookie, length = self._HEADER.unpack_from(data, offset)
+            offset += self._HEADER.size
+            if mask & self.IN_Q_OVERFLOW:
+                self.overflowed = True
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name and wd in self.watches:
+                paths.append(os.path.join(self.watches[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Поиск дописанных файлов в папках (только верхний уровень).
+
+    on_ready(folder, path) вызывается в потоке наблюдения один раз для
+    каждого файла, размер и mtime которого не менялись stable_seconds.
+    """
+
+    def __init__(self, folders, on_ready, patterns=None, interval=DEFAULT_INTERVAL,
+                 stable_seconds=DEFAULT_STABLE_SECONDS, on_event=None):
+        self.folders = [os.path.abspath(f) for f in folders]
+        self.on_ready = on_ready
+        self.patterns = patterns or VIDEO_PATTERNS
+        self.interval = interval
+        self.stable_seconds = stable_seconds
+        self.on_event = on_event or (lambda event: None)
+        # путь → ((размер, mtime), время, с которого не меняется)
+        self._pending = {}
+        # (путь, размер, mtime) уже переданных файлов
+        self._seen = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.backend = "—"
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Остановка; wait=False — не ждать завершения потока (из Tk-потока)."""
+        self._stop.set()
+        if wait and self._thread:
+            self._thread.join(timeout=self.interval + 1)
+
+    def _matches(self, name):
+        return any(fnmatch.fnmatch(name.lower(), p.lower()) for p in self.patterns)
+
+    def _scan(self):
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if self._matches(name) and os.path.isfile(path):
+                    self._pending.setdefault(path, (None, 0.0))
+
+    def _check_pending(self):
+        now = time.monotonic()
+        for path, (key, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Файл удалён или перемещён
+                del self._pending[path]
+                self._seen = {s for s in self._seen if s[0] != path}
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key:
+                self._pending[path] = (current, now)
+            elif now - since >= self.stable_seconds and (path,) + current not in self._seen:
+                del self._pending[path]
+                self._seen.add((path,) + current)
+                self.on_ready(os.path.dirname(path), path)
+
+    def _run(self):
+        inotify = None
+        try:
+            inotify = _Inotify(self.folders)
+            self.backend = "inotify"
+        except (OSError, AttributeError) as e:
+            self.backend = "опрос"
+            if sys.platform.startswith('linux'):
+                self._log(f"inotify недоступен ({e}), используется опрос папок", "warning")
+        self._log(f"Наблюдение за папками ({self.backend}): {', '.join(self.folders)}")
+        try:
+            self._scan()
+            next_scan = time.monotonic() + self.interval
+            while not self._stop.is_set():
+                if inotify is not None:
+                    for path in inotify.read(self.interval):
+                        if self._matches(os.path.basename(path)) and os.path.isfile(path):
+                            self._pending.setdefault(path, (None, 0.0))
+                    if inotify.overflowed:
+                        inotify.overflowed = False
+                        self._log("Наблюдение за папками: очередь inotify переполнена, "
+                                  "папки просматриваются заново", "warning")
+                        next_scan = 0.0
+                else:
+                    self._stop.wait(self.interval)
+                # Просмотр и при inotify: сетевые папки и потерянные события
+                if time.monotonic() >= next_scan:
+                    self._scan()
+                    next_scan = time.monotonic() + self.interval
+                try:
+                    self._check_pending()
+                except Exception as e:
+                    self._log(f"Наблюдение за папками: {e}", "error")
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+
+def folder_settings(base_settings, folder, profiles=None):
+    """Настройки для файлов папки: базовые + профиль (имя из profiles или словарь).
+
+    Обрезка выключается всегда: базовые настройки — сохранённая конфигурация
+    окна, и диапазон последнего сеанса иначе резал бы каждый новый файл.
+    """
+    profile = folder.get("profile") or {}
+    if isinstance(profile, str):
+        if profile not in (profiles or {}):
+            raise ValueError(f"Профиль «{profile}» не найден в конфигурации")
+        profile = profiles[profile]
+    return dict(base_settings, **profile, enable_trim=False, smart_cut=False)
+
+
+def profile_from_settings(settings):
+    """Профиль папки из текущих настроек окна (без обрезки и флагов отображения)."""
+    return {k: v for k, v in settings.items() if k not in NON_PROFILE_KEYS}
+
+
+def _move_to(path, directory):
+    """Перемещение файла в папку; при совпадении имени добавляется суффикс _N."""
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    target = os.path.join(directory, stem + ext)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(directory, f"{stem}_{n}{ext}")
+        n += 1
+    shutil.move(path, target)
+    return target
+
+
+class WatchService:
+    """Папки наблюдения поверх очереди заданий.
+
+    Дописанный файл превращается в задание JobQueue с настройками профиля
+    своей папки; по завершении задания исходник перемещается в done_dir
+    (успех) или failed_dir (ошибка). Остановленные задания не трогаются —
+    файл останется в папке и будет подхвачен при следующем запуске.
+    """
+
+    def __init__(self, config, ffmpeg_path, ffprobe_path, job_queue, on_event=None, base_settings=None):
+        self.folders = {os.path.abspath(f["path"]): f for f in config.get("watch_folders", [])}
+        self.profiles = config.get("profiles", {})
+        self.base_settings = base_settings or config
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.job_queue = job_queue
+        self.on_event = on_event or (lambda event: None)
+        self.watcher = FolderWatcher(
+            list(self.folders), self._on_ready, on_event=self.on_event,
+            stable_seconds=float(config.get("watch_stable_seconds", DEFAULT_STABLE_SECONDS)),
+            interval=float(config.get("watch_interval", DEFAULT_INTERVAL)))
+
+    def _log(self, message, level='info'):
+        self.on_event({'type': 'log', 'message': message, 'level': level})
+
+    def start(self):
+        if not self.folders:
+            raise ValueError("Папки наблюдения не заданы (watch_folders в конфигурации)")
+        for path in self.folders:
+            os.makedirs(path, exist_ok=True)
+        self.watcher.start()
+
+    def stop(self, wait=True):
+        self.watcher.stop(wait)
+
+    def _dirs(self, folder_path):
+        folder = self.folders[folder_path]
+        return (folder.get("output_dir") or os.path.join(folder_path, "converted"),
+                folder.get("done_dir") or os.path.join(folder_path, "done"),
+                folder.get("failed_dir") or os.path.join(folder_path, "failed"))
+
+    def _on_ready(self, folder_path, path):
+        output_dir, done_dir, failed_dir = self._dirs(folder_path)
+        try:
+            settings = folder_settings(self.base_settings, self.folders[folder_path], self.profiles)
+            os.makedirs(output_dir, exist_ok=True)
+            output_file = default_output_path(path, output_dir)
+            source = get_media_info(self.ffprobe_path, path)
+            cmds, work_dir = build_encode_commands(settings, self.ffmpeg_path, path, output_file,
+                                                   source=source)
+        except Exception as e:
+            self._log(f"{path}: {e}", "error")
+            self._move(path, failed_dir)
+            return
+        job = Job(path, output_file, cmds[-1], passes=cmds, work_dir=work_dir)
+        if settings.get("use_target_size"):
+            job.target_size = settings["target_size"]
+        job.on_finish = lambda job: self._on_finish(job, done_dir, failed_dir)
+        self.job_queue.add(job)
+        self._log(f"Новый файл в очереди: {path}", "success")
+        if not self.job_queue.is_running():
+            self.job_queue.start()
+
+    def _on_finish(self, job, done_dir, failed_dir):
+        if job.status == Job.DONE:
+            self._move(job.input_file, done_dir)
+        elif job.status == Job.FAILED:
+            self._move(job.input_file, failed_dir)
+            try:
+                os.remove(job.output_file)
+            except OSError:
+                pass
+
+    def _move(self, path, directory):
+        try:
+            target = _move_to(path, directory)
+            self._log(f"{os.path.basename(path)} → {target}")
+        except OSError as e:
+            self._log(f"Не удалось переместить {path}: {e}", "error")
+
+
+def main(argv=None):
+    from vvc_cli import ProgressPrinter
+    parser = argparse.ArgumentParser(
+        prog="vvc_watch.py",
+        description="Наблюдение за папками из конфигурации (watch_folders) без окна.")
+    parser.add_argument('--config', default="ffmpeg_converter_config.json")
+    parser.add_argument('--ffmpeg', help="путь к ffmpeg (перекрывает конфигурацию)")
+    parser.add_argument('--ffprobe', help="путь к ffprobe")
+    parser.add_argument('-j', '--jobs', type=int, help="число одновременных процессов ffmpeg")
+    parser.add_argument('--progress', choices=['json', 'text', 'none'], default='text')
+    args = parser.parse_args(argv)
+
+    config = ConfigManager(args.config).load()
+    ffmpeg_path, ffprobe_path = resolve_ffmpeg_paths(config)
+    ffmpeg_path = args.ffmpeg or ffmpeg_path
+    ffprobe_path = args.ffprobe or ffprobe_path
+    printer = ProgressPrinter(args.progress)
+
+    def on_event(event):
+        if event['type'] == 'log':
+            printer.emit({'event': 'log', 'level': event['level'], 'message': event['message']})
+        else:
+            printer.on_event(event)
+
+    supervisor.configure(config)
+    job_queue = JobQueue(workers=args.jobs or config.get("max_workers", 1), on_event=on_event,
+                         probe_duration=lambda path: media_duration(get_media_info(ffprobe_path, path)),
+                         probe_frames=lambda path: media_frames(get_media_info(ffprobe_path, path)),
+                         history=history_from_config(config),
+                         metrics=metrics_from_config(config, on_event=on_event),
+                         farm=farm_from_config(config))
+    service = WatchService(config, ffmpeg_path, ffprobe_path, job_queue, on_event=on_event)
+    try:
+        service.start()
+    except (ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if job_queue.metrics:
+        job_queue.metrics.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        service.stop()
+        job_queue.stop()
+        return 130
+    finally:
+        if job_queue.metrics:
+            job_queue.metrics.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())